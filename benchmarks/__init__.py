@@ -0,0 +1,10 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(".."))
+
+
+__all__ = ("generate_school", "write_config")
+
+
+from .synthetic import generate_school, write_config
@@ -0,0 +1,160 @@
+"""Latency of cheap lookups while heavy endpoints are saturated, without and with admission control.
+
+A steady stream of GET /api/student/{id} runs alone, then alongside clients requesting /report/students and
+/api/student/search back to back: first with admission disabled and the heavy work on the event loop, then with the
+"heavy" class limited and its work on the thread pool. The heavy requests beyond the limit are rejected at once (503),
+and the p99 of the lookups should stay close to the baseline.
+
+Requests are sent in-process over ASGI, so the event loop is all that is shared between them.
+
+Run from the repository root: python -m benchmarks.admission --students 20000 --heavy-clients 16
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+import orjson
+
+from config import Config
+from main import create_app
+
+from .synthetic import generate_school
+
+
+async def get(app, path: str) -> int:
+	"""Sends a GET, discarding the body, and returns the status."""
+	path, _, query = path.partition("?")
+	scope = {
+		"type": "http",
+		"asgi": {"version": "3.0"},
+		"http_version": "1.1",
+		"method": "GET",
+		"scheme": "http",
+		"path": path,
+		"raw_path": path.encode(),
+		"query_string": query.encode(),
+		"root_path": "",
+		"headers": [(b"host", b"bench")],
+		"client": ("127.0.0.1", 0),
+		"server": ("bench", 80),
+	}
+	status = 0
+	requested = False
+
+	async def receive() -> dict:
+		nonlocal requested
+		if not requested:
+			requested = True
+			return {"type": "http.request", "body": b"", "more_body": False}
+		# then never disconnects, the response is read to the end
+		await asyncio.Event().wait()
+
+	async def send(message: dict):
+		nonlocal status
+		if message["type"] == "http.response.start":
+			status = message["status"]
+
+	await app(scope, receive, send)
+	return status
+
+
+async def cheap(app, student_ids: list[int], rate: float, duration: float, rng: random.Random) -> list[float]:
+	"""
+	Sends lookups at `rate` per second, each on its own task so a slow one doesn't delay the next, and returns their
+	latencies from when they were due: a busy event loop delays them before they start as well.
+	"""
+	latencies = []
+
+	async def one(path: str, due: float):
+		await get(app, path)
+		latencies.append(time.perf_counter() - due)
+
+	tasks = []
+	start = time.perf_counter()
+	for i in range(int(rate * duration)):
+		due = start + i / rate
+		await asyncio.sleep(max(0.0, due - time.perf_counter()))
+		tasks.append(asyncio.create_task(one(f"/api/student/{rng.choice(student_ids)}", due)))
+	await asyncio.gather(*tasks)
+	return latencies
+
+
+async def heavy(app, stop: asyncio.Event, rng: random.Random, results: dict[str, list]):
+	"""Requests reports and searches back to back until `stop`, pausing as asked after a rejection."""
+	while not stop.is_set():
+		path = "/report/students" if rng.random() < 0.5 else f"/api/student/search?name=student {rng.randrange(1000)}&limit=20"
+		start = time.perf_counter()
+		status = await get(app, path)
+		if status == 200:
+			results["ok"].append(time.perf_counter() - start)
+		else:
+			results["rejected"].append(status)
+			await asyncio.sleep(0.05)
+
+
+async def run(path: str, args: argparse.Namespace):
+	config = Config(path)
+	config.read()
+	app = create_app(config)
+	rng = random.Random(args.seed)
+	student_ids = list(config.school.students)
+	heavy_limits = {"heavy": {"concurrency": args.concurrency, "queue": args.queue, "timeout": 10.0}}
+
+	# warm up the search index and the cached report rows, so every phase sees the same work
+	await get(app, "/api/student/search?name=student")
+	await get(app, "/report/students")
+
+	print(f"{'phase':>24} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'heavy ok/s':>11} {'rejected/s':>11} {'heavy p50 ms':>13}")
+	for name, clients, enabled, workers in (
+		("lookups alone", 0, True, args.workers),
+		("heavy, no admission", args.heavy_clients, False, 0),
+		("heavy, admission", args.heavy_clients, True, args.workers),
+	):
+		config.admission.configure(enabled, workers, heavy_limits)
+		stop = asyncio.Event()
+		results = {"ok": [], "rejected": []}
+		tasks = [asyncio.create_task(heavy(app, stop, random.Random(rng.random()), results)) for _ in range(clients)]
+
+		start = time.perf_counter()
+		latencies = np.array(await cheap(app, student_ids, args.rate, args.duration, rng)) * 1000
+		# longer than `duration` when the lookups fall behind
+		elapsed = time.perf_counter() - start
+		stop.set()
+		await asyncio.gather(*tasks)
+
+		heavy_p50 = f"{np.median(results['ok']) * 1000:>13.0f}" if results["ok"] else f"{'-':>13}"
+		print(
+			f"{name:>24} {np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f} {latencies.max():>8.2f} "
+			f"{len(results['ok']) / elapsed:>11.1f} {len(results['rejected']) / elapsed:>11.1f} {heavy_p50}"
+		)
+
+	config.admission.shutdown()
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--students", type=int, default=20_000)
+	parser.add_argument("--heavy-clients", type=int, default=16)
+	parser.add_argument("--rate", type=float, default=200.0, help="lookups per second")
+	parser.add_argument("--duration", type=float, default=5.0, help="seconds per phase")
+	parser.add_argument("--concurrency", type=int, default=2, help="heavy requests admitted at once")
+	parser.add_argument("--queue", type=int, default=8, help="heavy requests waiting for a slot")
+	parser.add_argument("--workers", type=int, default=2, help="threads of the pool")
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "config.json")
+		with open(path, "wb") as f:
+			f.write(orjson.dumps({"school": generate_school(args.students, seed=args.seed)}))
+
+		asyncio.run(run(path, args))
+
+
+if __name__ == "__main__":
+	main()
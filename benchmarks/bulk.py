@@ -0,0 +1,89 @@
+"""Compares items/sec of the bulk enrollment and grade endpoints against one request per item, in-process over ASGI.
+
+Run from the repository root: python -m benchmarks.bulk --students 10000 --items 2000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+import orjson
+
+from config import Config
+from main import create_app
+
+from .synthetic import generate_school
+
+
+async def measure(path: str, items: int, batch: int, bulk: bool) -> dict[str, float]:
+	config = Config(path)
+	config.read()
+	app = create_app(config)
+
+	# a fresh course nobody is enrolled in yet
+	course_id = max(config.school.courses) + 1
+	enrollments = [{"course_id": course_id, "student_id": student_id} for student_id in range(1, items + 1)]
+	grades = [{"student_id": student_id, "course_code": course_id, "grades": [5, 4, 3]} for student_id in range(1, items + 1)]
+
+	results = {}
+	async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+		await client.put(f"/api/course/{course_id}", json={"course_name": "bench"})
+
+		start = time.perf_counter()
+		if bulk:
+			for i in range(0, items, batch):
+				response = await client.post("/api/course/bulk/enroll_student", json=enrollments[i : i + batch])
+				assert response.status_code == 200, response.text
+		else:
+			for item in enrollments:
+				response = await client.put(f"/api/course/{item['course_id']}/enroll_student", json={"student_id": item["student_id"]})
+				assert response.status_code == 200, response.text
+		await config.flush()
+		results["enroll"] = items / (time.perf_counter() - start)
+
+		start = time.perf_counter()
+		if bulk:
+			for i in range(0, items, batch):
+				response = await client.post("/api/student/bulk/grades", json=grades[i : i + batch])
+				assert response.status_code == 200, response.text
+		else:
+			for item in grades:
+				response = await client.patch(f"/api/student/{item['student_id']}/grades", json={"course_code": item["course_code"], "grades": item["grades"]})
+				assert response.status_code == 200, response.text
+		await config.flush()
+		results["grades"] = items / (time.perf_counter() - start)
+
+	return results
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--students", type=int, default=10_000)
+	parser.add_argument("--items", type=int, default=2_000)
+	parser.add_argument("--batch", type=int, default=1_000)
+	parser.add_argument("--background", action=argparse.BooleanOptionalAction, default=True, help="coalesce per-item writes in the background writer")
+	parser.add_argument("--journal", action=argparse.BooleanOptionalAction, default=False)
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	print(f"{'endpoint':>8} {'per-item/s':>11} {'bulk/s':>10} {'speedup':>9}")
+
+	results = {}
+	for bulk in (False, True):
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, "config.json")
+			settings = {"persistence": {"background": args.background}, "journal": {"enabled": args.journal}}
+			with open(path, "wb") as f:
+				f.write(orjson.dumps({"school": generate_school(args.students, seed=args.seed), **settings}))
+
+			results[bulk] = asyncio.run(measure(path, min(args.items, args.students), args.batch, bulk))
+
+	for endpoint in ("enroll", "grades"):
+		print(f"{endpoint:>8} {results[False][endpoint]:>11.1f} {results[True][endpoint]:>10.1f} {results[True][endpoint] / results[False][endpoint]:>8.1f}x")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,65 @@
+"""Compares two JSON results of a benchmark (written with --output) and exits with 1 if a metric regressed.
+
+A metric regressed when it got worse by more than the threshold: a time or size grew, a rate (ops/s, req/s) dropped.
+Metrics missing from either run are listed but not compared.
+
+Run from the repository root: python -m benchmarks.compare baseline.json current.json --threshold 0.1
+"""
+
+import argparse
+import sys
+
+from .results import HIGHER_IS_BETTER, read
+
+
+def change(baseline: dict, current: dict) -> float:
+	"""The relative change of a metric, positive when it got worse."""
+	before, after = baseline["value"], current["value"]
+	if not before:
+		return 0.0 if not after else float("inf")
+	relative = (after - before) / abs(before)
+	return -relative if current["unit"] in HIGHER_IS_BETTER else relative
+
+
+def main() -> int:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("baseline")
+	parser.add_argument("current")
+	parser.add_argument("--threshold", type=float, default=0.1, help="relative change tolerated, 0.1 is 10%%")
+	args = parser.parse_args()
+
+	baseline, current = read(args.baseline), read(args.current)
+	if baseline["benchmark"] != current["benchmark"]:
+		print(f"different benchmarks: {baseline['benchmark']} and {current['benchmark']}", file=sys.stderr)
+		return 2
+	for name in sorted(baseline["args"].keys() | current["args"].keys()):
+		if baseline["args"].get(name) != current["args"].get(name):
+			print(f"warning: --{name.replace('_', '-')} differs, {baseline['args'].get(name)} and {current['args'].get(name)}", file=sys.stderr)
+
+	print(f"{baseline['benchmark']}: {baseline['environment']['commit'] or '?'} ({baseline['created']}) -> {current['environment']['commit'] or '?'} ({current['created']})")
+	width = max(map(len, baseline["results"].keys() | current["results"].keys()), default=6)
+	print(f"{'metric':<{width}} {'unit':>6} {'baseline':>12} {'current':>12} {'worse':>8}")
+
+	regressions = 0
+	for name in sorted(baseline["results"].keys() | current["results"].keys()):
+		before, after = baseline["results"].get(name), current["results"].get(name)
+		if before is None or after is None:
+			metric = before or after
+			print(f"{name:<{width}} {metric['unit']:>6} {before['value'] if before else '-':>12} {after['value'] if after else '-':>12} {'':>8} {'baseline only' if after is None else 'current only'}")
+			continue
+
+		worse = change(before, after)
+		status = ""
+		if worse > args.threshold:
+			status = "REGRESSED"
+			regressions += 1
+		elif worse < -args.threshold:
+			status = "improved"
+		print(f"{name:<{width}} {after['unit']:>6} {before['value']:>12.4g} {after['value']:>12.4g} {worse:>+8.1%} {status}")
+
+	print(f"{regressions} regressions beyond {args.threshold:.0%}")
+	return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,103 @@
+"""Measures the streaming exports against pulling every student from the JSON list: time, bytes sent and peak traced memory.
+
+Run from the repository root: python -m benchmarks.export --students 100000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+
+import httpx
+import orjson
+
+from config import Config
+from main import create_app
+
+from .report import request
+from .synthetic import generate_school
+
+
+def grade_rows_by_student(body: bytes) -> dict[int, list[dict]]:
+	rows: dict[int, list[dict]] = {}
+	for line in body.splitlines():
+		row = orjson.loads(line)
+		rows.setdefault(row.pop("student_id"), []).append(row)
+	return rows
+
+
+async def check_incremental_grades(app, config: Config):
+	"""An incremental grades export applied over the previous full one must give the current full one."""
+	async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+		response = await client.get("/api/export/grades?format=ndjson")
+		before = grade_rows_by_student(response.content)
+		version = response.headers["X-Export-Version"]
+
+		# one student unenrolled from a course and one from all of them, a course and a student removed
+		school = config.school
+		first, second, removed_student, *_ = before
+		for student_id, course_codes in ((first, {row["course_code"] for row in before[first]}), (second, {before[second][0]["course_code"]})):
+			for course_code in course_codes:
+				response = await client.request("DELETE", f"/api/course/{course_code}/enroll_student", json={"student_id": student_id})
+				assert response.status_code == 200, response.text
+		school.remove_course(before[removed_student][0]["course_code"])
+		school.remove_student(removed_student)
+
+		response = await client.get(f"/api/export/grades?format=ndjson&since={version}")
+		assert response.headers["X-Export-Incremental"] == "true"
+		for student_id, rows in grade_rows_by_student(response.content).items():
+			before[student_id] = [{key: value for key, value in row.items() if key != "deleted"} for row in rows if row["course_code"] is not None]
+		after = grade_rows_by_student((await client.get("/api/export/grades?format=ndjson")).content)
+		assert {student_id: rows for student_id, rows in before.items() if rows} == after
+
+
+async def check_content_encoding(app):
+	"""Exports are gzipped only for clients accepting gzip with a q-value above 0."""
+	async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+		for accept_encoding, gzipped in (("gzip", True), ("br, *", True), ("gzip;q=0", False), ("gzip; q=0.0, br", False), ("identity", False)):
+			response = await client.get("/api/export/students", headers={"accept-encoding": accept_encoding})
+			assert (response.headers.get("content-encoding") == "gzip") == gzipped, accept_encoding
+
+
+async def run(path: str, args: argparse.Namespace):
+	config = Config(path)
+	config.read()
+	app = create_app(config)
+
+	cases = (
+		("student list", "/api/student/", {}),
+		("students csv", "/api/export/students", {}),
+		("grades csv", "/api/export/grades", {}),
+		("grades ndjson", "/api/export/grades?format=ndjson", {}),
+		("grades csv gzip", "/api/export/grades", {"accept-encoding": "gzip"}),
+	)
+	print(f"{'export':>16} {'ttfb ms':>9} {'total ms':>9} {'MiB sent':>9} {'peak MiB':>9}")
+	for name, url, headers in cases:
+		ttfb, total, size, _ = await request(app, url, trace=False, headers=headers)
+		# the list is cached once built, so memory is measured cold
+		config.response_cache.clear()
+		_, _, _, peak = await request(app, url, trace=True, headers=headers)
+		config.response_cache.clear()
+		print(f"{name:>16} {ttfb * 1e3:>9.1f} {total * 1e3:>9.1f} {size / 2**20:>9.1f} {peak / 2**20:>9.1f}")
+
+	await check_content_encoding(app)
+	await check_incremental_grades(app, config)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--students", type=int, default=100_000)
+	parser.add_argument("--courses", type=int, default=20)
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "config.json")
+		with open(path, "wb") as f:
+			f.write(orjson.dumps({"school": generate_school(args.students, courses=args.courses, seed=args.seed)}))
+
+		asyncio.run(run(path, args))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,236 @@
+"""Load test of the /ws/changes feed: many connected clients, a steady stream of writes, then a burst of them.
+
+Reports the time to connect the clients and the memory they take, the delay from a mutation to each client receiving
+its event under a steady write rate, and how a burst larger than the client queues is absorbed: clients that fall
+behind are disconnected and resume from their last version, so every one must end up at the school's version.
+
+Clients talk to the app directly over ASGI, so the app's own fan-out cost is measured, without a network in between.
+
+Run from the repository root: python -m benchmarks.feed --clients 1000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import orjson
+
+from config import Config
+from main import create_app
+
+from .synthetic import generate_school
+
+
+class Client:
+	"""A feed client over ASGI, reconnecting from its last version when the app closes it for falling behind."""
+
+	def __init__(self, app, courses: list[int] | None, published: dict[int, float]):
+		self.app = app
+		self.courses = courses
+		self.published = published
+		self.epoch = ""
+		self.version = 0
+		self.received = 0
+		self.reconnects = 0
+		self.latencies: list[float] = []
+		self.connected = asyncio.Event()
+		self.task: asyncio.Task | None = None
+
+	def start(self):
+		self.task = asyncio.create_task(self.run())
+
+	async def run(self):
+		while await self.session():
+			self.reconnects += 1
+
+	async def session(self) -> bool:
+		"""Returns whether the app closed the connection, to reconnect."""
+		query = "&".join(
+			part
+			for part in (
+				f"courses={','.join(map(str, self.courses))}" if self.courses else "",
+				f"since={self.epoch}-{self.version}" if self.epoch else "",
+			)
+			if part
+		)
+		scope = {
+			"type": "websocket",
+			"asgi": {"version": "3.0"},
+			"scheme": "ws",
+			"path": "/ws/changes",
+			"raw_path": b"/ws/changes",
+			"query_string": query.encode(),
+			"root_path": "",
+			"headers": [(b"host", b"bench")],
+			"client": ("127.0.0.1", 0),
+			"server": ("bench", 80),
+			"subprotocols": [],
+		}
+		to_app: asyncio.Queue = asyncio.Queue()
+		from_app: asyncio.Queue = asyncio.Queue()
+		to_app.put_nowait({"type": "websocket.connect"})
+		app = asyncio.create_task(self.app(scope, to_app.get, from_app.put))
+
+		try:
+			while True:
+				message = await from_app.get()
+				if message["type"] == "websocket.close":
+					to_app.put_nowait({"type": "websocket.disconnect", "code": message.get("code", 1000)})
+					return message.get("code") == 1013
+				if message["type"] != "websocket.send":
+					continue
+
+				now = time.perf_counter()
+				for event in orjson.loads(message["text"]):
+					if event["type"] in ("hello", "reset"):
+						self.epoch = event["epoch"]
+						if event["type"] == "reset" or not self.version:
+							self.version = event["version"]
+						self.connected.set()
+						continue
+					self.received += 1
+					self.version = max(self.version, event["version"])
+					if (published := self.published.get(event["version"])) is not None:
+						self.latencies.append(now - published)
+		except asyncio.CancelledError:
+			to_app.put_nowait({"type": "websocket.disconnect", "code": 1000})
+			raise
+		finally:
+			await app
+
+
+def mutate(school, student_ids: list[int], course_codes: list[int], rng: random.Random):
+	student_id = rng.choice(student_ids)
+	match rng.randrange(3):
+		case 0:
+			school.update_student(student_id, age=rng.randint(18, 40))
+		case 1:
+			school.set_student_grades(student_id, rng.choice(course_codes), [rng.randint(0, 100) for _ in range(3)])
+		case 2:
+			school.enroll_student(rng.choice(course_codes), student_id)
+
+
+async def caught_up(config: Config, clients: list[Client], unfiltered: list[Client], timeout: float = 60.0) -> float:
+	start = time.perf_counter()
+	while any(client.version < config.school.version for client in unfiltered):
+		if time.perf_counter() - start > timeout:
+			raise TimeoutError(f"{sum(client.version < config.school.version for client in unfiltered)} clients behind")
+		await asyncio.sleep(0.001)
+	# the subscribed ones get fewer events, let them drain as well
+	for _ in range(100):
+		await asyncio.sleep(0)
+	return time.perf_counter() - start
+
+
+async def check_subscription_messages(app):
+	"""Subscription messages take lists of ids or null, anything else (e.g. a string of digits) gets an error event."""
+	scope = {"type": "websocket", "path": "/ws/changes", "raw_path": b"/ws/changes", "query_string": b"", "headers": [(b"host", b"bench")], "subprotocols": []}
+	to_app: asyncio.Queue = asyncio.Queue()
+	from_app: asyncio.Queue = asyncio.Queue()
+	to_app.put_nowait({"type": "websocket.connect"})
+	task = asyncio.create_task(app(scope, to_app.get, from_app.put))
+
+	events: list[dict] = []
+
+	async def reply(subscription) -> dict:
+		to_app.put_nowait({"type": "websocket.receive", "text": orjson.dumps(subscription).decode()})
+		while not events:
+			message = await from_app.get()
+			if message["type"] == "websocket.send":
+				events.extend(event for event in orjson.loads(message["text"]) if event["type"] != "hello")
+		return events.pop(0)
+
+	for subscription in ({"students": "12"}, {"students": [1, "2"]}, {"courses": [True]}, {"courses": 3}, [1, 2]):
+		assert (await reply(subscription))["type"] == "error", subscription
+	assert await reply({"students": [12], "courses": None}) == {"type": "subscribed", "students": [12], "courses": None}
+
+	to_app.put_nowait({"type": "websocket.disconnect", "code": 1000})
+	await task
+
+
+async def run(path: str, args: argparse.Namespace):
+	config = Config(path)
+	config.read()
+	app = create_app(config)
+	rng = random.Random(args.seed)
+	school = config.school
+	await check_subscription_messages(app)
+	student_ids, course_codes = list(school.students), list(school.courses)
+	published: dict[int, float] = {}
+
+	clients = [Client(app, [rng.choice(course_codes)] if i < args.clients * args.subscribed else None, published) for i in range(args.clients)]
+	unfiltered = [client for client in clients if client.courses is None]
+
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	start = time.perf_counter()
+	for client in clients:
+		client.start()
+	for client in clients:
+		await client.connected.wait()
+	elapsed = time.perf_counter() - start
+	per_client = (tracemalloc.get_traced_memory()[0] - before) / args.clients
+	tracemalloc.stop()
+	print(f"{args.clients} clients ({len(clients) - len(unfiltered)} subscribed to one course) connected in {elapsed * 1000:.0f} ms, {per_client / 1024:.1f} KiB each")
+
+	# steady writes
+	events = int(args.rate * args.duration)
+	start = time.perf_counter()
+	for i in range(events):
+		mutate(school, student_ids, course_codes, rng)
+		published[school.version] = time.perf_counter()
+		await asyncio.sleep(max(0.0, start + (i + 1) / args.rate - time.perf_counter()))
+	await caught_up(config, clients, unfiltered)
+	latencies = np.array([latency for client in clients for latency in client.latencies]) * 1000
+	received = sum(client.received for client in clients)
+	print(
+		f"steady: {events} writes at {args.rate:.0f}/s, {received} events delivered, "
+		f"delay p50 {np.percentile(latencies, 50):.2f} ms, p99 {np.percentile(latencies, 99):.2f} ms, max {latencies.max():.2f} ms"
+	)
+
+	# a burst, e.g. an import, written without yielding to the clients
+	published.clear()
+	received = sum(client.received for client in clients)
+	start = time.perf_counter()
+	for _ in range(args.burst):
+		mutate(school, student_ids, course_codes, rng)
+	write = time.perf_counter() - start
+	drain = await caught_up(config, clients, unfiltered)
+	stats = config.feed.stats
+	print(
+		f"burst: {args.burst} writes in {write * 1000:.0f} ms, all clients at version {school.version} {drain * 1000:.0f} ms later, "
+		f"{sum(client.received for client in clients) - received} events delivered, "
+		f"{sum(client.reconnects for client in clients)} reconnects ({stats.overflows} overflows, {stats.resets} resets)"
+	)
+
+	for client in clients:
+		client.task.cancel()
+	await asyncio.gather(*(client.task for client in clients), return_exceptions=True)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--students", type=int, default=10_000)
+	parser.add_argument("--clients", type=int, default=1000)
+	parser.add_argument("--subscribed", type=float, default=0.5, help="fraction of the clients subscribed to one course only")
+	parser.add_argument("--rate", type=float, default=200.0, help="steady writes per second")
+	parser.add_argument("--duration", type=float, default=5.0)
+	parser.add_argument("--burst", type=int, default=5000)
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "config.json")
+		with open(path, "wb") as f:
+			f.write(orjson.dumps({"school": generate_school(args.students, seed=args.seed)}))
+
+		asyncio.run(run(path, args))
+
+
+if __name__ == "__main__":
+	main()
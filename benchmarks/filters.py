@@ -0,0 +1,75 @@
+"""Measures filtered student queries through the indexes against a full scan, across selectivities.
+
+Run from the repository root: python -m benchmarks.filters --sizes 10000 100000 500000
+"""
+
+import argparse
+import time
+
+from config import School
+from models import GraduateStudent
+
+from .synthetic import generate_school
+
+
+def scan(school: School, min_age=None, max_age=None, graduate=None, course_code=None, min_average=None, max_average=None) -> list[int]:
+	"""The filter as a list comprehension over every student would be written."""
+	enrolled = school.courses[course_code].enrolled_students if course_code is not None else None
+	result = []
+	for student_id, student in school.students.items():
+		if (min_age is not None and student.age < min_age) or (max_age is not None and student.age > max_age):
+			continue
+		if graduate is not None and isinstance(student, GraduateStudent) != graduate:
+			continue
+		if enrolled is not None and student_id not in enrolled:
+			continue
+		if min_average is not None or max_average is not None:
+			average = student.calculate_total_average_grade()
+			if (min_average is not None and average < min_average) or (max_average is not None and average > max_average):
+				continue
+		result.append(student_id)
+	return sorted(result)
+
+
+def timed(function, repeat: int) -> float:
+	best = float("inf")
+	for _ in range(repeat):
+		start = time.perf_counter()
+		function()
+		best = min(best, time.perf_counter() - start)
+	return best
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+	parser.add_argument("--courses", type=int, default=20)
+	parser.add_argument("--repeat", type=int, default=5)
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	print(f"{'students':>10} {'query':>28} {'matches':>9} {'index ms':>9} {'scan ms':>9} {'speedup':>8}")
+	for size in args.sizes:
+		school = School(**generate_school(size, courses=args.courses, graduates=0.1, seed=args.seed))
+		course_code = next(iter(school.courses))
+		queries = {
+			"age = 18": {"min_age": 18, "max_age": 18},
+			"age 18-25": {"min_age": 18, "max_age": 25},
+			"graduate": {"graduate": True},
+			"course": {"course_code": course_code},
+			"course, graduate": {"course_code": course_code, "graduate": True},
+			"average >= 3.6": {"min_average": 3.6},
+			"age 18-25, average >= 3.6": {"min_age": 18, "max_age": 25, "min_average": 3.6},
+		}
+		school.filter_students(min_age=0, min_average=0)  # builds the indexes
+
+		for name, filters in queries.items():
+			matches = school.filter_students(**filters)
+			assert matches == scan(school, **filters), name
+			indexed = timed(lambda school=school, filters=filters: school.filter_students(**filters), args.repeat)
+			scanned = timed(lambda school=school, filters=filters: scan(school, **filters), args.repeat)
+			print(f"{size:>10} {name:>28} {len(matches):>9} {indexed * 1e3:>9.2f} {scanned * 1e3:>9.2f} {scanned / indexed:>7.1f}x")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,86 @@
+"""Compares the stored Student grade aggregates against recomputing them over every grade list.
+
+Run from the repository root: python -m benchmarks.grades --courses 10 100 --grades 20 500
+"""
+
+import argparse
+import random
+import timeit
+
+from config.school import School
+from models import GraduateStudent, Student
+
+
+def recompute_course_average(student: Student, course_id: int) -> float:
+	try:
+		grades = student.grades.get(course_id, [])
+		return round(sum(grades) / len(grades), 2)
+	except ZeroDivisionError:
+		return 0.0
+
+
+def recompute_total_average(student: Student) -> float:
+	try:
+		return round(sum(sum(grades) for grades in student.grades.values()) / sum(len(grades) for grades in student.grades.values()), 2)
+	except ZeroDivisionError:
+		return 0.0
+
+
+def check_graduate_dump():
+	"""Reading the aggregates must not change how a school is serialized, e.g. turn a graduate into a plain student."""
+	graduate = GraduateStudent(student_id=1, name="bench", age=24, grades={0: [4, 5]}, thesis_topic="bench")
+	school = School(students={1: graduate})
+	dumped = school.model_dump()
+	assert graduate.calculate_total_average_grade() == 4.5
+	assert school.model_dump() == dumped
+	assert dumped["students"][1]["thesis_topic"] == "bench"
+	assert isinstance(School.model_validate(dumped).students[1], GraduateStudent)
+
+
+def check_read_only_grades():
+	"""Course grades read from a student are a copy, mutating one must fail rather than silently change nothing."""
+	student = Student(student_id=1, name="bench", age=20, grades={0: [4, 5]})
+	for mutate in (lambda grades: grades.append(3), lambda grades: grades.__setitem__(0, 1), lambda grades: grades.__iadd__(grades)):
+		try:
+			mutate(student.grades[0])
+		except TypeError:
+			pass
+		else:
+			raise AssertionError("course grades read from PackedGrades were mutated")
+	assert student.grades == {0: [4, 5]}
+	assert student.verify_aggregates()
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--courses", type=int, nargs="+", default=[10, 100])
+	parser.add_argument("--grades", type=int, nargs="+", default=[20, 500])
+	parser.add_argument("--number", type=int, default=10_000)
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	check_graduate_dump()
+	check_read_only_grades()
+
+	rng = random.Random(args.seed)
+
+	print(f"{'courses':>8} {'grades':>7} {'recompute us':>13} {'stored us':>10} {'speedup':>9}")
+
+	for courses in args.courses:
+		for grades in args.grades:
+			student = Student(student_id=1, name="bench", age=20, grades={course_id: [rng.randint(1, 5) for _ in range(grades)] for course_id in range(courses)})
+
+			# one grade overwrite per iteration keeps the update cost in the measurement
+			student.set_course_grades(0, [rng.randint(1, 5) for _ in range(grades)])
+			assert student.verify_aggregates()
+			assert student.calculate_total_average_grade() == recompute_total_average(student)
+			assert all(student.calculate_course_average_grades(course_id) == recompute_course_average(student, course_id) for course_id in range(courses))
+
+			recompute = timeit.timeit(lambda student=student: (recompute_total_average(student), recompute_course_average(student, 0)), number=args.number) / args.number
+			stored = timeit.timeit(lambda student=student: (student.calculate_total_average_grade(), student.calculate_course_average_grades(0)), number=args.number) / args.number
+
+			print(f"{courses:>8} {grades:>7} {recompute * 1e6:>13.2f} {stored * 1e6:>10.2f} {recompute / stored:>8.1f}x")
+
+
+if __name__ == "__main__":
+	main()
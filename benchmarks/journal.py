@@ -0,0 +1,63 @@
+"""Compares write throughput of full snapshot rewrites against the append-only journal.
+
+Run from the repository root: python -m benchmarks.journal --sizes 1000 10000 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import orjson
+
+from config import Config
+
+from .synthetic import generate_school
+
+
+def measure(path: str, journal: bool, duration: float, seed: int) -> float:
+	config = Config(path)
+	config.read()
+	config.settings.journal.enabled = journal
+
+	school = config.school
+	rng = random.Random(seed)
+	student_ids = list(school.students.keys())
+
+	writes = 0
+	start = time.perf_counter()
+	while (elapsed := time.perf_counter() - start) < duration or writes == 0:
+		student = school.students[rng.choice(student_ids)]
+		for course_code in student.grades:
+			school.set_student_grades(student.student_id, course_code, [rng.randint(1, 5) for _ in range(5)])
+			break
+		config.save()
+		writes += 1
+
+	return writes / elapsed
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+	parser.add_argument("--duration", type=float, default=5.0, help="seconds spent writing per case")
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	print(f"{'students':>10} {'rewrite w/s':>14} {'journal w/s':>14} {'speedup':>9}")
+
+	for size in args.sizes:
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, "config.json")
+			with open(path, "wb") as f:
+				f.write(orjson.dumps({"school": generate_school(size, seed=args.seed), "journal": {"compact_interval": 1e9}}))
+
+			rewrite = measure(path, False, args.duration, args.seed)
+			journal = measure(path, True, args.duration, args.seed)
+
+		print(f"{size:>10} {rewrite:>14.1f} {journal:>14.1f} {journal / rewrite:>8.1f}x")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,211 @@
+"""Replays a mixed workload of the app's routes from a JSONL scenario file in-process over ASGI.
+
+Every line of the scenario is a request template, picked at random in proportion to its weight:
+
+	{"name": "student patch", "weight": 12, "method": "PATCH", "path": "/api/student/{student_id}", "json": {"student_age": "{age}"}}
+
+with optional "headers" as well. Placeholders in the path, headers and body take a seeded random value per request, the
+same one everywhere in it: {student_id} and {course_code} of the synthetic school, {enrolled_course} (a course the
+student is enrolled in), {new_student_id} (not taken yet), {age}, {grade} and {n} (0 to 999). A body string that is
+a placeholder alone is replaced by the number itself.
+
+--clients send requests back to back for --duration seconds. Latencies, throughput and statuses are reported per
+template; the run fails on any 5xx other than the admission control's 503.
+
+Run from the repository root: python -m benchmarks.load --scenario benchmarks/scenarios/mixed.jsonl --output load.json
+"""
+
+import argparse
+import asyncio
+import collections
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+
+import httpx
+import numpy as np
+import orjson
+
+from config import Config
+from main import create_app
+
+from . import results
+from .synthetic import add_arguments, from_arguments, write_config
+
+SCENARIO = os.path.join(os.path.dirname(__file__), "scenarios", "mixed.jsonl")
+
+
+@dataclass()
+class Template:
+	name: str
+	method: str
+	path: str
+	weight: float = 1.0
+	headers: dict[str, str] = field(default_factory=dict)
+	json: object = None
+
+
+def read_scenario(path: str) -> list[Template]:
+	templates = []
+	with open(path, "rb") as f:
+		for number, line in enumerate(f, 1):
+			if not line.strip():
+				continue
+			try:
+				templates.append(Template(**orjson.loads(line)))
+			except (orjson.JSONDecodeError, TypeError) as e:
+				raise ValueError(f"{path}:{number}: {e}") from None
+	if not templates:
+		raise ValueError(f"{path}: no requests")
+	return templates
+
+
+class Values(dict):
+	"""The placeholder values of one request, drawn when first used."""
+
+	def __init__(self, workload: "Workload"):
+		super().__init__()
+		self.workload = workload
+
+	def __missing__(self, name: str) -> int:
+		value = self[name] = self.workload.draw(name, self)
+		return value
+
+
+class Workload:
+	def __init__(self, config: Config, templates: list[Template], rng: random.Random):
+		self.config = config
+		self.templates = templates
+		self.weights = list(itertools.accumulate(template.weight for template in templates))
+		self.rng = rng
+		school = config.school
+		self.student_ids = list(school.students)
+		self.course_codes = list(school.courses)
+		self.new_ids = itertools.count(max(self.student_ids, default=0) + 1)
+
+	def draw(self, name: str, values: Values) -> int:
+		rng = self.rng
+		match name:
+			case "student_id":
+				return rng.choice(self.student_ids)
+			case "course_code":
+				return rng.choice(self.course_codes)
+			case "enrolled_course":
+				courses = self.config.school.get_student_courses(values["student_id"])
+				return rng.choice(courses).course_code if courses else rng.choice(self.course_codes)
+			case "new_student_id":
+				return next(self.new_ids)
+			case "age":
+				return rng.randint(15, 30)
+			case "grade":
+				return rng.randint(1, 5)
+			case "n":
+				return rng.randrange(1000)
+		raise KeyError(f"unknown placeholder {{{name}}}")
+
+	def fill(self, value, values: Values):
+		if isinstance(value, str):
+			if value.startswith("{") and value.endswith("}") and value[1:-1].isidentifier():
+				return values[value[1:-1]]
+			return value.format_map(values)
+		if isinstance(value, list):
+			return [self.fill(item, values) for item in value]
+		if isinstance(value, dict):
+			return {key: self.fill(item, values) for key, item in value.items()}
+		return value
+
+	def next(self) -> tuple[Template, dict]:
+		template = self.rng.choices(self.templates, cum_weights=self.weights)[0]
+		values = Values(self)
+		request = {"method": template.method, "url": template.path.format_map(values), "headers": {key: value.format_map(values) for key, value in template.headers.items()}}
+		if template.json is not None:
+			request["json"] = self.fill(template.json, values)
+		return template, request
+
+
+async def client(http: httpx.AsyncClient, workload: Workload, stop: asyncio.Event, latencies: dict[str, list[float]], statuses: dict[str, collections.Counter]):
+	while not stop.is_set():
+		template, request = workload.next()
+		start = time.perf_counter()
+		response = await http.request(**request)
+		latencies[template.name].append(time.perf_counter() - start)
+		statuses[template.name][response.status_code] += 1
+		# in-process requests may complete without ever suspending, so give the other clients a turn
+		await asyncio.sleep(0)
+
+
+async def run(path: str, args: argparse.Namespace) -> tuple[dict[str, dict], int]:
+	config = Config(path)
+	config.read()
+	app = create_app(config)
+	workload = Workload(config, read_scenario(args.scenario), random.Random(args.seed))
+	latencies = collections.defaultdict(list)
+	statuses = collections.defaultdict(collections.Counter)
+
+	async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load", timeout=None) as http:
+		# the indexes and caches built on first use, so the first requests don't pay for them
+		for warm_up in ("/api/student/?min_age=0&min_average=0&limit=1", "/api/student/top?k=1", "/api/course/stats", "/api/student/search?name=student"):
+			await http.get(warm_up)
+
+		stop = asyncio.Event()
+		start = time.perf_counter()
+		tasks = [asyncio.create_task(client(http, workload, stop, latencies, statuses)) for _ in range(args.clients)]
+		await asyncio.sleep(args.duration)
+		stop.set()
+		await asyncio.gather(*tasks)
+		elapsed = time.perf_counter() - start
+
+	await config.flush()
+	config.admission.shutdown()
+
+	table = sys.stderr if args.output == "-" else sys.stdout
+	measured = {}
+	failures = 0
+	total = sum(map(len, latencies.values()))
+	measured["total.throughput"] = results.metric(round(total / elapsed, 1), "req/s")
+	print(f"{total} requests from {args.clients} clients in {elapsed:.1f} s, {total / elapsed:.0f} req/s", file=table)
+	print(f"{'request':<24} {'count':>7} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}  statuses", file=table)
+	for template in workload.templates:
+		name = template.name
+		if not latencies[name]:
+			continue
+		times = np.array(latencies[name]) * 1e3
+		p50, p99 = np.percentile(times, [50, 99])
+		counts = statuses[name]
+		failed = sum(count for status, count in counts.items() if status >= 500 and status != 503)
+		failures += failed
+		measured[f"{name}.throughput"] = results.metric(round(len(times) / elapsed, 1), "req/s")
+		measured[f"{name}.p50"] = results.metric(round(float(p50), 3), "ms")
+		measured[f"{name}.p99"] = results.metric(round(float(p99), 3), "ms")
+		measured[f"{name}.failures"] = results.metric(failed, "count")
+		print(f"{name:<24} {len(times):>7} {len(times) / elapsed:>7.1f} {p50:>8.2f} {p99:>8.2f} {times.max():>8.2f}  {dict(sorted(counts.items()))}", file=table)
+
+	return measured, failures
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	add_arguments(parser)
+	parser.add_argument("--scenario", default=SCENARIO, help="JSONL file of request templates")
+	parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+	parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+	parser.add_argument("--output", help='write the results as JSON to this file, "-" for stdout')
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "config.json")
+		write_config(path, from_arguments(args), persistence={"fsync": False})
+		measured, failures = asyncio.run(run(path, args))
+
+	results.write(args.output, "load", args, measured)
+	if failures:
+		print(f"{failures} server errors", file=sys.stderr)
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,69 @@
+"""Compares the memory of students with grades packed in arrays against grades as lists of boxed ints.
+
+Run from the repository root: python -m benchmarks.memory --students 100000 --courses 10 --grades 20
+"""
+
+import argparse
+import multiprocessing
+import os
+import tracemalloc
+
+import pydantic
+
+from models import Student
+
+from .synthetic import generate_school
+
+
+class ListStudent(Student):
+	"""The previous representation, one list of ints per course."""
+
+	grades: dict[int, list[int]] = pydantic.Field(default_factory=dict)
+
+
+def rss() -> int:
+	with open("/proc/self/statm") as f:
+		return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def measure(model: type[Student], students: dict, results: multiprocessing.Queue):
+	adapter = pydantic.TypeAdapter(dict[int, model])
+
+	before = rss()
+	tracemalloc.start()
+	loaded = adapter.validate_python(students)
+	traced, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	results.put((traced, rss() - before, len(loaded)))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--students", type=int, default=100_000)
+	parser.add_argument("--courses", type=int, default=10)
+	parser.add_argument("--grades", type=int, default=20)
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	students = generate_school(args.students, courses=args.courses, enrollments=args.courses, grades=args.grades, seed=args.seed)["students"]
+	grades = args.students * args.courses * args.grades
+
+	# every representation is loaded in a fresh fork of this process, so their RSS doesn't mix
+	context = multiprocessing.get_context("fork")
+	results = context.Queue()
+
+	print(f"{args.students} students x {args.courses} courses x {args.grades} grades = {grades} grades")
+	print(f"{'grades':>8} {'traced MiB':>11} {'RSS MiB':>9} {'bytes/grade':>12}")
+
+	for name, model in (("list", ListStudent), ("array", Student)):
+		process = context.Process(target=measure, args=(model, students, results))
+		process.start()
+		traced, resident, _ = results.get()
+		process.join()
+
+		print(f"{name:>8} {traced / 2**20:>11.1f} {resident / 2**20:>9.1f} {traced / grades:>12.2f}")
+
+
+if __name__ == "__main__":
+	main()
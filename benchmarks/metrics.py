@@ -0,0 +1,95 @@
+"""Measures the cost of the request metrics: latency of cheap requests with and without them, and of recording alone.
+
+Requests are sent in-process over ASGI, so the app's own time is all that is measured and the overhead shows in full.
+
+Run from the repository root: python -m benchmarks.metrics --requests 20000
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import numpy as np
+import orjson
+
+from config import Config
+from main import create_app
+from util.metrics import Metrics
+
+from .synthetic import generate_school
+
+
+async def get(app, path: str):
+	scope = {
+		"type": "http",
+		"asgi": {"version": "3.0"},
+		"http_version": "1.1",
+		"method": "GET",
+		"scheme": "http",
+		"path": path,
+		"raw_path": path.encode(),
+		"query_string": b"",
+		"root_path": "",
+		"headers": [(b"host", b"bench")],
+		"client": ("127.0.0.1", 0),
+		"server": ("bench", 80),
+	}
+
+	async def receive() -> dict:
+		return {"type": "http.request", "body": b"", "more_body": False}
+
+	async def send(message: dict):
+		pass
+
+	await app(scope, receive, send)
+
+
+async def run(path: str, args: argparse.Namespace):
+	config = Config(path)
+	config.read()
+	app = create_app(config)
+	student_ids = list(config.school.students)[:100]
+
+	print(f"{'route':>24} {'off µs':>8} {'on µs':>8} {'overhead µs':>12} {'overhead':>9}")
+	for name, urls in (("/api/student/{id}", [f"/api/student/{student_id}" for student_id in student_ids]), ("/api/course/", ["/api/course/"])):
+		timings = {False: [], True: []}
+		# alternating rounds, so drift (e.g. the cache filling up) hits both alike
+		for round in range(args.rounds * 2):
+			enabled = round % 2 == 1
+			config.metrics.enabled = enabled
+			start = time.perf_counter()
+			for i in range(args.requests // args.rounds):
+				await get(app, urls[i % len(urls)])
+			timings[enabled].append((time.perf_counter() - start) / (args.requests // args.rounds))
+
+		off, on = np.median(timings[False]) * 1e6, np.median(timings[True]) * 1e6
+		print(f"{name:>24} {off:>8.1f} {on:>8.1f} {on - off:>12.2f} {(on - off) / off:>8.1%}")
+
+	metrics = Metrics()
+	histogram = metrics.histogram("bench_seconds", "", ("route",)).labels("/")
+	start = time.perf_counter()
+	for i in range(args.requests * 10):
+		histogram.observe(i * 1e-6)
+	print(f"histogram observe: {(time.perf_counter() - start) / (args.requests * 10) * 1e9:.0f} ns")
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--students", type=int, default=10_000)
+	parser.add_argument("--requests", type=int, default=20_000)
+	parser.add_argument("--rounds", type=int, default=10)
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "config.json")
+		with open(path, "wb") as f:
+			f.write(orjson.dumps({"school": generate_school(args.students, seed=args.seed)}))
+
+		asyncio.run(run(path, args))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,137 @@
+"""Micro-benchmarks of the School and Student methods and of Config.read/save on a synthetic school.
+
+Each is timed with timeit, as many calls as take ~0.2 s, and the fastest of --repeat rounds is reported per call.
+Writes go through a school loaded by Config, so its listeners (caches, the change feed) are part of their cost.
+
+Run from the repository root: python -m benchmarks.micro --students 10000 --output micro.json
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import timeit
+from collections.abc import Callable
+
+from config import Config
+from models import Student
+
+from . import results
+from .synthetic import add_arguments, from_arguments, write_config
+
+
+def school_benchmarks(config: Config, rng: random.Random) -> dict[str, Callable[[], object]]:
+	school = config.school
+	student_ids, course_codes = list(school.students), list(school.courses)
+	enrolled = {student_id: [course.course_code for course in school.get_student_courses(student_id)] for student_id in student_ids}
+	with_courses = [student_id for student_id in student_ids if enrolled[student_id]]
+	new_ids = itertools.count(max(student_ids, default=0) + 1)
+	ages = itertools.cycle(range(15, 31))
+
+	# the indexes and caches built on first use, which the timings below reuse as the app does
+	school.filter_students(min_age=0, min_average=0)
+	school.top_students(1)
+	school.all_course_stats()
+	school.search_student_ids("student")
+
+	def enroll_unenroll():
+		student_id, course_code = rng.choice(student_ids), rng.choice(course_codes)
+		if course_code in enrolled[student_id]:
+			return
+		school.enroll_student(course_code, student_id)
+		school.unenroll_student(course_code, student_id)
+
+	def add_remove():
+		student_id = next(new_ids)
+		school.add_student(Student(student_id=student_id, name=f"student {student_id}", age=20, grades={}))
+		school.remove_student(student_id)
+
+	def grades():
+		student_id = rng.choice(with_courses)
+		school.set_student_grades(student_id, rng.choice(enrolled[student_id]), [rng.randint(1, 5) for _ in range(5)])
+
+	def snapshot():
+		# a snapshot is shared until the next write, so write first
+		school.update_student(rng.choice(student_ids), age=next(ages))
+		school.snapshot()
+
+	return {
+		"school.get_student_courses": lambda: school.get_student_courses(rng.choice(student_ids)),
+		"school.page_students(limit=100)": lambda: school.page_students(rng.choice(student_ids), 100),
+		"school.filter_students(age)": lambda: school.filter_students(min_age=18, max_age=19),
+		"school.filter_students(course, average)": lambda: school.filter_students(course_code=rng.choice(course_codes), min_average=4.5),
+		"school.top_students(10)": lambda: school.top_students(10, rng.randrange(100)),
+		"school.course_stats": lambda: school.course_stats(rng.choice(course_codes)),
+		"school.all_course_stats": school.all_course_stats,
+		"school.search_students": lambda: school.search_students(f"student {rng.randrange(1000)}"),
+		"school.update_student": lambda: school.update_student(rng.choice(student_ids), name=f"renamed {rng.randrange(1000)}", age=next(ages)),
+		"school.set_student_grades": grades,
+		"school.enroll_student+unenroll_student": enroll_unenroll,
+		"school.add_student+remove_student": add_remove,
+		"school.snapshot (after a write)": snapshot,
+	}
+
+
+def student_benchmarks(config: Config, rng: random.Random) -> dict[str, Callable[[], object]]:
+	students = [student for student in config.school.students.values() if student.grades][:1000]
+	raw = [student.model_dump(mode="json") for student in students]
+	# a copy, grades overwritten on it stay out of the school
+	student = Student.model_validate(raw[0])
+	course_code = next(iter(student.grades))
+
+	return {
+		"student.calculate_total_average_grade": lambda: rng.choice(students).calculate_total_average_grade(),
+		"student.calculate_course_average_grades": lambda: student.calculate_course_average_grades(course_code),
+		"student.set_course_grades": lambda: student.set_course_grades(course_code, [rng.randint(1, 5) for _ in range(5)]),
+		"student.model_dump": lambda: rng.choice(students).model_dump(mode="json"),
+		"student.model_validate": lambda: Student.model_validate(rng.choice(raw)),
+		"student.from_trusted": lambda: Student.from_trusted(rng.choice(raw)),
+	}
+
+
+def config_benchmarks(path: str) -> dict[str, Callable[[], object]]:
+	config = Config(path)
+	config.read()
+	return {
+		"config.read": lambda: Config(path).read(),
+		"config.save": config.save,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	add_arguments(parser)
+	parser.add_argument("--repeat", type=int, default=5, help="rounds of each benchmark, the fastest is reported")
+	parser.add_argument("--filter", default="", help="only the benchmarks whose name contains this")
+	parser.add_argument("--output", help='write the results as JSON to this file, "-" for stdout')
+	args = parser.parse_args()
+
+	measured = {}
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "config.json")
+		write_config(path, from_arguments(args), persistence={"fsync": False})
+
+		config = Config(path)
+		config.read()
+		rng = random.Random(args.seed)
+		benchmarks = {**config_benchmarks(path), **student_benchmarks(config, rng), **school_benchmarks(config, rng)}
+
+		# the table goes to stderr when the JSON goes to stdout
+		table = sys.stderr if args.output == "-" else sys.stdout
+		print(f"{'benchmark':<40} {'us per call':>12} {'calls':>8}", file=table)
+		for name, function in benchmarks.items():
+			if args.filter not in name:
+				continue
+			timer = timeit.Timer(function)
+			number, _ = timer.autorange()
+			per_call = min(timer.repeat(args.repeat, number)) / number
+			measured[name] = results.metric(round(per_call * 1e6, 3), "us")
+			print(f"{name:<40} {per_call * 1e6:>12.2f} {number:>8}", file=table)
+
+	results.write(args.output, "micro", args, measured)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,112 @@
+"""Measures time to first byte, total time and peak traced memory of the HTML report pages, cold and with cached rows.
+
+The app is called directly over ASGI (httpx's ASGI transport buffers whole responses), discarding the body as it is sent.
+
+Run from the repository root: python -m benchmarks.report --students 100000
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+import orjson
+
+from config import Config
+from main import create_app
+
+from .synthetic import generate_school
+
+
+async def request(app, path: str, trace: bool, headers: dict[str, str] | None = None) -> tuple[float, float, int, int]:
+	"""Returns time to first byte, total time, body size and, if `trace`, peak traced memory of one GET."""
+	path, _, query = path.partition("?")
+	scope = {
+		"type": "http",
+		"asgi": {"version": "3.0"},
+		"http_version": "1.1",
+		"method": "GET",
+		"scheme": "http",
+		"path": path,
+		"raw_path": path.encode(),
+		"query_string": query.encode(),
+		"root_path": "",
+		"headers": [(b"host", b"bench"), *((name.encode(), value.encode()) for name, value in (headers or {}).items())],
+		"client": ("127.0.0.1", 0),
+		"server": ("bench", 80),
+	}
+	first_byte = None
+	size = 0
+	received = False
+	done = asyncio.Event()
+
+	async def receive() -> dict:
+		nonlocal received
+		if not received:
+			received = True
+			return {"type": "http.request", "body": b"", "more_body": False}
+		# streaming responses listen for a disconnect while sending
+		await done.wait()
+		return {"type": "http.disconnect"}
+
+	async def send(message: dict):
+		nonlocal first_byte, size
+		if message["type"] == "http.response.body" and message.get("body"):
+			if first_byte is None:
+				first_byte = time.perf_counter()
+			size += len(message["body"])
+
+	gc.collect()
+	if trace:
+		tracemalloc.start()
+	start = time.perf_counter()
+	await app(scope, receive, send)
+	end = time.perf_counter()
+	done.set()
+	peak = 0
+	if trace:
+		_, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+
+	return (first_byte or end) - start, end - start, size, peak
+
+
+async def run(path: str, args: argparse.Namespace):
+	config = Config(path)
+	config.read()
+	app = create_app(config)
+	course_code = next(iter(config.school.courses))
+
+	print(f"{'page':>16} {'run':>6} {'ttfb ms':>9} {'total ms':>9} {'MiB sent':>9} {'peak MiB':>9}")
+	for page, url in (("students", "/report/students"), ("course", f"/report/course/{course_code}/grades")):
+		for run in ("cold", "cached"):
+			# tracing slows everything down, so memory is measured by a second request
+			if run == "cold":
+				config.fragment_cache.clear()
+			ttfb, total, size, _ = await request(app, url, trace=False)
+			if run == "cold":
+				config.fragment_cache.clear()
+			_, _, _, peak = await request(app, url, trace=True)
+			print(f"{page:>16} {run:>6} {ttfb * 1e3:>9.1f} {total * 1e3:>9.1f} {size / 2**20:>9.1f} {peak / 2**20:>9.1f}")
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--students", type=int, default=100_000)
+	parser.add_argument("--courses", type=int, default=20)
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "config.json")
+		with open(path, "wb") as f:
+			f.write(orjson.dumps({"school": generate_school(args.students, courses=args.courses, seed=args.seed)}))
+
+		asyncio.run(run(path, args))
+
+
+if __name__ == "__main__":
+	main()
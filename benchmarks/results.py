@@ -0,0 +1,66 @@
+"""Machine-readable benchmark results, compared between runs by `python -m benchmarks.compare`."""
+
+import argparse
+import datetime
+import os
+import platform
+import subprocess
+import sys
+
+import orjson
+
+# units where more is better, for every other one (times, sizes) less is
+HIGHER_IS_BETTER = {"ops/s", "req/s"}
+
+
+def _commit() -> str | None:
+	try:
+		return subprocess.run(("git", "rev-parse", "--short", "HEAD"), capture_output=True, text=True, check=True, timeout=10).stdout.strip() or None
+	except (OSError, subprocess.SubprocessError):
+		return None
+
+
+def environment() -> dict:
+	return {
+		"python": platform.python_version(),
+		"implementation": platform.python_implementation(),
+		"platform": platform.platform(),
+		"cpus": os.cpu_count(),
+		"commit": _commit(),
+	}
+
+
+def metric(value: float, unit: str) -> dict:
+	return {"value": value, "unit": unit}
+
+
+def dump(benchmark: str, args: argparse.Namespace, results: dict[str, dict]) -> bytes:
+	"""The results of a run, `{name: metric(...)}`, with its arguments and environment."""
+	return orjson.dumps(
+		{
+			"benchmark": benchmark,
+			"created": datetime.datetime.now(datetime.UTC).isoformat(timespec="seconds"),
+			"environment": environment(),
+			"args": {name: value for name, value in vars(args).items() if name != "output"},
+			"results": results,
+		},
+		option=orjson.OPT_INDENT_2,
+	)
+
+
+def write(path: str | None, benchmark: str, args: argparse.Namespace, results: dict[str, dict]):
+	"""Writes the results to `path`, "-" for stdout, nothing if None."""
+	if path is None:
+		return
+	data = dump(benchmark, args, results)
+	if path == "-":
+		sys.stdout.buffer.write(data + b"\n")
+		sys.stdout.flush()
+		return
+	with open(path, "wb") as f:
+		f.write(data)
+
+
+def read(path: str) -> dict:
+	with open(path, "rb") as f:
+		return orjson.loads(f.read())
@@ -0,0 +1,70 @@
+"""Measures /api/student/search latency percentiles of the cached index against rebuilding the choices per query.
+
+Run from the repository root: python -m benchmarks.search --sizes 10000 100000 500000
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+import rapidfuzz
+
+from config import School
+
+from .synthetic import generate_school
+
+FIRST_NAMES = ("ivan", "alisa", "maria", "timur", "aigerim", "daniyar", "sofia", "arman", "elena", "nursultan")
+
+
+def rebuild_search(school: School, query: str) -> list[int]:
+	names = [fuzz[0] for fuzz in rapidfuzz.process.extract(query, choices=[student.name for student in school.students.values()], scorer=rapidfuzz.fuzz.partial_token_set_ratio, score_cutoff=30)]
+	return [student.student_id for student in school.students.values() if student.name in names]
+
+
+def percentiles(timings: list[float]) -> str:
+	p50, p99 = np.percentile(np.array(timings) * 1e3, [50, 99])
+	return f"{p50:>8.2f} {p99:>8.2f}"
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+	parser.add_argument("--queries", type=int, default=50)
+	parser.add_argument("--typos", type=float, default=0.2, help="share of queries with a typo, which have to be scored against every name")
+	parser.add_argument("--baseline", action=argparse.BooleanOptionalAction, default=True, help="also time the per-query rebuild")
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+
+	print(f"{'students':>10} {'index p50':>9} {'p99 ms':>8} {'rebuild p50':>11} {'p99 ms':>8}")
+
+	for size in args.sizes:
+		raw = generate_school(size, seed=args.seed)
+		for student in raw["students"].values():
+			student["name"] = f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)}ova {student['student_id']}"
+		school = School(**raw)
+
+		queries = [rng.choice(FIRST_NAMES)[: rng.randint(3, 6)] for _ in range(args.queries)]
+		for i in rng.sample(range(args.queries), int(args.queries * args.typos)):
+			queries[i] = f"{queries[i][:-1]}q{queries[i][-1]}"
+		school.search_students(queries[0])  # builds the index
+
+		indexed = []
+		for query in queries:
+			start = time.perf_counter()
+			school.search_students(query, limit=10)
+			indexed.append(time.perf_counter() - start)
+
+		rebuilt = []
+		for query in queries[: max(1, args.queries // 10)] if args.baseline else ():
+			start = time.perf_counter()
+			rebuild_search(school, query)
+			rebuilt.append(time.perf_counter() - start)
+
+		print(f"{size:>10} {percentiles(indexed)} {percentiles(rebuilt) if rebuilt else '':>20}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,65 @@
+"""Compares size and encode/decode timings of the snapshot formats: indented JSON, compact JSON and msgpack.
+
+Run from the repository root: python -m benchmarks.snapshot --students 1000000
+"""
+
+import argparse
+import gc
+import os
+import tempfile
+import time
+
+from config.persistence import atomic_write
+from config.snapshot import FORMATS, decode, encode
+
+from .synthetic import generate_school
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--students", type=int, default=1_000_000)
+	parser.add_argument("--courses", type=int, default=20)
+	parser.add_argument("--enrollments", type=int, default=3)
+	parser.add_argument("--grades", type=int, default=5)
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	document = {"school": generate_school(args.students, courses=args.courses, enrollments=args.enrollments, grades=args.grades, seed=args.seed)}
+
+	print(f"{args.students} students, {args.enrollments} courses x {args.grades} grades each")
+	print(f"{'format':>8} {'MiB':>8} {'encode s':>9} {'write s':>8} {'read s':>7} {'decode s':>9}")
+
+	# collections of the large document would otherwise land in random measurements
+	gc.disable()
+	with tempfile.TemporaryDirectory() as directory:
+		for format in FORMATS:
+			path = os.path.join(directory, f"config.{format}")
+
+			start = time.perf_counter()
+			data = encode(document, format)
+			encoded = time.perf_counter() - start
+
+			start = time.perf_counter()
+			atomic_write(path, data, fsync=True)
+			written = time.perf_counter() - start
+			size = len(data)
+			del data
+
+			start = time.perf_counter()
+			with open(path, "rb") as f:
+				data = f.read()
+			read = time.perf_counter() - start
+
+			start = time.perf_counter()
+			decoded = decode(data)
+			decoding = time.perf_counter() - start
+
+			assert decoded == document
+			del data, decoded
+
+			print(f"{format:>8} {size / 2**20:>8.1f} {encoded:>9.3f} {written:>8.3f} {read:>7.3f} {decoding:>9.3f}")
+	gc.enable()
+
+
+if __name__ == "__main__":
+	main()
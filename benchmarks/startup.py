@@ -0,0 +1,98 @@
+"""Measures Config.read startup time with full validation against the trusted load, eager and lazy.
+
+Run from the repository root: python -m benchmarks.startup --sizes 10000 100000 500000
+"""
+
+import argparse
+import gc
+import os
+import random
+import tempfile
+import time
+
+import orjson
+
+from config import Config
+
+from .synthetic import generate_school
+
+MODES = {
+	"validate": {"trusted": False, "lazy": False},
+	"trusted": {"trusted": True, "lazy": False},
+	"lazy": {"trusted": True, "lazy": True},
+}
+
+
+def write_config(path: str, size: int, args: argparse.Namespace):
+	school = generate_school(size, courses=args.courses, enrollments=args.enrollments, grades=args.grades, graduates=args.graduates, seed=args.seed)
+	with open(path, "wb") as f:
+		f.write(orjson.dumps({"school": school}))
+
+	# saving through Config writes the snapshot with its checksum, as the app would
+	config = Config(path)
+	config.read()
+	config.settings.persistence.fsync = False
+	config.save()
+
+
+def measure(path: str, load: dict, lookups: int, seed: int) -> tuple[float, float, float]:
+	with open(path, "rb") as f:
+		data = orjson.loads(f.read())
+	data["load"] = load
+	with open(path, "wb") as f:
+		f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+	del data
+
+	# the settings edit above invalidated the checksum, so let a validating read and save fix it up first
+	config = Config(path)
+	config.read()
+	config.settings.persistence.fsync = False
+	config.save()
+
+	config = Config(path)
+	start = time.perf_counter()
+	config.read()
+	read = time.perf_counter() - start
+
+	# the first full collection after the load would otherwise land in the lookups
+	gc.collect()
+
+	rng = random.Random(seed)
+	student_ids = list(config.school.students.keys())
+	start = time.perf_counter()
+	for _ in range(lookups):
+		config.school.students[rng.choice(student_ids)].calculate_total_average_grade()
+	lookup = (time.perf_counter() - start) / lookups
+
+	start = time.perf_counter()
+	config.school.model_dump(mode="json")
+	dump = time.perf_counter() - start
+
+	return read, lookup, dump
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+	parser.add_argument("--courses", type=int, default=20)
+	parser.add_argument("--enrollments", type=int, default=5)
+	parser.add_argument("--grades", type=int, default=10)
+	parser.add_argument("--graduates", type=float, default=0.1, help="share of graduate students")
+	parser.add_argument("--lookups", type=int, default=1000, help="random student reads timed after startup")
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	print(f"{'students':>10} {'mode':>9} {'read s':>8} {'lookup us':>10} {'full dump s':>12}")
+
+	with tempfile.TemporaryDirectory() as directory:
+		for size in args.sizes:
+			path = os.path.join(directory, f"config-{size}.json")
+			write_config(path, size, args)
+
+			for mode, load in MODES.items():
+				read, lookup, dump = measure(path, load, args.lookups, args.seed)
+				print(f"{size:>10} {mode:>9} {read:>8.3f} {lookup * 1e6:>10.2f} {dump:>12.3f}")
+
+
+if __name__ == "__main__":
+	main()
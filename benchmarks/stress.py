@@ -0,0 +1,160 @@
+"""Runs concurrent reads, writes and reloads against the app in-process over ASGI and fails on any server error.
+
+Readers stream the NDJSON student list (checking every stream is a consistent, strictly ordered view), render the
+students report and fetch single students; writers rename students, overwrite grades and enroll and unenroll
+students; a reloader keeps calling /api/config/reload. At the end the school on disk must match the one in memory.
+
+Run from the repository root: python -m benchmarks.stress --students 20000 --duration 10
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+import orjson
+
+from config import Config
+from main import create_app
+
+from .synthetic import generate_school
+
+
+class Failures(list):
+	def check(self, response: httpx.Response, what: str):
+		if response.status_code >= 500:
+			self.append(f"{what}: {response.status_code} {response.text[:200]}")
+
+
+async def reader(client: httpx.AsyncClient, stop: asyncio.Event, rng: random.Random, config: Config, latencies: list[float], failures: Failures):
+	while not stop.is_set():
+		choice = rng.random()
+		start = time.perf_counter()
+
+		if choice < 0.1:
+			ids = []
+			async with client.stream("GET", "/api/student/", headers={"Accept": "application/x-ndjson"}) as response:
+				failures.check(response, "students stream")
+				async for line in response.aiter_lines():
+					if line:
+						ids.append(orjson.loads(line)["student_id"])
+			if any(a >= b for a, b in itertools.pairwise(ids)):
+				failures.append("students stream: ids not strictly increasing")
+		elif choice < 0.15:
+			failures.check(await client.get("/report/students"), "students report")
+		else:
+			student_id = rng.choice(list(config.school.students.keys())[:1000])
+			failures.check(await client.get(f"/api/student/{student_id}"), "student get")
+
+		latencies.append(time.perf_counter() - start)
+		await asyncio.sleep(0)
+
+
+async def writer(client: httpx.AsyncClient, stop: asyncio.Event, rng: random.Random, config: Config, counts: dict[str, int], failures: Failures):
+	while not stop.is_set():
+		school = config.school
+		student_id = rng.choice(list(school.students.keys())[:1000])
+		course_code = rng.choice(list(school.courses.keys()))
+		choice = rng.random()
+
+		enrolled = [course.course_code for course in school.get_student_courses(student_id)]
+
+		if choice < 0.4 or (choice < 0.7 and not enrolled):
+			response = await client.patch(f"/api/student/{student_id}", json={"student_name": f"renamed {rng.randint(0, 10**6)}", "student_age": rng.randint(15, 30)})
+		elif choice < 0.7:
+			response = await client.patch(f"/api/student/{student_id}/grades", json={"course_code": rng.choice(enrolled), "grades": [rng.randint(1, 5) for _ in range(5)]})
+		elif choice < 0.85:
+			response = await client.put(f"/api/course/{course_code}/enroll_student", json={"student_id": student_id})
+		else:
+			response = await client.request("DELETE", f"/api/course/{course_code}/enroll_student", json={"student_id": student_id})
+
+		failures.check(response, "write")
+		counts["writes"] += 1
+		# in-process requests may complete without ever suspending, so give the other tasks a turn
+		await asyncio.sleep(0)
+
+
+async def reloader(client: httpx.AsyncClient, stop: asyncio.Event, interval: float, durations: list[float], failures: Failures):
+	while not stop.is_set():
+		try:
+			await asyncio.wait_for(stop.wait(), interval)
+			break
+		except TimeoutError:
+			pass
+		start = time.perf_counter()
+		failures.check(await client.post("/api/config/reload"), "reload")
+		durations.append(time.perf_counter() - start)
+
+
+def normalized(config: Config) -> dict:
+	school = config.school.model_dump(mode="json")
+	for course in school["courses"].values():
+		course["enrolled_students"] = sorted(course["enrolled_students"])
+	return school
+
+
+async def run(path: str, args: argparse.Namespace) -> int:
+	config = Config(path)
+	config.read()
+	app = create_app(config)
+
+	stop = asyncio.Event()
+	failures = Failures()
+	latencies: list[float] = []
+	reloads: list[float] = []
+	counts = {"writes": 0}
+
+	async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://stress", timeout=None) as client:
+		tasks = [asyncio.create_task(reader(client, stop, random.Random(args.seed + i), config, latencies, failures)) for i in range(args.readers)]
+		tasks += [asyncio.create_task(writer(client, stop, random.Random(args.seed + 1000 + i), config, counts, failures)) for i in range(args.writers)]
+		tasks.append(asyncio.create_task(reloader(client, stop, args.reload_interval, reloads, failures)))
+
+		await asyncio.sleep(args.duration)
+		stop.set()
+		results = await asyncio.gather(*tasks, return_exceptions=True)
+		failures.extend(f"task raised {result!r}" for result in results if isinstance(result, BaseException))
+
+	await config.flush()
+	on_disk = Config(path)
+	on_disk.read()
+	if normalized(on_disk) != normalized(config):
+		failures.append("the school on disk differs from the one in memory")
+
+	p50, p99 = np.percentile(np.array(latencies) * 1e3, [50, 99]) if latencies else (0.0, 0.0)
+	print(f"reads: {len(latencies)}, p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {max(latencies, default=0) * 1e3:.2f} ms")
+	print(f"writes: {counts['writes']}")
+	print(f"reloads: {len(reloads)}, average {np.mean(reloads) * 1e3 if reloads else 0:.2f} ms")
+
+	for failure in failures[:20]:
+		print(f"FAIL {failure}")
+	print("OK" if not failures else f"{len(failures)} failures")
+	return 1 if failures else 0
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--students", type=int, default=20_000)
+	parser.add_argument("--duration", type=float, default=10.0)
+	parser.add_argument("--readers", type=int, default=8)
+	parser.add_argument("--writers", type=int, default=4)
+	parser.add_argument("--reload-interval", type=float, default=0.5)
+	parser.add_argument("--journal", action=argparse.BooleanOptionalAction, default=True)
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "config.json")
+		with open(path, "wb") as f:
+			f.write(orjson.dumps({"journal": {"enabled": args.journal}, "persistence": {"fsync": False}, "school": generate_school(args.students, seed=args.seed)}))
+
+		sys.exit(asyncio.run(run(path, args)))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,69 @@
+"""Seeded synthetic schools for the benchmarks, the same for the same arguments.
+
+Writes a config.json from the repository root: python -m benchmarks.synthetic --students 10000 --output config.json
+"""
+
+import argparse
+import random
+
+import orjson
+
+
+def generate_school(students: int, courses: int = 20, enrollments: int = 3, grades: int = 5, graduates: float = 0.0, seed: int = 0) -> dict:
+	"""Returns a raw school dict shaped like the "school" key of config.json, with a `graduates` share of graduate students."""
+	rng = random.Random(seed)
+
+	school = {
+		"students": {},
+		"courses": {str(code): {"course_code": code, "course_name": f"course {code}", "enrolled_students": []} for code in range(1, courses + 1)},
+	}
+
+	for student_id in range(1, students + 1):
+		codes = rng.sample(range(1, courses + 1), min(enrollments, courses))
+
+		school["students"][str(student_id)] = {
+			"student_id": student_id,
+			"name": f"student {student_id}",
+			"age": rng.randint(15, 30),
+			"grades": {str(code): [rng.randint(1, 5) for _ in range(grades)] for code in codes},
+		}
+		if graduates and rng.random() < graduates:
+			school["students"][str(student_id)]["thesis_topic"] = f"thesis {student_id}"
+
+		for code in codes:
+			school["courses"][str(code)]["enrolled_students"].append(student_id)
+
+	return school
+
+
+def write_config(path: str, school: dict, **settings):
+	"""Writes a config.json with the school and top-level settings, e.g. `persistence={"fsync": False}`."""
+	with open(path, "wb") as f:
+		f.write(orjson.dumps({**settings, "school": school}))
+
+
+def add_arguments(parser: argparse.ArgumentParser, students: int = 10_000):
+	"""The generator's options, for the benchmarks taking a synthetic school."""
+	parser.add_argument("--students", type=int, default=students)
+	parser.add_argument("--courses", type=int, default=20)
+	parser.add_argument("--enrollments", type=int, default=3, help="courses per student")
+	parser.add_argument("--grades", type=int, default=5, help="grades per enrolled course")
+	parser.add_argument("--graduates", type=float, default=0.1, help="share of graduate students")
+	parser.add_argument("--seed", type=int, default=0)
+
+
+def from_arguments(args: argparse.Namespace) -> dict:
+	return generate_school(args.students, courses=args.courses, enrollments=args.enrollments, grades=args.grades, graduates=args.graduates, seed=args.seed)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	add_arguments(parser)
+	parser.add_argument("--output", default="config.json")
+	args = parser.parse_args()
+
+	write_config(args.output, from_arguments(args))
+
+
+if __name__ == "__main__":
+	main()
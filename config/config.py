@@ -1,18 +1,92 @@
+import asyncio
+import gc
 import os
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
 from typing import TypeAlias
 
-import orjson
+from util.admission import Admission
+from util.cache import ResponseCache
+from util.metrics import Collected, Metrics
+from util.profiling import ProfileStore
 
-from .school import School
+from .feed import ChangeFeed
+from .persistence import PersistenceWriter, WriteJob
+from .school import School, release
+from .settings import Settings
+from .snapshot import decode_file
+from .sqlite import SqliteStorage
+from .storage import Change, JsonStorage, Parts, Storage, changed_parts, read_config_file
+from .watcher import FileWatcher, ReloadStats
 
 PathType: TypeAlias = os.PathLike[str] | os.PathLike[bytes]
 
 
+@contextmanager
+def gc_paused() -> Iterator[None]:
+	"""
+	Pauses the cyclic garbage collector, which otherwise keeps rescanning the objects a large load allocates, and then
+	moves them out of its reach: the first full collection after a large load holds the GIL long enough to stall the
+	event loop. Objects frozen that way are still freed once unreferenced, unless they are part of a reference cycle.
+	"""
+	enabled = gc.isenabled()
+	gc.disable()
+	try:
+		yield
+	finally:
+		gc.freeze()
+		if enabled:
+			gc.enable()
+
+
+@dataclass(slots=True)
+class LoadedState:
+	"""Everything `Config` reads from disk, built aside and then swapped in at once."""
+
+	config: dict
+	settings: Settings
+	storage: Storage
+	school: School
+
+
 class Config:
 	def __init__(self, file_path: PathType):
 		self._file_path = file_path
 		self._config = {}
+		self._settings = Settings()
 		self._school = None
+		self._storage: Storage | None = None
+
+		self._pending: dict[Change, Parts] = {}
+		# set after a failed write, whose changes are lost, so the next write is a full snapshot
+		self._force_snapshot = False
+		# changes loaded from other workers are already stored, they must not be written back
+		self._applying_remote = False
+		# serializes reloads; entities changed while one is loading are collected here to be carried over
+		self._reload_lock = asyncio.Lock()
+		self._reload_changes: dict[Change, None] | None = None
+		self._reload_stats = ReloadStats()
+		self._watch_task: asyncio.Task | None = None
+		self._poll_task: asyncio.Task | None = None
+
+		self._writer = PersistenceWriter(self._capture)
+		self._response_cache = ResponseCache()
+		self._fragment_cache = ResponseCache()
+
+		self._metrics = Metrics()
+		self._metrics.collector(self._collect)
+		self._operation_seconds = self._metrics.histogram(
+			"config_operation_seconds",
+			"Duration of config operations: read (of the file and storage), reload, sync, capture (of what to write, on the event loop) and write (to disk)",
+			("operation",),
+		)
+		self._written_bytes = self._metrics.counter("config_written_bytes_total", "Bytes written to the storage").labels()
+		self._profiles = ProfileStore()
+		self._feed = ChangeFeed()
+		self._admission = Admission()
 
 	@property
 	def file_path(self) -> PathType:
@@ -22,6 +96,53 @@ class Config:
 	def file_path(self, value: PathType):
 		self._file_path = value
 
+	@property
+	def journal_path(self) -> str:
+		return f"{os.fsdecode(self._file_path)}.journal"
+
+	@property
+	def storage(self) -> Storage:
+		if self._storage is None:
+			raise ValueError("Config is not initialized!")
+		return self._storage
+
+	@property
+	def settings(self) -> Settings:
+		return self._settings
+
+	@property
+	def writer(self) -> PersistenceWriter:
+		return self._writer
+
+	@property
+	def response_cache(self) -> ResponseCache:
+		return self._response_cache
+
+	@property
+	def fragment_cache(self) -> ResponseCache:
+		"""Rendered HTML fragments, e.g. report rows, versioned like `response_cache`."""
+		return self._fragment_cache
+
+	@property
+	def metrics(self) -> Metrics:
+		return self._metrics
+
+	@property
+	def admission(self) -> Admission:
+		return self._admission
+
+	@property
+	def feed(self) -> ChangeFeed:
+		return self._feed
+
+	@property
+	def profiles(self) -> ProfileStore:
+		return self._profiles
+
+	@property
+	def reload_stats(self) -> ReloadStats:
+		return self._reload_stats
+
 	@property
 	def school(self) -> School:
 		if self._school is None:
@@ -29,23 +150,388 @@ class Config:
 		return self._school
 
 	def read(self):
-		if os.path.exists(self._file_path):
-			with open(self._file_path, "rb") as f:
+		"""Loads the config and school synchronously, e.g. at startup. Request handlers use `reload` instead."""
+		self._install(self._load())
+
+	async def reload(self):
+		"""
+		Loads the config and school again on a thread while requests keep being served from the current school, then swaps
+		it in. Students and courses changed in the meantime are carried over to the new school.
+		"""
+		async with self._reload_lock:
+			start = time.perf_counter()
+			state, changes = await self._load_concurrently()
+
+			await self._swap(state, changes)
+			elapsed = time.perf_counter() - start
+			self._reload_stats.record(elapsed * 1000, len(state.school.students) + len(state.school.courses), incremental=False)
+			self._operation_seconds.labels("reload").observe(elapsed)
+
+	async def sync(self) -> int | None:
+		"""
+		Applies external edits of the config file: loads it on a thread like `reload`, but keeps the current school and
+		replaces only the students and courses that differ, so unchanged entities, their cached responses and the indexes
+		survive. Entities changed here and not yet written are kept, ours are newer. Returns the number of entities
+		replaced, None if the file was last written by this app.
+		"""
+		async with self._reload_lock:
+			start = time.perf_counter()
+			state, changes = await self._load_concurrently(strict=True)
+			if state is None:
+				return None
+
+			if state.settings.storage != self._settings.storage:
+				# the school lives elsewhere now, there is nothing to diff against
+				await self._swap(state, changes)
+				changed = len(state.school.students) + len(state.school.courses)
+			else:
+				changed = self._apply_diff(state, changes)
+
+			elapsed = time.perf_counter() - start
+			self._reload_stats.record(elapsed * 1000, changed, incremental=True)
+			self._operation_seconds.labels("sync").observe(elapsed)
+			print(f"Config reloaded in {elapsed * 1000:.1f} ms, {changed} students and courses changed")
+			return changed
+
+	async def _load_concurrently(self, strict: bool = False) -> tuple[LoadedState | None, dict[Change, None]]:
+		"""Runs `_load` on a thread and returns it with the entities changed on the loop in the meantime."""
+		# recorded from the start: a change made while flushing may reach the disk only after the load has read it
+		self._reload_changes = {}
+		try:
+			await self.flush()
+			state = await asyncio.to_thread(self._load, strict, True)
+			await self.flush()
+		finally:
+			changes, self._reload_changes = self._reload_changes, None
+
+		return state, changes
+
+	async def _swap(self, state: LoadedState, changes: dict[Change, None]):
+		"""Installs a loaded state, carrying over the entities changed meanwhile."""
+		old = self._school
+		self._install(state)
+
+		for kind, key in changes:
+			if kind == "student":
+				student = old.students.get(key)
+				self._school.put_student(key, None if student is None else student.model_copy(deep=True))
+			else:
+				course = old.courses.get(key)
+				self._school.put_course(key, None if course is None else course.model_copy(deep=True))
+
+		if changes:
+			await self.commit()
+
+		# freeing a large school holds the GIL for tens of ms, so the old one is emptied on a thread if nothing but this
+		# frame holds it, just like `probe`; otherwise it goes whenever its last reader lets go
+		probe = object()
+		if sys.getrefcount(old) == sys.getrefcount(probe):
+			await asyncio.to_thread(old.release)
+
+	def _apply_diff(self, state: LoadedState, changes: dict[Change, None]) -> int:
+		"""Takes over the settings and storage of `state` and the students and courses of its school that differ from ours."""
+		school = self._school
+		local = changes.keys() | self._pending.keys()
+		diff: list[Change] = []
+		for kind, ours, theirs in (("student", school.students, state.school.students), ("course", school.courses, state.school.courses)):
+			for key in ours.keys() | theirs.keys():
+				if (kind, key) not in local and not _same(ours, theirs, key):
+					diff.append((kind, key))
+
+		self._install_settings(state)
+
+		self._applying_remote = True
+		try:
+			for kind, key in diff:
+				if kind == "student":
+					school.put_student(key, state.school.students.get(key))
+				else:
+					school.put_course(key, state.school.courses.get(key))
+		finally:
+			self._applying_remote = False
+
+		if changes:
+			# written through the old storage, possibly as a snapshot without the edit, so write the merged school again
+			self._force_snapshot = True
+			self._writer.mark_dirty()
+
+		return len(diff)
+
+	def start_watching(self):
+		"""
+		Starts watching the config file for external edits, applied by `sync`, if `watch.enabled`, and polling the storage
+		for changes of other workers, applied by `poll`. Needs a running loop.
+		"""
+		loop = asyncio.get_running_loop()
+		if self._settings.watch.enabled and self._watch_task is None:
+			self._watch_task = loop.create_task(self._watch())
+		if self._poll_task is None:
+			self._poll_task = loop.create_task(self._poll_storage())
+
+	async def stop_watching(self):
+		tasks = (self._watch_task, self._poll_task)
+		self._watch_task = self._poll_task = None
+		for task in tasks:
+			if task is None:
+				continue
+			task.cancel()
+			try:
+				await task
+			except asyncio.CancelledError:
+				pass
+
+	async def _watch(self):
+		watcher = FileWatcher(os.fsdecode(self._file_path), self._settings.watch.interval)
+		try:
+			while True:
+				await watcher.wait()
+				# editors may write a file in several steps, let them finish
+				await asyncio.sleep(self._settings.watch.debounce)
+				if not self.storage.changed_externally():
+					continue
+
 				try:
-					self._config = orjson.loads(f.read())
-				except orjson.JSONDecodeError as e:
-					print(f"JSON Decode error: {e.args}")
-					self._config = {}
-		else:
-			self._config = {}
+					await self.sync()
+				except Exception as e:  # noqa: BLE001
+					# e.g. a half written or invalid file, the next edit is another chance
+					self._reload_stats.errors += 1
+					print(f"Config watch error: {e!r}")
+		finally:
+			watcher.close()
+
+	async def _poll_storage(self):
+		while True:
+			await asyncio.sleep(self._settings.storage.poll_interval)
+			if self._settings.storage.backend != "sqlite":
+				continue
+
+			try:
+				await self.poll()
+			except Exception as e:  # noqa: BLE001
+				# e.g. the storage was closed by a reload meanwhile, the next poll is another chance
+				print(f"Storage poll error: {e!r}")
+
+	async def poll(self):
+		"""
+		Applies what other workers stored since the last poll to the school. The storage is read on a thread; if what
+		changed is unknown, e.g. another worker wrote a snapshot, the school is reloaded, after writing the pending changes.
+		"""
+		async with self._reload_lock:
+			storage = self._storage
+			school = self._school
+			# entities changed here while the storage is read are newer than what it returns
+			version = school.version
+
+			def read() -> tuple[list[Change] | None, dict]:
+				changes = storage.poll()
+				return changes, storage.load_entities(changes) if changes else {}
+
+			changes, loaded = await asyncio.to_thread(read)
+			if changes is not None and (not changes or storage is not self._storage or school is not self._school):
+				return
+
+			if changes is not None:
+				loaded = School.from_trusted(loaded) if self._settings.load.trusted else School(**loaded)
+				self._applying_remote = True
+				try:
+					for kind, key in changes:
+						if (kind, key) in self._pending or school.entity_version(kind, key) > version:
+							continue
+						if kind == "student":
+							school.put_student(key, loaded.students.get(key))
+						else:
+							school.put_course(key, loaded.courses.get(key))
+				finally:
+					self._applying_remote = False
+				return
+
+		# `reload` writes the pending changes first and carries over those made while it loads
+		await self.reload()
+
+	def _load(self, strict: bool = False, offload: bool = False) -> LoadedState | None:
+		"""
+		Reads everything without touching the current state, so it may run on a thread. With `strict` a file that can't
+		be decoded raises instead of loading as empty, and None is returned if this app wrote the file last. With
+		`offload` a large file is decoded in a child process and the school validated in chunks, so the thread never
+		holds the GIL for long.
+		"""
+		with gc_paused(), self._operation_seconds.labels("read").time():
+			path = os.fsdecode(self._file_path)
+			offload_bytes = self._settings.load.offload_bytes if offload else 0
+
+			# keeps background writes out while the storage reads, e.g. a journal append mistaken for a torn record or a
+			# compaction between reading the file and the journal
+			with self._writer.lock:
+				if not strict:
+					config = read_config_file(path, offload_bytes)
+				elif self._storage is not None and not self._storage.changed_externally():
+					return None
+				else:
+					config = decode_file(path, offload_bytes)
+				settings = Settings.model_validate(config)
+
+				if settings.storage.backend == "sqlite":
+					storage = SqliteStorage(settings, settings.storage.path)
+				else:
+					storage = JsonStorage(settings, path)
+				data = storage.load(config)
+
+			if settings.load.trusted and storage.trusted:
+				school = School.from_trusted(data, lazy=settings.load.lazy, validate=storage.untrusted)
+			elif offload:
+				school = School.validate_chunked(data)
+			else:
+				school = School(**data)
 
-		self._school = School(**self._config.get("school", {}))
+			if offload:
+				# the raw records the school was built from, freed here rather than all at once when `data` goes
+				for kind in ("students", "courses"):
+					if isinstance(data.get(kind), dict):
+						release(data[kind])
 
-	def reload(self):
-		self.read()
+		return LoadedState(config, settings, storage, school)
+
+	def _install(self, state: LoadedState):
+		self._install_settings(state)
+		self._school = state.school
+		self._school.add_event_listener(self._on_change)
+		self._feed.install(self._school)
+
+		# a new School starts a new epoch, nothing cached for the old one can hit again
+		self._response_cache.clear()
+		self._fragment_cache.clear()
+
+		self._pending.clear()
+		self._force_snapshot = False
+
+	def _install_settings(self, state: LoadedState):
+		if self._storage is not None:
+			self._storage.close()
+
+		self._config = state.config
+		self._settings = state.settings
+		self._metrics.enabled = self._settings.metrics.enabled
+		self._profiles.enabled = self._settings.profiling.enabled
+		self._profiles.directory = self._settings.profiling.directory
+		self._profiles.max_profiles = self._settings.profiling.max_profiles
+		self._feed.history = self._settings.feed.history
+		self._feed.queue_size = self._settings.feed.queue_size
+		admission = self._settings.admission
+		self._admission.configure(admission.enabled, admission.workers, {name: limit.model_dump() for name, limit in admission.classes.items()})
+		self._storage = state.storage
+
+		self._writer.max_staleness = self._settings.persistence.max_staleness
+		self._response_cache.max_entries = self._settings.cache.max_entries
+		self._response_cache.max_bytes = self._settings.cache.max_bytes
+		self._fragment_cache.max_entries = self._settings.cache.max_fragments
+		self._fragment_cache.max_bytes = self._settings.cache.max_fragment_bytes
 
 	def save(self):
-		self._config["school"] = self.school.model_dump(mode="json")
+		"""
+		Persists the school synchronously: writes the pending changes to the storage (journal records in journal mode, rows
+		with SQLite), otherwise (or when compaction is due) the whole snapshot. Request handlers use `commit` instead.
+		"""
+		with self._writer.lock:
+			self._capture()()
+
+	async def commit(self, durable: bool = False):
+		"""
+		Persists the school from a request handler.
+
+		With background persistence the write is coalesced with other mutations and runs off the event loop, within
+		`persistence.max_staleness` seconds; `durable` waits until it is on disk.
+		"""
+		if not self._settings.persistence.background:
+			self.save()
+			return
+
+		flushed = self._writer.mark_dirty()
+		if durable:
+			await asyncio.shield(flushed)
+
+	async def flush(self):
+		"""Waits for pending background writes, e.g. before a reload or shutdown."""
+		await self._writer.flush()
+
+	def _capture(self) -> WriteJob:
+		"""Captures the state to write on the calling (event loop) thread and returns the disk work, which may run on any thread."""
+		changes, self._pending = self._pending, {}
+		snapshot, self._force_snapshot = self._force_snapshot, False
+
+		with self._operation_seconds.labels("capture").time():
+			job = self.storage.capture(self._school, self._config, changes, snapshot)
+		return self._guard(job)
+
+	def _guard(self, job: WriteJob) -> WriteJob:
+		write_seconds = self._operation_seconds.labels("write")
+
+		def guarded() -> int:
+			try:
+				with write_seconds.time():
+					written = job()
+			except Exception:
+				self._force_snapshot = True
+				raise
+			self._written_bytes.inc(written)
+			return written
+
+		return guarded
+
+	def _collect(self) -> list[Collected]:
+		"""Metrics of the stats kept by the writer, caches and school, read when `/metrics` is rendered."""
+		persistence = self._writer.stats
+		caches = (("responses", self._response_cache.stats), ("fragments", self._fragment_cache.stats))
+		collected = [
+			("persistence_mutations_total", "counter", "Mutations marked for background persistence", [({}, persistence.mutations)]),
+			("persistence_coalesced_total", "counter", "Mutations coalesced into an already scheduled flush", [({}, persistence.coalesced)]),
+			("persistence_flushes_total", "counter", "Background flushes", [({}, persistence.flushes)]),
+			("persistence_errors_total", "counter", "Failed background flushes", [({}, persistence.errors)]),
+			("reload_errors_total", "counter", "Failed syncs of external config file edits", [({}, self._reload_stats.errors)]),
+		]
+		for name, help in (("hits", "Cache hits"), ("misses", "Cache misses"), ("evictions", "Cache evictions")):
+			collected.append((f"cache_{name}_total", "counter", help, [({"cache": cache}, getattr(stats, name)) for cache, stats in caches]))
+		collected.append(("cache_entries", "gauge", "Cached entries", [({"cache": cache}, stats.entries) for cache, stats in caches]))
+		collected.append(("cache_bytes", "gauge", "Cached bytes", [({"cache": cache}, stats.bytes) for cache, stats in caches]))
+
+		limits = self._admission.limits.items()
+		collected.append(("admission_active", "gauge", "Requests holding a slot of their route class", [({"class": name}, limit.active) for name, limit in limits]))
+		collected.append(("admission_waiting", "gauge", "Requests waiting for a slot of their route class", [({"class": name}, limit.waiting) for name, limit in limits]))
+		for name, help in (
+			("admitted", "Requests admitted"),
+			("queued", "Requests that waited for a slot"),
+			("rejected", "Requests rejected with a full queue"),
+			("timed_out", "Requests rejected after waiting too long"),
+		):
+			collected.append((f"admission_{name}_total", "counter", help, [({"class": cls}, getattr(limit.stats, name)) for cls, limit in limits]))
+
+		feed = self._feed.stats
+		collected.append(("feed_clients", "gauge", "Clients connected to the change feed", [({}, feed.clients)]))
+		collected.append(("feed_events_total", "counter", "School mutations published to the change feed", [({}, feed.events)]))
+		collected.append(("feed_messages_total", "counter", "Messages (of one or more events) sent to feed clients", [({}, feed.sent)]))
+		collected.append(("feed_overflows_total", "counter", "Feed clients disconnected for falling too far behind", [({}, feed.overflows)]))
+		collected.append(("feed_resets_total", "counter", "Reset events sent to feed clients", [({}, feed.resets)]))
+
+		if self._school is not None:
+			collected.append(("school_students", "gauge", "Students", [({}, len(self._school.students))]))
+			collected.append(("school_courses", "gauge", "Courses", [({}, len(self._school.courses))]))
+			collected.append(("school_version", "gauge", "Mutations of the school since it was loaded", [({}, self._school.version)]))
+		return collected
+
+	def _on_change(self, version: int, kind: str, key: int, event: str, fields: dict):
+		if self._reload_changes is not None:
+			self._reload_changes[(kind, key)] = None
+		if not self._applying_remote:
+			parts = changed_parts(event, fields)
+			pending = self._pending.get((kind, key), set())
+			self._pending[(kind, key)] = None if pending is None or parts is None else pending | parts
+
 
-		with open(self._file_path, "wb") as f:
-			f.write(orjson.dumps(self._config, option=orjson.OPT_INDENT_2))
+def _same(ours: dict, theirs: dict, key: int) -> bool:
+	"""Compares one entity of two schools, as raw records while both are still unhydrated (lazy loads)."""
+	a = dict.get(ours, key)
+	b = dict.get(theirs, key)
+	if a is None or b is None:
+		return a is b
+	if type(a) is dict and type(b) is dict:
+		return a == b
+	return ours[key] == theirs[key]
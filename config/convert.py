@@ -0,0 +1,50 @@
+"""
+Converts a config file between the snapshot formats in place, keeping its checksum valid. Stop the app first.
+
+Run from the repository root: python -m config.convert config.json --format msgpack
+"""
+
+import argparse
+import os
+
+from .persistence import atomic_write
+from .snapshot import FORMATS, SnapshotFormat, checksum, decode, detect_format, encode
+
+
+def convert(path: str, format: SnapshotFormat, fsync: bool = True) -> tuple[int, int]:
+	"""Rewrites the config file at `path` in `format` and records the format in its settings. Returns the old and new sizes."""
+	with open(path, "rb") as f:
+		data = f.read()
+
+	document = decode(data)
+	document.setdefault("snapshot", {})["format"] = format
+	converted = encode(document, format)
+
+	atomic_write(path, converted, fsync)
+
+	# only the encoding changed, so a file the app wrote stays trusted
+	checksum_path = f"{path}.sum"
+	if os.path.exists(checksum_path):
+		with open(checksum_path, "rb") as f:
+			trusted = f.read() == checksum(data)
+		if trusted:
+			atomic_write(checksum_path, checksum(converted), fsync)
+
+	return len(data), len(converted)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("path", help="config file, e.g. config.json")
+	parser.add_argument("--format", choices=FORMATS, required=True)
+	args = parser.parse_args()
+
+	with open(args.path, "rb") as f:
+		source = detect_format(f.read(2))
+
+	before, after = convert(args.path, args.format)
+	print(f"{args.path}: {source} ({before} bytes) -> {args.format} ({after} bytes)")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,99 @@
+"""Flat CSV or NDJSON rows of students and grades, encoded and optionally gzipped chunk by chunk for streaming."""
+
+import csv
+import io
+import zlib
+from collections.abc import Iterable, Iterator
+from typing import Literal, TypeAlias
+
+import orjson
+
+from models import GraduateStudent
+
+from .school import School
+
+ExportFormat: TypeAlias = Literal["csv", "ndjson"]
+
+FORMATS: tuple[ExportFormat, ...] = ("csv", "ndjson")
+# the student columns are the importer's, so an export can be imported again
+STUDENT_COLUMNS = ("student_id", "student_name", "student_age", "thesis_topic", "total_average_grade")
+GRADE_COLUMNS = ("student_id", "name", "course_code", "course_name", "grade")
+
+
+def student_rows(school: School, student_ids: Iterable[int], deleted: bool = False) -> Iterator[tuple]:
+	"""
+	A row per student, in `STUDENT_COLUMNS` order. With `deleted` (incremental exports) a last column tells whether the
+	student was removed, the other columns of removed students being empty.
+	"""
+	students = school.students
+	for student_id in student_ids:
+		student = students.get(student_id)
+		if student is None:
+			if deleted:
+				yield student_id, None, None, None, None, True
+			continue
+
+		thesis_topic = student.thesis_topic if isinstance(student, GraduateStudent) else None
+		row = (student_id, student.name, student.age, thesis_topic, student.calculate_total_average_grade())
+		yield (*row, False) if deleted else row
+
+
+def grade_rows(school: School, student_ids: Iterable[int], deleted: bool = False) -> Iterator[tuple]:
+	"""
+	A row per grade of the students in the courses they are enrolled to, in `GRADE_COLUMNS` order. With `deleted`
+	(incremental exports, which replace every row of the exported students) a last column tells whether the student
+	was removed, and a removed student or one left without grades gets a single row with empty course and grade columns.
+	"""
+	students = school.students
+	for student_id in student_ids:
+		student = students.get(student_id)
+		if student is None:
+			if deleted:
+				yield student_id, None, None, None, None, True
+			continue
+
+		empty = True
+		for course in school.get_student_courses(student_id):
+			for grade in student.grades.get(course.course_code, ()):
+				empty = False
+				row = (student_id, student.name, course.course_code, course.course_name, grade)
+				yield (*row, False) if deleted else row
+		if deleted and empty:
+			yield student_id, student.name, None, None, None, False
+
+
+def encode(columns: tuple[str, ...], rows: Iterable[tuple], format: ExportFormat, chunk_rows: int = 1000) -> Iterator[bytes]:
+	"""Encodes rows `chunk_rows` at a time: CSV with a header row, or NDJSON objects keyed by `columns`."""
+	if format == "csv":
+		buffer = io.StringIO()
+		writer = csv.writer(buffer)
+		writer.writerow(columns)
+		for count, row in enumerate(rows, 1):
+			writer.writerow(row)
+			if count % chunk_rows == 0:
+				yield buffer.getvalue().encode()
+				buffer.seek(0)
+				buffer.truncate()
+		if buffer.tell():
+			yield buffer.getvalue().encode()
+		return
+
+	lines = []
+	for row in rows:
+		lines.append(orjson.dumps(dict(zip(columns, row))))
+		if len(lines) == chunk_rows:
+			lines.append(b"")
+			yield b"\n".join(lines)
+			lines = []
+	if lines:
+		lines.append(b"")
+		yield b"\n".join(lines)
+
+
+def gzipped(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+	"""Compresses a stream of chunks into one gzip member as it goes."""
+	compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+	for chunk in chunks:
+		if compressed := compressor.compress(chunk):
+			yield compressed
+	yield compressor.flush()
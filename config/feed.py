@@ -0,0 +1,231 @@
+"""Delta events of school mutations fanned out to subscribed clients, e.g. the `/ws/changes` WebSocket feed."""
+
+import array
+import asyncio
+import collections
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+import orjson
+import pydantic
+
+from .school import School
+
+KEYS = {"student": "student_id", "course": "course_code"}
+
+
+def _dump(value) -> dict | list:
+	if isinstance(value, pydantic.BaseModel):
+		return value.model_dump(mode="json")
+	if isinstance(value, array.array):
+		# grades
+		return value.tolist()
+	raise TypeError
+
+
+def encode(event: dict) -> str:
+	return orjson.dumps(event, default=_dump, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+@dataclass()
+class FeedStats:
+	clients: int = 0
+	events: int = 0
+	sent: int = 0
+	overflows: int = 0
+	resets: int = 0
+
+
+class FeedClient:
+	"""
+	One subscriber: its filters and the encoded events not yet sent, which its sender drains when `ready` is set. A client
+	falling `queue_size` events behind (on top of the `backlog` it was caught up with) is `overflowed` and should be
+	disconnected, to resume from its last version.
+	"""
+
+	__slots__ = ("backlog", "courses", "overflowed", "pending", "ready", "students")
+
+	def __init__(self):
+		# None: every student/course
+		self.students: frozenset[int] | None = None
+		self.courses: frozenset[int] | None = None
+		self.pending: collections.deque[str] = collections.deque()
+		self.backlog = 0
+		self.ready = asyncio.Event()
+		self.overflowed = False
+
+	def push(self, message: str):
+		self.pending.append(message)
+		self.ready.set()
+
+	def drain(self, limit: int) -> list[str]:
+		pending = self.pending
+		drained = [pending.popleft() for _ in range(min(limit, len(pending)))]
+		if not pending:
+			self.backlog = 0
+		return drained
+
+
+class ChangeFeed:
+	"""
+	Encodes every mutation of the installed school once as a compact JSON event, e.g.
+	`{"type": "course.enrolled", "version": 42, "course_code": 1, "student_id": 7}`, and queues it for the clients
+	subscribed to all events, to the student or to the course it concerns.
+
+	The last `history` events are kept so reconnecting clients resume from the version they last saw. Older versions
+	are caught up with the current state of what changed since, and clients of another epoch (or with more than
+	`history` students and courses to catch up with) get a "reset" event telling them to fetch everything again.
+	"""
+
+	def __init__(self, history: int = 10_000, queue_size: int = 1000):
+		self.queue_size = queue_size
+		self.stats = FeedStats()
+		self._school: School | None = None
+		# (version, student_id, course_code, encoded event), oldest first
+		self._history: collections.deque[tuple[int, int | None, int | None, str]] = collections.deque(maxlen=history)
+		# events after this version are all in the history
+		self._floor = 0
+		self._clients: set[FeedClient] = set()
+		self._unfiltered: set[FeedClient] = set()
+		self._by_student: dict[int, set[FeedClient]] = {}
+		self._by_course: dict[int, set[FeedClient]] = {}
+
+	@property
+	def history(self) -> int:
+		return self._history.maxlen
+
+	@history.setter
+	def history(self, value: int):
+		if value != self._history.maxlen:
+			self._history = collections.deque(self._history, maxlen=value)
+			if self._history:
+				self._floor = max(self._floor, self._history[0][0] - 1)
+
+	def install(self, school: School):
+		"""Follows the mutations of a newly loaded school; connected clients are told to start over."""
+		self._school = school
+		school.add_event_listener(self.publish)
+		self._history.clear()
+		self._floor = school.version
+
+		reset = encode(self._control("reset"))
+		for client in self._clients:
+			client.push(reset)
+		self.stats.resets += len(self._clients)
+
+	def _control(self, type: str, **fields) -> dict:
+		return {"type": type, "epoch": self._school.epoch, "version": self._school.version, **fields}
+
+	def publish(self, version: int, kind: str, key: int, event: str, fields: dict):
+		"""The school's event listener."""
+		self.stats.events += 1
+		if not self._clients:
+			# nobody to send it to, reconnecting clients catch up from the school instead
+			self._floor = version
+			return
+
+		student_id = key if kind == "student" else fields.get("student_id")
+		course_code = key if kind == "course" else fields.get("course_code")
+		message = encode({"type": f"{kind}.{event}", "version": version, KEYS[kind]: key, **fields})
+		if len(self._history) == self._history.maxlen:
+			self._floor = self._history[0][0]
+		self._history.append((version, student_id, course_code, message))
+
+		targets = self._unfiltered
+		by_student = self._by_student.get(student_id) if student_id is not None else None
+		by_course = self._by_course.get(course_code) if course_code is not None else None
+		if by_student or by_course:
+			targets = targets.union(by_student or (), by_course or ())
+
+		queue_size = self.queue_size
+		for client in targets:
+			if client.overflowed:
+				continue
+			if len(client.pending) >= queue_size + client.backlog:
+				client.overflowed = True
+				client.ready.set()
+				self.stats.overflows += 1
+				continue
+			client.push(message)
+
+	def connect(self, students: Iterable[int] | None = None, courses: Iterable[int] | None = None, since: tuple[str, int] | None = None) -> FeedClient:
+		"""
+		Subscribes a client, queueing a "hello" event with the current epoch and version, then whatever it missed since
+		the `(epoch, version)` it last saw.
+		"""
+		client = FeedClient()
+		self._clients.add(client)
+		self.stats.clients = len(self._clients)
+		self.subscribe(client, students, courses)
+		client.push(encode(self._control("hello")))
+
+		if since is not None:
+			missed = self._missed(client, *since)
+			if missed is None:
+				client.push(encode(self._control("reset")))
+				self.stats.resets += 1
+			else:
+				client.pending.extend(missed)
+				client.backlog = len(missed)
+		return client
+
+	def _missed(self, client: FeedClient, epoch: str, version: int) -> list[str] | None:
+		"""The events after `version` matching the client's filters, None if they can't be told."""
+		school = self._school
+		if epoch != school.epoch or version > school.version:
+			return None
+
+		if version >= self._floor:
+			return [message for event_version, student_id, course_code, message in self._history if event_version > version and self._matches(client, student_id, course_code)]
+
+		# the events are gone, what changed since is sent as it is now
+		changed = []
+		for kind, entities in (("student", school.students), ("course", school.courses)):
+			for key in school.changed_since(kind, version):
+				student_id, course_code = (key, None) if kind == "student" else (None, key)
+				if not self._matches(client, student_id, course_code):
+					continue
+				entity = entities.get(key)
+				event = {"type": f"{kind}.deleted" if entity is None else f"{kind}.updated", "version": school.entity_version(kind, key), KEYS[kind]: key}
+				if entity is not None:
+					event[kind] = entity
+				changed.append(event)
+				if len(changed) > self.history:
+					return None
+		changed.sort(key=lambda event: event["version"])
+		return [encode(event) for event in changed]
+
+	@staticmethod
+	def _matches(client: FeedClient, student_id: int | None, course_code: int | None) -> bool:
+		if client.students is None and client.courses is None:
+			return True
+		return (client.students is not None and student_id in client.students) or (client.courses is not None and course_code in client.courses)
+
+	def subscribe(self, client: FeedClient, students: Iterable[int] | None, courses: Iterable[int] | None):
+		"""Replaces a client's filters: the events of these students and courses, every event if both are None."""
+		self._unindex(client)
+		client.students = frozenset(students) if students is not None else None
+		client.courses = frozenset(courses) if courses is not None else None
+
+		if client.students is None and client.courses is None:
+			self._unfiltered.add(client)
+			return
+		for student_id in client.students or ():
+			self._by_student.setdefault(student_id, set()).add(client)
+		for course_code in client.courses or ():
+			self._by_course.setdefault(course_code, set()).add(client)
+
+	def _unindex(self, client: FeedClient):
+		self._unfiltered.discard(client)
+		for index, keys in ((self._by_student, client.students), (self._by_course, client.courses)):
+			for key in keys or ():
+				clients = index.get(key)
+				if clients is not None:
+					clients.discard(client)
+					if not clients:
+						del index[key]
+
+	def disconnect(self, client: FeedClient):
+		self._unindex(client)
+		self._clients.discard(client)
+		self.stats.clients = len(self._clients)
@@ -0,0 +1,443 @@
+"""
+Streaming import of students, courses or grades from NDJSON or CSV, e.g. to onboard a new term.
+
+The input is read and validated in chunks (optionally across a process pool) and applied chunk by chunk, so memory
+stays flat whatever its size; the school is persisted once at the end. Rows that fail are reported and skipped,
+the others applied.
+
+Run from the repository root, with the app stopped: python importer.py students.csv --kind students (or python -m config.importer)
+"""
+
+import argparse
+import asyncio
+import collections
+import csv
+import multiprocessing
+import os
+import sys
+import time
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Literal, TypeAlias
+
+import orjson
+import pydantic
+
+from models import Course, Student
+from models.grades import Grade
+
+from .config import Config
+from .school import School
+
+ImportKind: TypeAlias = Literal["students", "courses", "grades"]
+ImportFormat: TypeAlias = Literal["ndjson", "csv"]
+# what to do with a student or course that already exists: skipping makes running an import again harmless
+ExistingPolicy: TypeAlias = Literal["skip", "error"]
+
+KINDS: tuple[ImportKind, ...] = ("students", "courses", "grades")
+FORMATS: tuple[ImportFormat, ...] = ("ndjson", "csv")
+# records (lines, or CSV rows spanning lines) are kept whole up to this size, longer ones fail
+MAX_RECORD_BYTES = 1024 * 1024
+# stands in for a record that was too long to keep, e.g. after an unterminated quote; real records are never empty
+MALFORMED = b""
+
+
+class StudentRecord(pydantic.BaseModel):
+	student_id: int
+	student_name: str
+	student_age: int
+	thesis_topic: str | None = None
+
+
+class CourseRecord(pydantic.BaseModel):
+	course_code: int
+	course_name: str
+
+
+class GradesRecord(pydantic.BaseModel):
+	"""A student's grades in a course, overwriting the ones it has; the student is enrolled to the course if needed."""
+
+	student_id: int
+	course_code: int
+	grades: list[Grade]
+
+	@pydantic.field_validator("grades", mode="before")
+	@classmethod
+	def split_grades(cls, value):
+		# a CSV cell holds the grades separated by spaces
+		return value.split() if isinstance(value, str) else value
+
+
+RECORDS: dict[ImportKind, type[pydantic.BaseModel]] = {"students": StudentRecord, "courses": CourseRecord, "grades": GradesRecord}
+
+
+@dataclass()
+class ImportProgress:
+	kind: ImportKind
+	format: ImportFormat
+	# rows handled so far, including the ones skipped at the start: pass it as `skip` to resume an interrupted import
+	rows: int = 0
+	applied: int = 0
+	skipped: int = 0
+	failed: int = 0
+	# the first `max_errors` failed rows, as {"row", "error"} with 1-based row numbers (not counting a CSV header)
+	errors: list[dict] = field(default_factory=list)
+	max_errors: int = 1000
+	done: bool = False
+	started: float = field(default_factory=time.time)
+	elapsed: float = 0.0
+
+	def as_dict(self) -> dict:
+		data = asdict(self)
+		del data["max_errors"]
+		data["rows_per_second"] = round(self.rows / self.elapsed) if self.elapsed else 0
+		return data
+
+	def fail(self, row: int, error: str):
+		self.failed += 1
+		if len(self.errors) < self.max_errors:
+			self.errors.append({"row": row, "error": error})
+
+
+def _error_message(e: pydantic.ValidationError) -> str:
+	return "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" if error["loc"] else error["msg"] for error in e.errors())
+
+
+def read_header(kind: ImportKind, record: bytes) -> list[str]:
+	"""Parses a CSV header row, failing if a required column is missing."""
+	header = [name.strip() for name in next(csv.reader([record.decode("utf-8-sig")]), [])]
+	missing = [name for name, info in RECORDS[kind].model_fields.items() if info.is_required() and name not in header]
+	if missing:
+		raise ValueError(f"Missing CSV columns: {', '.join(missing)}")
+	return header
+
+
+def validate_chunk(kind: ImportKind, format: ImportFormat, header: list[str] | None, start: int, records: list[bytes]) -> tuple[list[tuple[int, dict]], list[tuple[int, str]]]:
+	"""
+	Validates raw records numbered from `start`, returning the (row, record) pairs of the valid ones and the (row, error)
+	pairs of the others. Runs in the pool workers, so it takes and returns plain data only.
+	"""
+	model = RECORDS[kind]
+	valid, errors = [], []
+
+	if format == "csv":
+		for row, record in enumerate(records, start):
+			if record == MALFORMED:
+				errors.append((row, "Unterminated quoted field or record too long"))
+				continue
+			try:
+				cells = next(csv.reader((record.decode(),)), [])
+			except (UnicodeDecodeError, csv.Error) as e:
+				errors.append((row, str(e)))
+				continue
+			if len(cells) != len(header):
+				errors.append((row, f"Expected {len(header)} columns, got {len(cells)}"))
+				continue
+			try:
+				# an empty cell is a missing value, e.g. the thesis topic of an undergraduate
+				valid.append((row, model.model_validate({name: cell for name, cell in zip(header, cells) if cell != ""}).model_dump()))
+			except pydantic.ValidationError as e:
+				errors.append((row, _error_message(e)))
+	else:
+		for row, record in enumerate(records, start):
+			if record == MALFORMED:
+				errors.append((row, "Record too long"))
+				continue
+			try:
+				valid.append((row, model.model_validate_json(record).model_dump()))
+			except pydantic.ValidationError as e:
+				errors.append((row, _error_message(e)))
+
+	return valid, errors
+
+
+class RecordSplitter:
+	"""
+	Splits a byte stream fed in chunks into records: non-blank lines, for CSV joined while a quoted field spans lines.
+
+	Nothing longer than `max_bytes` is kept: a longer line becomes one `MALFORMED` record. So does a CSV record whose
+	quoted field is still open past `max_bytes`, i.e. most likely never closed: its first line is the malformed row,
+	the lines after it are split again.
+	"""
+
+	def __init__(self, format: ImportFormat, max_bytes: int = MAX_RECORD_BYTES):
+		self.csv = format == "csv"
+		self.max_bytes = max_bytes
+		self._rest = b""
+		# the current line is too long, its remainder is dropped up to the next newline
+		self._dropping = False
+		self._pending: list[bytes] = []
+		self._pending_bytes = 0
+		self._quotes = 0
+
+	def feed(self, chunk: bytes) -> list[bytes]:
+		records: list[bytes] = []
+		*lines, rest = (self._rest + chunk).split(b"\n")
+		for line in lines:
+			if self._dropping or len(line) > self.max_bytes:
+				self._dropping = False
+				self._malformed_line(records)
+			else:
+				self._add(line, records)
+
+		if len(rest) > self.max_bytes:
+			self._dropping = True
+			rest = b""
+		self._rest = rest
+		return records
+
+	def close(self) -> list[bytes]:
+		records: list[bytes] = []
+		if self._dropping:
+			self._dropping = False
+			self._malformed_line(records)
+		else:
+			self._add(self._rest, records)
+			# a quoted field still open at the end was never closed
+			self._drain(records)
+		self._rest = b""
+		return records
+
+	def _add(self, line: bytes, records: list[bytes]):
+		lines = collections.deque((line,))
+		while lines:
+			line = lines.popleft()
+			if not self.csv:
+				if line.strip():
+					records.append(line)
+				continue
+
+			if not self._pending and not line.strip():
+				continue
+			self._pending.append(line)
+			self._pending_bytes += len(line) + 1
+			self._quotes += line.count(b'"')
+			if self._quotes % 2 == 0:
+				records.append(b"\n".join(self._pending))
+				self._reset()
+			elif self._pending_bytes > self.max_bytes:
+				records.append(MALFORMED)
+				lines.extendleft(reversed(self._pending[1:]))
+				self._reset()
+
+	def _malformed_line(self, records: list[bytes]):
+		# a line too long to keep ends an open CSV record as well
+		self._drain(records)
+		records.append(MALFORMED)
+
+	def _drain(self, records: list[bytes]):
+		"""Ends an open CSV record as malformed: its first line is the bad row, the lines after it are split again."""
+		while self._pending:
+			pending = self._pending
+			self._reset()
+			records.append(MALFORMED)
+			for line in pending[1:]:
+				self._add(line, records)
+
+	def _reset(self):
+		self._pending, self._pending_bytes, self._quotes = [], 0, 0
+
+
+async def read_records(chunks: AsyncIterator[bytes], format: ImportFormat, max_bytes: int = MAX_RECORD_BYTES) -> AsyncIterator[bytes]:
+	"""Splits a byte stream into records with a `RecordSplitter`, so memory stays flat even if the input is malformed."""
+	splitter = RecordSplitter(format, max_bytes)
+	async for chunk in chunks:
+		for record in splitter.feed(chunk):
+			yield record
+	for record in splitter.close():
+		yield record
+
+
+async def read_file(path: str, block_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+	# read on a thread, like everything blocking done from the event loop
+	f = await asyncio.to_thread(open, path, "rb")
+	try:
+		while block := await asyncio.to_thread(f.read, block_size):
+			yield block
+	finally:
+		f.close()
+
+
+def apply_records(school: School, kind: ImportKind, records: list[tuple[int, dict]], existing: ExistingPolicy, progress: ImportProgress):
+	"""Applies validated records to the school through its usual mutations, counting them in `progress`."""
+	for row, record in records:
+		if kind == "students":
+			if record["student_id"] in school.students:
+				if existing == "error":
+					progress.fail(row, f"Student {record['student_id']} already exists")
+				else:
+					progress.skipped += 1
+				continue
+
+			data = {"student_id": record["student_id"], "name": record["student_name"], "age": record["student_age"], "grades": {}}
+			if record["thesis_topic"] is not None:
+				data["thesis_topic"] = record["thesis_topic"]
+			# validated by `validate_chunk` already
+			school.add_student(Student.from_trusted(data))
+
+		elif kind == "courses":
+			if record["course_code"] in school.courses:
+				if existing == "error":
+					progress.fail(row, f"Course {record['course_code']} already exists")
+				else:
+					progress.skipped += 1
+				continue
+
+			school.add_course(Course(course_code=record["course_code"], course_name=record["course_name"]))
+
+		else:
+			student_id, course_code = record["student_id"], record["course_code"]
+			course = school.courses.get(course_code)
+			if student_id not in school.students:
+				progress.fail(row, f"Student {student_id} not found")
+				continue
+			if course is None:
+				progress.fail(row, f"Course {course_code} not found")
+				continue
+
+			if student_id not in course.enrolled_students:
+				school.enroll_student(course_code, student_id)
+			school.set_student_grades(student_id, course_code, record["grades"])
+
+		progress.applied += 1
+
+
+async def import_records(
+	config: Config,
+	chunks: AsyncIterator[bytes],
+	progress: ImportProgress,
+	skip: int = 0,
+	existing: ExistingPolicy = "skip",
+	workers: int = 0,
+	chunk_size: int = 5000,
+	on_progress: Callable[[ImportProgress], None] | None = None,
+) -> ImportProgress:
+	"""
+	Imports the NDJSON or CSV records of `chunks` into `config.school`, `chunk_size` rows at a time, skipping the first
+	`skip` rows. With `workers` above 1 chunks are validated in that many processes, at most two chunks each ahead
+	of the one being applied. Persisting is left to the caller, once it returns.
+
+	Raises ValueError if a CSV header misses a required column.
+	"""
+	kind, format = progress.kind, progress.format
+	loop = asyncio.get_running_loop()
+	# spawned rather than forked: forking a process that runs threads (the persistence writer's) may deadlock the child
+	pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) if workers > 1 else None
+	# validated chunks not yet applied, with the number of the last row of each
+	pending: collections.deque[tuple[int, asyncio.Future]] = collections.deque()
+	header: list[str] | None = None
+	batch: list[bytes] = []
+	row = 0
+
+	def apply(end: int, result: tuple[list[tuple[int, dict]], list[tuple[int, str]]]):
+		valid, errors = result
+		reported = len(progress.errors)
+		for error_row, error in errors:
+			progress.fail(error_row, error)
+		# the school may be swapped by a reload in between, so it is looked up for every chunk
+		apply_records(config.school, kind, valid, existing, progress)
+		# validation and apply errors of the chunk, in row order
+		progress.errors[reported:] = sorted(progress.errors[reported:], key=lambda error: error["row"])
+		progress.rows = end
+		progress.elapsed = time.time() - progress.started
+		if on_progress is not None:
+			on_progress(progress)
+
+	async def submit():
+		nonlocal batch, row
+		start, row = row + 1, row + len(batch)
+		records, batch = batch, []
+		if row <= skip:
+			progress.rows = row
+			return
+		if start <= skip:
+			records, start = records[skip - start + 1 :], skip + 1
+
+		if pool is None:
+			apply(row, validate_chunk(kind, format, header, start, records))
+			# a large import would otherwise hold the event loop until it is done
+			await asyncio.sleep(0)
+			return
+
+		pending.append((row, loop.run_in_executor(pool, validate_chunk, kind, format, header, start, records)))
+		while len(pending) >= 2 * workers:
+			end, future = pending.popleft()
+			apply(end, await future)
+
+	try:
+		async for record in read_records(chunks, format):
+			if format == "csv" and header is None:
+				header = read_header(kind, record)
+				continue
+			batch.append(record)
+			if len(batch) >= chunk_size:
+				await submit()
+		if batch:
+			await submit()
+		while pending:
+			end, future = pending.popleft()
+			apply(end, await future)
+		progress.done = True
+	finally:
+		progress.elapsed = time.time() - progress.started
+		if pool is not None:
+			pool.shutdown(wait=False, cancel_futures=True)
+
+	return progress
+
+
+def detect_format(path: str) -> ImportFormat:
+	return "csv" if os.path.splitext(path)[1].lower() == ".csv" else "ndjson"
+
+
+async def run(args: argparse.Namespace) -> ImportProgress:
+	config = Config(args.config)
+	config.read()
+
+	last_report = 0.0
+
+	def report(progress: ImportProgress):
+		nonlocal last_report
+		now = time.monotonic()
+		if now - last_report >= 1:
+			last_report = now
+			print(f"{progress.rows} rows, {progress.applied} applied, {progress.skipped} skipped, {progress.failed} failed", file=sys.stderr)
+
+	progress = ImportProgress(args.kind, args.format or detect_format(args.path), max_errors=args.max_errors)
+	try:
+		await import_records(config, read_file(args.path), progress, skip=args.skip, existing=args.existing, workers=args.workers, chunk_size=args.chunk_size, on_progress=report)
+	finally:
+		# what was applied is kept even if the import failed half way, so it can be resumed with --skip
+		if progress.applied:
+			config.save()
+	return progress
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("path", help="NDJSON or CSV file")
+	parser.add_argument("--kind", choices=KINDS, required=True)
+	parser.add_argument("--format", choices=FORMATS, help="detected from the file extension by default")
+	parser.add_argument("--config", default="config.json")
+	parser.add_argument("--skip", type=int, default=0, help="rows to skip, e.g. the rows an interrupted import reported")
+	parser.add_argument("--existing", choices=("skip", "error"), default="skip", help="what to do with students and courses that already exist")
+	parser.add_argument("--workers", type=int, default=0, help="processes validating rows, 0 to validate in this one")
+	parser.add_argument("--chunk-size", type=int, default=5000)
+	parser.add_argument("--max-errors", type=int, default=1000, help="failed rows to report")
+	args = parser.parse_args()
+
+	try:
+		progress = asyncio.run(run(args))
+	except ValueError as e:
+		parser.error(str(e))
+
+	summary = progress.as_dict()
+	for error in summary.pop("errors"):
+		print(f"row {error['row']}: {error['error']}", file=sys.stderr)
+	print(orjson.dumps(summary).decode())
+	sys.exit(1 if progress.failed else 0)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,70 @@
+import bisect
+import math
+
+
+class SortedIndex:
+	"""
+	A value per student (e.g. age, average grade) kept sorted in one list of (value, student_id), ties by ascending
+	student id; with `descending` the values are stored negated, so the highest come first. A page of `k` from `offset`
+	is a slice and a value range two bisects, O(log n + k); an update is a bisect plus a list insert/delete, a memmove
+	that stays cheap far beyond school sizes.
+	"""
+
+	def __init__(self, descending: bool = False):
+		self.descending = descending
+		self._entries: list[tuple[float, int]] = []
+		self._values: dict[int, float] = {}
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	def _key(self, value: float) -> float:
+		return -value if self.descending else value
+
+	def build(self, values: dict[int, float]):
+		self._values = dict(values)
+		self._entries = sorted((self._key(value), student_id) for student_id, value in self._values.items())
+
+	def get(self, student_id: int) -> float | None:
+		return self._values.get(student_id)
+
+	def update(self, student_id: int, value: float):
+		old = self._values.get(student_id)
+		if old == value:
+			return
+		if old is not None:
+			del self._entries[bisect.bisect_left(self._entries, (self._key(old), student_id))]
+
+		self._values[student_id] = value
+		bisect.insort(self._entries, (self._key(value), student_id))
+
+	def remove(self, student_id: int):
+		old = self._values.pop(student_id, None)
+		if old is not None:
+			del self._entries[bisect.bisect_left(self._entries, (self._key(old), student_id))]
+
+	def rank(self, student_id: int) -> int | None:
+		"""The 0-based position of a student, None if it isn't indexed."""
+		value = self._values.get(student_id)
+		return None if value is None else bisect.bisect_left(self._entries, (self._key(value), student_id))
+
+	def page(self, offset: int, k: int) -> list[tuple[int, float]]:
+		"""The (student_id, value) pairs at positions `offset` to `offset + k - 1`."""
+		return [(student_id, self._key(key)) for key, student_id in self._entries[offset : offset + k]]
+
+	def _bounds(self, low: float | None, high: float | None) -> tuple[int, int]:
+		low = -math.inf if low is None else low
+		high = math.inf if high is None else high
+		if self.descending:
+			low, high = -high, -low
+		return bisect.bisect_left(self._entries, (low, -math.inf)), bisect.bisect_right(self._entries, (high, math.inf))
+
+	def count_between(self, low: float | None, high: float | None) -> int:
+		"""The number of students with a value in [low, high], None bounds being open."""
+		start, end = self._bounds(low, high)
+		return max(end - start, 0)
+
+	def between(self, low: float | None, high: float | None) -> list[int]:
+		"""The ids of the students with a value in [low, high], in index order."""
+		start, end = self._bounds(low, high)
+		return [student_id for _, student_id in self._entries[start:end]]
@@ -0,0 +1,86 @@
+from collections.abc import Callable
+from typing import Any
+
+from .versioned import VersionedDict
+
+_MISSING = object()
+
+
+class LazyDict(VersionedDict):
+	"""
+	A dict holding raw records that `hydrate` turns into models on first access, so loading doesn't pay for records
+	nobody reads. Keys, `in` and `copy` never hydrate, `values`, `items` and comparisons hydrate everything once.
+	Hydrating doesn't count as a change for views, which hydrate models of their own.
+	"""
+
+	__slots__ = ("_hydrate", "_hydrated")
+
+	def __init__(self, hydrate: Callable[[dict], Any], raw: dict):
+		super().__init__(raw)
+		self._hydrate = hydrate
+		self._hydrated = not raw
+
+	def _value(self, key: Any, value: Any) -> Any:
+		if type(value) is dict:
+			value = self._hydrate(value)
+			dict.__setitem__(self, key, value)
+		return value
+
+	def __getitem__(self, key: Any) -> Any:
+		return self._value(key, dict.__getitem__(self, key))
+
+	def get(self, key: Any, default: Any = None) -> Any:
+		value = dict.get(self, key, _MISSING)
+		return default if value is _MISSING else self._value(key, value)
+
+	def pop(self, key: Any, *default: Any) -> Any:
+		if key not in self:
+			return super().pop(key, *default)
+		return self._model(super().pop(key))
+
+	def _model(self, value: Any) -> Any:
+		return self._hydrate(value) if type(value) is dict else value
+
+	def hydrate_all(self):
+		if self._hydrated:
+			return
+		for key, value in dict.items(self):
+			if type(value) is dict:
+				# replacing values of existing keys is safe while iterating
+				dict.__setitem__(self, key, self._hydrate(value))
+		self._hydrated = True
+
+	@property
+	def hydrated(self) -> int:
+		"""Number of records turned into models so far."""
+		return sum(type(value) is not dict for value in dict.values(self))
+
+	def values(self):
+		self.hydrate_all()
+		return dict.values(self)
+
+	def items(self):
+		self.hydrate_all()
+		return dict.items(self)
+
+	def __eq__(self, other: object) -> bool:
+		self.hydrate_all()
+		return dict.__eq__(self, other)
+
+	def __ne__(self, other: object) -> bool:
+		self.hydrate_all()
+		return dict.__ne__(self, other)
+
+	def __repr__(self) -> str:
+		self.hydrate_all()
+		return dict.__repr__(self)
+
+	def __reduce__(self):
+		return type(self), (self._hydrate, dict(self))
+
+	def copy(self) -> "LazyDict":
+		"""A shallow copy sharing the records, each copy hydrates its own models from them."""
+		copied = LazyDict(self._hydrate, {})
+		dict.update(copied, self)
+		copied._hydrated = self._hydrated
+		return copied
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from typing import TypeAlias
+
+# a write job is captured on the event loop and returns the disk work to run on a thread, which returns the bytes written
+WriteJob: TypeAlias = Callable[[], int]
+
+
+def atomic_write(path: str, data: bytes, fsync: bool = True):
+	"""Writes `data` to a temporary file next to `path` and renames it over `path`, so readers never see a partial file."""
+	temp_path = f"{path}.tmp"
+
+	with open(temp_path, "wb") as f:
+		f.write(data)
+		if fsync:
+			f.flush()
+			os.fsync(f.fileno())
+
+	os.replace(temp_path, path)
+	if fsync:
+		fsync_directory(path)
+
+
+def append(path: str, data: bytes, fsync: bool = True):
+	created = fsync and not os.path.exists(path)
+	with open(path, "ab") as f:
+		f.write(data)
+		if fsync:
+			f.flush()
+			os.fsync(f.fileno())
+	if created:
+		fsync_directory(path)
+
+
+def fsync_directory(path: str):
+	"""Flushes the directory entry of `path`, so a rename or a new file survives a crash as well as its contents."""
+	if not hasattr(os, "O_DIRECTORY"):  # Windows cannot open a directory, and its renames need no flush
+		return
+	fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+
+@dataclass()
+class PersistenceStats:
+	mutations: int = 0
+	coalesced: int = 0
+	flushes: int = 0
+	errors: int = 0
+	bytes_written: int = 0
+	last_flush_ms: float = 0.0
+	max_flush_ms: float = 0.0
+	total_flush_ms: float = 0.0
+
+	def as_dict(self) -> dict:
+		data = asdict(self)
+		data["average_flush_ms"] = self.total_flush_ms / self.flushes if self.flushes else 0.0
+		return data
+
+
+class PersistenceWriter:
+	"""
+	Coalesces mutations into background writes.
+
+	`mark_dirty` only flags the state; a task on the event loop waits up to `max_staleness` seconds for more mutations,
+	captures what to write on the loop and runs the disk work on a thread. Every mutation marked before a capture is
+	durable once that flush completes.
+	"""
+
+	def __init__(self, capture: Callable[[], WriteJob], max_staleness: float = 0.05):
+		self.max_staleness = max_staleness
+		self.stats = PersistenceStats()
+		# serializes disk work between the background writer and synchronous saves
+		self.lock = threading.Lock()
+
+		self._capture = capture
+		self._loop: asyncio.AbstractEventLoop | None = None
+		self._task: asyncio.Task | None = None
+		self._urgent: asyncio.Event | None = None
+		self._waiter: asyncio.Future | None = None
+		self._inflight: asyncio.Future | None = None
+
+	@property
+	def dirty(self) -> bool:
+		return self._waiter is not None
+
+	def mark_dirty(self) -> asyncio.Future:
+		"""Schedules a flush and returns a future resolved once the current state is on disk."""
+		self._adopt_loop()
+
+		self.stats.mutations += 1
+		if self._waiter is None:
+			self._waiter = self._loop.create_future()
+			self._schedule()
+		else:
+			self.stats.coalesced += 1
+
+		return self._waiter
+
+	async def flush(self):
+		"""Writes pending mutations now and waits for every started flush to finish."""
+		self._adopt_loop()
+
+		if self._inflight is not None:
+			await asyncio.shield(self._inflight)
+
+		if self._waiter is not None:
+			waiter = self._waiter
+			self._urgent.set()
+			await asyncio.shield(waiter)
+
+	def _adopt_loop(self):
+		"""Moves the writer to the running loop; pending mutations live in the captured state, so only the futures are replaced."""
+		loop = asyncio.get_running_loop()
+		if loop is self._loop:
+			return
+
+		dirty = self._waiter is not None
+		self._loop = loop
+		self._task = None
+		self._urgent = asyncio.Event()
+		self._inflight = None
+		self._waiter = loop.create_future() if dirty else None
+		if dirty:
+			self._schedule()
+
+	def _schedule(self):
+		if self._task is None or self._task.done():
+			self._task = self._loop.create_task(self._run())
+
+	async def _run(self):
+		while self._waiter is not None:
+			try:
+				await asyncio.wait_for(self._urgent.wait(), self.max_staleness)
+			except TimeoutError:
+				pass
+			self._urgent.clear()
+
+			await self._flush()
+
+	async def _flush(self):
+		waiter, self._waiter = self._waiter, None
+		self._inflight = waiter
+
+		start = time.perf_counter()
+		try:
+			job = self._capture()
+			written = await asyncio.to_thread(self._locked, job)
+		except Exception as e:  # noqa: BLE001
+			# whatever failed must reach the durable waiters rather than end the writer task
+			self.stats.errors += 1
+			print(f"Persistence error: {e!r}")
+			waiter.set_exception(e)
+			# only durable requests await the waiter, don't warn about nobody retrieving the error
+			waiter.exception()
+		else:
+			elapsed = (time.perf_counter() - start) * 1000
+			self.stats.flushes += 1
+			self.stats.bytes_written += written
+			self.stats.last_flush_ms = elapsed
+			self.stats.max_flush_ms = max(self.stats.max_flush_ms, elapsed)
+			self.stats.total_flush_ms += elapsed
+			waiter.set_result(None)
+		finally:
+			self._inflight = None
+
+	def _locked(self, job: WriteJob) -> int:
+		with self.lock:
+			return job()
@@ -1,31 +1,720 @@
+import bisect
+import collections
+import copy
+import threading
+import uuid
+import weakref
+from collections.abc import Callable, Iterable
+from typing import TypeAlias
+
 import pydantic
 
 from models import Course, GraduateStudent, Student
 
+from .indexes import SortedIndex
+from .lazy import LazyDict
+from .search import StudentSearchIndex
+from .stats import all_course_grades, course_grades, summarize
+from .versioned import VersionedDict, VersionedView
+
+Listener: TypeAlias = Callable[[str, int], None]
+# (version, kind, key, event, fields), see `add_event_listener`
+EventListener: TypeAlias = Callable[[int, str, int, str, dict], None]
+
+
+def release(entries: dict):
+	"""
+	Empties a large dict one entry at a time, on a thread: dropping the last reference to it frees every value in one
+	call instead, holding the GIL and stalling the event loop for as long.
+	"""
+	while entries:
+		dict.popitem(entries)
+
+
+class _SnapshotToken:
+	"""Held by a snapshot and weakly referenced by its school, so the school knows while the snapshot is in use."""
+
+	__slots__ = ("__weakref__",)
+
 
 class School(pydantic.BaseModel):
+	"""
+	Students and courses with the indexes and versions kept along with them.
+
+	`snapshot` returns a read-only School frozen at the current version, for readers that iterate across awaits. While
+	one is in use, mutations copy a student, course or enrollment set before changing it instead of changing the
+	object the snapshot shares (copy-on-write), so snapshots never see later writes. The dicts are `VersionedDict`s,
+	which a snapshot reads through views, so taking one copies none of them.
+	"""
+
 	students: dict[int, Student | GraduateStudent] = pydantic.Field(default_factory=dict)
 	courses: dict[int, Course] = pydantic.Field(default_factory=dict)
 
+	_listeners: list[Listener] = pydantic.PrivateAttr(default_factory=list)
+	_event_listeners: list[EventListener] = pydantic.PrivateAttr(default_factory=list)
+	# versions start over with every School (e.g. after a reload), the epoch tells them apart
+	_epoch: str = pydantic.PrivateAttr(default_factory=lambda: uuid.uuid4().hex[:12])
+	_version: int = pydantic.PrivateAttr(default=0)
+	_entity_versions: dict[tuple[str, int], int] = pydantic.PrivateAttr(default_factory=VersionedDict)
+	_collection_versions: dict[str, int] = pydantic.PrivateAttr(default_factory=dict)
+	_student_courses: dict[int, set[int]] = pydantic.PrivateAttr(default_factory=VersionedDict)
+	# course code -> version of the last change of anyone's grades in the course
+	_grades_versions: dict[int, int] = pydantic.PrivateAttr(default_factory=VersionedDict)
+	# course code -> (course_stats_version, stats) of the last computation; a snapshot's falls back to its school's
+	_course_stats: dict[int, tuple[int, dict]] = pydantic.PrivateAttr(default_factory=dict)
+	_search_index: StudentSearchIndex | None = pydantic.PrivateAttr(default=None)
+	# (student_id, name or None if removed) of writes since the last search, which applies them: searches may run on
+	# worker threads, only they touch the index
+	_search_updates: collections.deque[tuple[int, str | None]] = pydantic.PrivateAttr(default_factory=collections.deque)
+	_search_lock: threading.Lock = pydantic.PrivateAttr(default_factory=threading.Lock)
+	# students by total average grade and, per course, by course average; built on first use
+	_rank_index: SortedIndex | None = pydantic.PrivateAttr(default=None)
+	_course_rank_indexes: dict[int, SortedIndex] = pydantic.PrivateAttr(default_factory=dict)
+	# students by age and the ids of the graduate students, for filtering; built on first use
+	_age_index: SortedIndex | None = pydantic.PrivateAttr(default=None)
+	_graduates: set[int] | None = pydantic.PrivateAttr(default=None)
+	# sorted student ids and course codes for cursor pagination, built on first use; the kinds whose list a snapshot
+	# shares are copied before they change
+	_sorted_ids: dict[str, list[int]] = pydantic.PrivateAttr(default_factory=dict)
+	_shared_sorted_ids: set[str] = pydantic.PrivateAttr(default_factory=set)
+	_frozen: bool = pydantic.PrivateAttr(default=False)
+	# (version, token) of every snapshot taken, oldest first; dead ones are dropped from the end
+	_snapshot_tokens: list[tuple[int, weakref.ref]] = pydantic.PrivateAttr(default_factory=list)
+	_snapshot_token: _SnapshotToken | None = pydantic.PrivateAttr(default=None)
+	_latest_snapshot: "weakref.ref[School] | None" = pydantic.PrivateAttr(default=None)
+
+	def model_post_init(self, context):
+		for name in ("students", "courses"):
+			if not isinstance(self.__dict__[name], VersionedDict):
+				self.__dict__[name] = VersionedDict(self.__dict__[name])
+		self.rebuild_index()
+
+	# private attributes are only found by __getattr__, after the usual lookup fails, and pydantic's checks each one
+	# for a descriptor first, as its __setattr__ does; that costs more than the rest of a small mutation, which reads
+	# and writes a dozen of them. None of School's are descriptors
+	def __getattr__(self, name: str):
+		# unset until pydantic initializes the private attributes, e.g. while model_construct runs model_post_init
+		if name != "__pydantic_private__":
+			private = self.__pydantic_private__
+			if private is not None and name in private:
+				return private[name]
+		return super().__getattr__(name)
+
+	def __setattr__(self, name: str, value):
+		private = self.__pydantic_private__
+		if private is not None and name in private:
+			private[name] = value
+		else:
+			super().__setattr__(name, value)
+
+	@classmethod
+	def from_trusted(cls, data: dict, lazy: bool = False, validate: Iterable[tuple[str, int]] = ()) -> "School":
+		"""
+		Builds a school from raw data this app wrote itself, skipping validation but for the `validate` students and
+		courses, as ("student", student_id) or ("course", course_code). With `lazy`, students stay raw until first accessed.
+		"""
+		students = {int(student_id): student for student_id, student in data.get("students", {}).items()}
+		courses = {int(course_code): course for course_code, course in data.get("courses", {}).items()}
+
+		validate = set(validate)
+		checked = cls(
+			students={key: students[key] for kind, key in validate if kind == "student" and key in students},
+			courses={key: courses[key] for kind, key in validate if kind == "course" and key in courses},
+		)
+		students.update(checked.students)
+		courses = {course_code: checked.courses.get(course_code) or Course.from_trusted(course) for course_code, course in courses.items()}
+
+		if lazy:
+			students = LazyDict(Student.from_trusted, students)
+		else:
+			students = {student_id: Student.from_trusted(student) if type(student) is dict else student for student_id, student in students.items()}
+
+		return cls.model_construct(students=students, courses=courses)
+
+	@classmethod
+	def validate_chunked(cls, data: dict, chunk_size: int = 1000) -> "School":
+		"""
+		Validates raw data as `School(**data)` does, `chunk_size` students or courses at a time: validating a large school
+		in one call holds the GIL for as long, stalling the event loop while a thread loads it.
+		"""
+		validated = {}
+		for kind in ("students", "courses"):
+			items = list(data.get(kind, {}).items())
+			validated[kind] = {}
+			for i in range(0, len(items), chunk_size):
+				validated[kind].update(cls.model_validate({kind: dict(items[i : i + chunk_size])}).__dict__[kind])
+		return cls.model_construct(**validated)
+
+	def release(self) -> bool:
+		"""
+		Empties the school's large dicts, see `release`, for a school nothing else holds anymore. Snapshots don't hold
+		the school but views of its dicts, it is left alone while one is alive. Returns whether it was emptied.
+		"""
+		dicts = (self.students, self.courses, self._entity_versions, self._student_courses, self._grades_versions)
+		if any(entries.viewed() for entries in dicts):
+			return False
+		for entries in dicts:
+			release(entries)
+		return True
+
+	@pydantic.field_serializer("students", mode="wrap")
+	def serialize_students(self, students: dict, handler: pydantic.SerializerFunctionWrapHandler, info: pydantic.FieldSerializationInfo) -> dict:
+		if isinstance(students, VersionedView):
+			students = students.stored()
+		if not isinstance(students, LazyDict):
+			return handler(students)
+		if info.mode != "json":
+			students.hydrate_all()
+			return handler(students)
+
+		# records never accessed are still in the JSON form they were loaded from, no need to hydrate them to dump them
+		hydrated = handler({student_id: student for student_id, student in dict.items(students) if type(student) is not dict})
+		return {str(student_id): student if type(student) is dict else hydrated[str(student_id)] for student_id, student in dict.items(students)}
+
+	@pydantic.field_serializer("courses", mode="wrap")
+	def serialize_courses(self, courses: dict, handler: pydantic.SerializerFunctionWrapHandler) -> dict:
+		return handler(courses.stored() if isinstance(courses, VersionedView) else courses)
+
+	def rebuild_index(self):
+		"""Rebuilds the student_id -> course codes index from the courses' enrolled students."""
+		index: dict[int, set[int]] = {}
+		for course in self.courses.values():
+			for student_id in course.enrolled_students:
+				index.setdefault(student_id, set()).add(course.course_code)
+		self._student_courses = VersionedDict(index)
+
+	def add_listener(self, listener: Listener):
+		"""Registers a callback invoked as `listener(kind, key)` after every mutation, where kind is "student" or "course"."""
+		self._listeners.append(listener)
+
+	def add_event_listener(self, listener: EventListener):
+		"""
+		Registers a callback invoked as `listener(version, kind, key, event, fields)` after every mutation, telling what
+		changed: "created" (the whole entity in `fields`), "updated" (the changed fields, or the whole entity when it
+		was replaced), "deleted", "grades" of a student in a course, or a student "enrolled"/"unenrolled" to a course.
+		Fields may hold models, to be dumped by the listener if it needs them.
+		"""
+		self._event_listeners.append(listener)
+
+	@property
+	def epoch(self) -> str:
+		return self._epoch
+
+	@property
+	def version(self) -> int:
+		"""Incremented by every mutation."""
+		return self._version
+
+	def entity_version(self, kind: str, key: int) -> int:
+		"""Returns the version of the last mutation of one student or course, 0 if it wasn't changed since loading."""
+		return self._entity_versions.get((kind, key), 0)
+
+	def entity_versions(self, kind: str, keys: Iterable[int]) -> tuple[int, ...]:
+		"""`entity_version` of many students or courses at once."""
+		versions = self._entity_versions
+		return tuple(versions.get((kind, key), 0) for key in keys)
+
+	def collection_version(self, kind: str) -> int:
+		"""Returns the version of the last mutation of any student or course."""
+		return self._collection_versions.get(kind, 0)
+
+	def changed_since(self, kind: str, version: int) -> list[int]:
+		"""
+		The students or courses mutated (removed ones included) after `version` of this epoch, ascending. With kind
+		"enrollments", the students enrolled to or unenrolled from a course, including by its removal.
+		"""
+		return sorted(key for (entity_kind, key), entity_version in self._entity_versions.items() if entity_kind == kind and entity_version > version)
+
+	@property
+	def frozen(self) -> bool:
+		return self._frozen
+
+	def snapshot(self) -> "School":
+		"""
+		Returns a read-only copy of the school at the current version, shared by callers until the next mutation. It costs
+		O(1): the dicts are read through views and entities are shared until they are mutated.
+		"""
+		if self._frozen:
+			return self
+
+		latest = self._latest_snapshot() if self._latest_snapshot is not None else None
+		if latest is not None and latest._version == self._version:
+			return latest
+
+		snapshot = copy.copy(self)
+		snapshot.__dict__["students"] = self.students.view()
+		snapshot.__dict__["courses"] = self.courses.view()
+		snapshot._listeners = []
+		snapshot._event_listeners = []
+		snapshot._entity_versions = self._entity_versions.view()
+		snapshot._collection_versions = self._collection_versions.copy()
+		snapshot._student_courses = self._student_courses.view()
+		snapshot._grades_versions = self._grades_versions.view()
+		# cached stats carry their version, the school's are right for the snapshot as long as that matches
+		snapshot._course_stats = collections.ChainMap({}, self._course_stats)
+		snapshot._search_index = None
+		snapshot._search_updates = collections.deque()
+		snapshot._search_lock = threading.Lock()
+		snapshot._rank_index = None
+		snapshot._course_rank_indexes = {}
+		snapshot._age_index = None
+		snapshot._graduates = None
+		snapshot._sorted_ids = self._sorted_ids.copy()
+		snapshot._shared_sorted_ids = set()
+		self._shared_sorted_ids = set(self._sorted_ids)
+		snapshot._frozen = True
+		snapshot._snapshot_tokens = []
+		snapshot._snapshot_token = token = _SnapshotToken()
+		snapshot._latest_snapshot = None
+
+		self._snapshot_tokens.append((self._version, weakref.ref(token)))
+		self._latest_snapshot = weakref.ref(snapshot)
+		return snapshot
+
+	def _shared_version(self) -> int:
+		"""The version of the newest snapshot in use, -1 if none is: entities not mutated since are shared with it."""
+		tokens = self._snapshot_tokens
+		while tokens:
+			version, token = tokens[-1]
+			if token() is not None:
+				return version
+			tokens.pop()
+		return -1
+
+	def _writable(self):
+		if self._frozen:
+			raise RuntimeError("School snapshots are read-only")
+
+	def _own_student(self, student_id: int) -> Student:
+		"""Returns the student to mutate, copied first if a snapshot shares it."""
+		self._writable()
+		student = self.students[student_id]
+		if self._entity_versions.get(("student", student_id), 0) <= self._shared_version():
+			student = self.students[student_id] = student.model_copy(update={"grades": student.grades.copy()})
+		return student
+
+	def _own_course(self, course_code: int) -> Course:
+		"""Returns the course to mutate, copied first if a snapshot shares it."""
+		self._writable()
+		course = self.courses[course_code]
+		if self._entity_versions.get(("course", course_code), 0) <= self._shared_version():
+			course = self.courses[course_code] = course.model_copy(update={"enrolled_students": set(course.enrolled_students)})
+		return course
+
+	def _enrollment_added(self, student_id: int, course_code: int):
+		self._enrollment_changed(student_id)
+		courses = self._student_courses.get(student_id)
+		if courses is None:
+			self._student_courses[student_id] = {course_code}
+		elif self._shared_version() >= 0:
+			self._student_courses[student_id] = courses | {course_code}
+		else:
+			courses.add(course_code)
+
+	def _enrollment_removed(self, student_id: int, course_code: int):
+		courses = self._student_courses.get(student_id)
+		if courses is None or course_code not in courses:
+			return
+		self._enrollment_changed(student_id)
+		if self._shared_version() >= 0:
+			self._student_courses[student_id] = courses - {course_code}
+		else:
+			courses.discard(course_code)
+
+	def _enrollment_changed(self, student_id: int):
+		# called before the `_changed` of the course, whose version this is
+		self._entity_versions[("enrollments", student_id)] = self._version + 1
+
+	def _changed(self, kind: str, key: int, event: str = "updated", **fields):
+		self._version += 1
+		self._entity_versions[(kind, key)] = self._version
+		self._collection_versions[kind] = self._version
+
+		for listener in self._listeners:
+			listener(kind, key)
+		for event_listener in self._event_listeners:
+			event_listener(self._version, kind, key, event, fields)
+
+	def _grades_changed(self, course_codes: Iterable[int]):
+		for course_code in course_codes:
+			self._grades_versions[course_code] = self._version
+
+	def _search_updated(self, student_id: int, name: str | None):
+		if self._search_index is None:
+			return
+		self._search_updates.append((student_id, name))
+		if len(self._search_updates) > max(len(self.students), 1024):
+			# more writes than students since the last search (e.g. an import), rebuilding is cheaper than catching up
+			self._search_index = None
+			self._search_updates = collections.deque()
+
+	def _reindex(self, student_id: int):
+		"""Updates a student's age and graduate partition entries, if those indexes were built."""
+		if self._age_index is None:
+			return
+
+		student = self.students.get(student_id)
+		if student is None:
+			self._age_index.remove(student_id)
+			self._graduates.discard(student_id)
+			return
+
+		self._age_index.update(student_id, student.age)
+		if isinstance(student, GraduateStudent):
+			self._graduates.add(student_id)
+		else:
+			self._graduates.discard(student_id)
+
+	def _rerank(self, student_id: int, course_codes: Iterable[int]):
+		"""Updates a student's rank overall and in the given courses, in the rank indexes built so far."""
+		student = self.students.get(student_id)
+		if self._rank_index is not None:
+			if student is None:
+				self._rank_index.remove(student_id)
+			else:
+				self._rank_index.update(student_id, student.calculate_total_average_grade())
+
+		enrolled = self._student_courses.get(student_id, ())
+		for course_code in course_codes:
+			index = self._course_rank_indexes.get(course_code)
+			if index is None:
+				continue
+			if student is None or course_code not in enrolled:
+				index.remove(student_id)
+			else:
+				index.update(student_id, student.calculate_course_average_grades(course_code))
+
+	def _sorted_keys(self, kind: str) -> list[int]:
+		keys = self._sorted_ids.get(kind)
+		if keys is None:
+			keys = self._sorted_ids[kind] = sorted(self.students if kind == "student" else self.courses)
+		return keys
+
+	def _own_sorted_keys(self, kind: str) -> list[int] | None:
+		"""Returns the sorted keys to mutate, if built, copied first if a snapshot shares them."""
+		keys = self._sorted_ids.get(kind)
+		if keys is not None and kind in self._shared_sorted_ids:
+			self._shared_sorted_ids.discard(kind)
+			if self._shared_version() >= 0:
+				keys = self._sorted_ids[kind] = keys.copy()
+		return keys
+
+	def _key_added(self, kind: str, key: int):
+		if (keys := self._own_sorted_keys(kind)) is not None:
+			bisect.insort(keys, key)
+
+	def _key_removed(self, kind: str, key: int):
+		if (keys := self._own_sorted_keys(kind)) is not None:
+			del keys[bisect.bisect_left(keys, key)]
+
+	def _page(self, kind: str, after_id: int | None, limit: int | None, keys: list[int] | None = None) -> list[int]:
+		keys = self._sorted_keys(kind) if keys is None else keys
+		start = 0 if after_id is None else bisect.bisect_right(keys, after_id)
+		return keys[start:] if limit is None else keys[start : start + limit]
+
+	def page_students(self, after_id: int | None = None, limit: int | None = None, ids: list[int] | None = None) -> list[Student]:
+		"""Returns up to `limit` students ordered by id, starting after `after_id`, out of `ids` (sorted) if given, e.g. from `filter_students`."""
+		return [self.students[student_id] for student_id in self._page("student", after_id, limit, ids)]
+
+	def page_courses(self, after_id: int | None = None, limit: int | None = None) -> list[Course]:
+		"""Returns up to `limit` courses ordered by code, starting after `after_id`."""
+		return [self.courses[course_code] for course_code in self._page("course", after_id, limit)]
+
 	def add_student(self, student: Student):
+		self._writable()
 		if student.student_id in self.students:
 			raise ValueError(f"Student with id {student.student_id} already exists")
 		self.students[student.student_id] = student
+		self._key_added("student", student.student_id)
+		self._search_updated(student.student_id, student.name)
+		self._changed("student", student.student_id, "created", student=student)
+		self._grades_changed(student.grades)
+		self._reindex(student.student_id)
+		self._rerank(student.student_id, self._student_courses.get(student.student_id, ()))
 
 	def remove_student(self, student_id: int):
+		self._writable()
 		if student_id not in self.students:
 			raise ValueError(f"Student with id {student_id} does not exist")
-		del self.students[student_id]
+		student = self.students.pop(student_id)
+		self._key_removed("student", student_id)
+		self._search_updated(student_id, None)
+		self._changed("student", student_id, "deleted")
+		self._grades_changed(student.grades)
+
+		course_codes = self._student_courses.pop(student_id, ())
+		for course_code in course_codes:
+			course = self._own_course(course_code)
+			course.enrolled_students.discard(student_id)
+			self._changed("course", course_code, "unenrolled", student_id=student_id)
+		self._reindex(student_id)
+		self._rerank(student_id, course_codes)
+
+	def update_student(self, student_id: int, name: str | None = None, age: int | None = None) -> Student:
+		student = self._own_student(student_id)
+		changed = {}
+
+		if name is not None:
+			student.name = name
+			changed["name"] = name
+			self._search_updated(student_id, name)
+
+		if age is not None:
+			student.age = age
+			changed["age"] = age
+			self._reindex(student_id)
+
+		self._changed("student", student_id, **changed)
+		return student
+
+	def set_student_grades(self, student_id: int, course_code: int, grades: list[int]) -> Student:
+		student = self._own_student(student_id)
+		student.set_course_grades(course_code, grades)
+		self._changed("student", student_id, "grades", course_code=course_code, grades=student.grades.get(course_code, []))
+		self._grades_changed((course_code,))
+		self._rerank(student_id, (course_code,))
+		return student
 
 	def add_course(self, course: Course):
+		self._writable()
 		if course.course_code in self.courses:
 			raise ValueError(f"Course with code {course.course_code} already exists")
 		self.courses[course.course_code] = course
+		self._key_added("course", course.course_code)
+		for student_id in course.enrolled_students:
+			self._enrollment_added(student_id, course.course_code)
+		self._course_rank_indexes.pop(course.course_code, None)
+		self._changed("course", course.course_code, "created", course=course)
 
 	def remove_course(self, course_code: int):
+		self._writable()
 		if course_code not in self.courses:
 			raise ValueError(f"Course with code {course_code} does not exist")
-		del self.courses[course_code]
+		course = self.courses.pop(course_code)
+		self._key_removed("course", course_code)
+		for student_id in course.enrolled_students:
+			self._enrollment_removed(student_id, course_code)
+		self._course_rank_indexes.pop(course_code, None)
+		self._changed("course", course_code, "deleted")
+
+	def update_course(self, course_code: int, course_name: str) -> Course:
+		course = self._own_course(course_code)
+		course.course_name = course_name
+		self._changed("course", course_code, course_name=course_name)
+		return course
+
+	def enroll_student(self, course_code: int, student_id: int) -> Course:
+		course = self._own_course(course_code)
+		course.enrolled_students.add(student_id)
+		self._enrollment_added(student_id, course_code)
+		self._changed("course", course_code, "enrolled", student_id=student_id)
+		self._rerank(student_id, (course_code,))
+		return course
+
+	def unenroll_student(self, course_code: int, student_id: int) -> Course:
+		course = self._own_course(course_code)
+		course.enrolled_students.discard(student_id)
+		self._enrollment_removed(student_id, course_code)
+		self._changed("course", course_code, "unenrolled", student_id=student_id)
+		self._rerank(student_id, (course_code,))
+		return course
+
+	def put_student(self, student_id: int, student: Student | None):
+		"""Replaces or adds a student as a whole, or removes it if None, e.g. with a copy another worker stored. Enrollments are left to the courses."""
+		self._writable()
+		old = self.students.get(student_id)
+		if student is None:
+			if old is None:
+				return
+			del self.students[student_id]
+			self._key_removed("student", student_id)
+			self._search_updated(student_id, None)
+		else:
+			self.students[student_id] = student
+			if old is None:
+				self._key_added("student", student_id)
+			self._search_updated(student_id, student.name)
+		if student is None:
+			self._changed("student", student_id, "deleted")
+		else:
+			self._changed("student", student_id, "created" if old is None else "updated", student=student)
+		self._grades_changed({*(old.grades if old is not None else ()), *(student.grades if student is not None else ())})
+		self._reindex(student_id)
+		self._rerank(student_id, self._student_courses.get(student_id, ()))
+
+	def put_course(self, course_code: int, course: Course | None):
+		"""Replaces or adds a course as a whole, or removes it if None, keeping the enrollment index in sync."""
+		self._writable()
+		old = self.courses.get(course_code)
+		if old is not None:
+			for student_id in old.enrolled_students:
+				self._enrollment_removed(student_id, course_code)
+		elif course is None:
+			return
+
+		if course is None:
+			del self.courses[course_code]
+			self._key_removed("course", course_code)
+		else:
+			self.courses[course_code] = course
+			if old is None:
+				self._key_added("course", course_code)
+			for student_id in course.enrolled_students:
+				self._enrollment_added(student_id, course_code)
+		# rebuilt on the next query, the enrollments may have changed wholesale
+		self._course_rank_indexes.pop(course_code, None)
+		if course is None:
+			self._changed("course", course_code, "deleted")
+		else:
+			self._changed("course", course_code, "created" if old is None else "updated", course=course)
+
+	def course_stats_version(self, course_code: int) -> int:
+		"""The version of the last change of a course or of grades in it, which its `course_stats` depend on."""
+		return max(self._entity_versions.get(("course", course_code), 0), self._grades_versions.get(course_code, 0))
+
+	def course_stats(self, course_code: int) -> dict:
+		"""Grade statistics of a course's enrolled students, materialized until the course or grades in it change."""
+		course = self.courses[course_code]
+		version = self.course_stats_version(course_code)
+
+		cached = self._course_stats.get(course_code)
+		if cached is not None and cached[0] == version:
+			return cached[1]
+
+		stats = summarize(course, course_grades(course, self.students))
+		self._course_stats[course_code] = (version, stats)
+		return stats
+
+	def all_course_stats(self) -> dict[int, dict]:
+		"""`course_stats` of every course, the outdated ones recomputed in one batched pass over the students if that is cheaper."""
+		stale = {}
+		for course_code in self.courses:
+			version = self.course_stats_version(course_code)
+			cached = self._course_stats.get(course_code)
+			if cached is None or cached[0] != version:
+				stale[course_code] = version
+
+		# one by one costs a lookup per enrollment, the batched pass one per student
+		if sum(len(self.courses[course_code].enrolled_students) for course_code in stale) >= len(self.students):
+			grades = all_course_grades(stale, self.students, self._student_courses)
+			for course_code, version in stale.items():
+				self._course_stats[course_code] = (version, summarize(self.courses[course_code], grades[course_code]))
+
+		return {course_code: self.course_stats(course_code) for course_code in self.courses}
+
+	def top_students(self, k: int, offset: int = 0) -> list[tuple[Student, float]]:
+		"""Students by descending total average grade, ties by id, from rank `offset` on. The ranking is built on first use."""
+		return [(self.students[student_id], average) for student_id, average in self._average_index().page(offset, k)]
+
+	def top_course_students(self, course_code: int, k: int, offset: int = 0) -> list[tuple[Student, float]]:
+		"""A course's enrolled students by descending average grade in the course, as `top_students`."""
+		course = self.courses[course_code]
+		index = self._course_rank_indexes.get(course_code)
+		if index is None:
+			index = self._course_rank_indexes[course_code] = SortedIndex(descending=True)
+			students = ((student_id, self.students.get(student_id)) for student_id in course.enrolled_students)
+			index.build({student_id: student.calculate_course_average_grades(course_code) for student_id, student in students if student is not None})
+
+		return [(self.students[student_id], average) for student_id, average in index.page(offset, k)]
+
+	def _student_indexes(self) -> tuple[SortedIndex, set[int]]:
+		if self._age_index is None:
+			self._age_index = SortedIndex()
+			self._age_index.build({student_id: student.age for student_id, student in self.students.items()})
+			self._graduates = {student_id for student_id, student in self.students.items() if isinstance(student, GraduateStudent)}
+		return self._age_index, self._graduates
+
+	def _average_index(self) -> SortedIndex:
+		if self._rank_index is None:
+			self._rank_index = SortedIndex(descending=True)
+			self._rank_index.build({student_id: student.calculate_total_average_grade() for student_id, student in self.students.items()})
+		return self._rank_index
+
+	def filter_students(
+		self,
+		min_age: int | None = None,
+		max_age: int | None = None,
+		graduate: bool | None = None,
+		course_code: int | None = None,
+		min_average: float | None = None,
+		max_average: float | None = None,
+	) -> list[int]:
+		"""
+		Returns the ids of the students matching every given filter (ranges are inclusive), ascending.
+
+		Every filter can list its matches from an index: the age index, the graduate partition, the course's enrolled
+		students or the average grade index. Only the shortest list is read, its students are checked against the other
+		filters, so a query costs about as much as its most selective filter matches.
+		"""
+		ages, graduates = self._student_indexes()
+		averages = self._average_index() if min_average is not None or max_average is not None else None
+		enrolled = None
+		if course_code is not None:
+			course = self.courses.get(course_code)
+			enrolled = course.enrolled_students if course is not None else set()
+
+		# (count, matches) of every given filter, the matches listed only for the shortest one
+		candidates: list[tuple[int, Callable[[], Iterable[int]]]] = []
+		if min_age is not None or max_age is not None:
+			candidates.append((ages.count_between(min_age, max_age), lambda: ages.between(min_age, max_age)))
+		if graduate is True:
+			candidates.append((len(graduates), lambda: graduates))
+		elif graduate is False:
+			candidates.append((len(self.students) - len(graduates), lambda: (student_id for student_id in self.students if student_id not in graduates)))
+		if enrolled is not None:
+			candidates.append((len(enrolled), lambda: (student_id for student_id in enrolled if student_id in self.students)))
+		if averages is not None:
+			candidates.append((averages.count_between(min_average, max_average), lambda: averages.between(min_average, max_average)))
+
+		if not candidates:
+			return list(self._sorted_keys("student"))
+
+		_, matches = min(candidates, key=lambda candidate: candidate[0])
+		result = []
+		for student_id in matches():
+			if min_age is not None or max_age is not None:
+				age = ages.get(student_id)
+				if (min_age is not None and age < min_age) or (max_age is not None and age > max_age):
+					continue
+			if graduate is not None and (student_id in graduates) != graduate:
+				continue
+			if enrolled is not None and student_id not in enrolled:
+				continue
+			if averages is not None:
+				average = averages.get(student_id)
+				if (min_average is not None and average < min_average) or (max_average is not None and average > max_average):
+					continue
+			result.append(student_id)
+
+		result.sort()
+		return result
+
+	def search_student_ids(self, query: str, limit: int = 5, score_cutoff: float = 30) -> list[tuple[int, float]]:
+		"""
+		Fuzzy matches student names, returning the ids of the best `limit` students with their scores. The index is built
+		on first use. Safe to call from a worker thread while the event loop keeps mutating the school.
+		"""
+		with self._search_lock:
+			index = self._search_index
+			if index is None:
+				# writes queue their updates from here on, and the students are copied in one step, so none is missed
+				index = self._search_index = StudentSearchIndex()
+				index.build({student_id: student.name for student_id, student in self.students.copy().items()})
+
+			updates = self._search_updates
+			while updates:
+				student_id, name = updates.popleft()
+				if name is None:
+					index.remove(student_id)
+				else:
+					index.update(student_id, name)
+
+			return index.search(query, limit=limit, score_cutoff=score_cutoff)
+
+	def search_students(self, query: str, limit: int = 5, score_cutoff: float = 30) -> list[tuple[Student, float]]:
+		"""`search_student_ids` with the students, leaving out the ones removed meanwhile."""
+		students = self.students
+		return [(students[student_id], score) for student_id, score in self.search_student_ids(query, limit, score_cutoff) if student_id in students]
 
 	def get_student_courses(self, student_id: int) -> list[Course]:
-		return [course for course in self.courses.values() if student_id in course.enrolled_students]
+		return [self.courses[course_code] for course_code in sorted(self._student_courses.get(student_id, ()))]
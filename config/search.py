@@ -0,0 +1,143 @@
+import bisect
+
+import numpy as np
+import rapidfuzz
+from rapidfuzz.utils import default_process
+
+
+def tokenize(name: str) -> set[str]:
+	return set(default_process(name).split())
+
+
+class StudentSearchIndex:
+	"""
+	Student names pre-normalized for `partial_token_set_ratio`, keyed by student id.
+
+	`partial_token_set_ratio` is 100 when both names share a token and otherwise the `partial_ratio` of their sorted tokens,
+	which is itself 100 when the query is a substring of the name. Shared tokens are answered from an inverted index,
+	substrings by scanning one joined string of all names, and only if that leaves fewer than `limit` results are the
+	names scored, in one batched `cdist` call.
+	"""
+
+	def __init__(self, workers: int = -1):
+		self.workers = workers
+		self._ids: list[int] = []
+		self._names: list[str] = []
+		self._positions: dict[int, int] = {}
+		self._tokens: dict[str, set[int]] = {}
+		self._blob: str | None = None
+		self._offsets: list[int] = []
+
+	def __len__(self) -> int:
+		return len(self._ids)
+
+	def build(self, names: dict[int, str]):
+		self._ids = []
+		self._names = []
+		self._positions = {}
+		self._tokens = {}
+		self._blob = None
+
+		for student_id, name in names.items():
+			self.update(student_id, name)
+
+	def update(self, student_id: int, name: str):
+		tokens = tokenize(name)
+		self._blob = None
+
+		position = self._positions.get(student_id)
+		if position is None:
+			self._positions[student_id] = len(self._ids)
+			self._ids.append(student_id)
+			self._names.append(" ".join(sorted(tokens)))
+		else:
+			self._unindex_tokens(student_id, self._names[position])
+			self._names[position] = " ".join(sorted(tokens))
+
+		for token in tokens:
+			self._tokens.setdefault(token, set()).add(student_id)
+
+	def remove(self, student_id: int):
+		position = self._positions.pop(student_id, None)
+		if position is None:
+			return
+
+		self._unindex_tokens(student_id, self._names[position])
+		self._blob = None
+
+		# move the last entry into the hole so removal stays O(1)
+		last_id, last_name = self._ids.pop(), self._names.pop()
+		if position < len(self._ids):
+			self._ids[position] = last_id
+			self._names[position] = last_name
+			self._positions[last_id] = position
+
+	def _unindex_tokens(self, student_id: int, name: str):
+		for token in name.split():
+			ids = self._tokens.get(token)
+			if ids is not None:
+				ids.discard(student_id)
+				if not ids:
+					del self._tokens[token]
+
+	def _substring_matches(self, query: str, limit: int) -> list[int]:
+		if self._blob is None:
+			self._blob = "\n".join(self._names)
+			self._offsets = []
+			offset = 0
+			for name in self._names:
+				self._offsets.append(offset)
+				offset += len(name) + 1
+
+		positions = []
+		start = self._blob.find(query)
+		while start != -1 and len(positions) < limit:
+			position = bisect.bisect_right(self._offsets, start) - 1
+			positions.append(position)
+			# continue after the matched name
+			start = self._blob.find(query, self._offsets[position] + len(self._names[position]) + 1)
+
+		return positions
+
+	def search(self, query: str, limit: int = 5, score_cutoff: float = 30) -> list[tuple[int, float]]:
+		"""Returns up to `limit` (student_id, score) pairs with the best scores first."""
+		tokens = tokenize(query)
+		if not tokens or not self._ids or limit <= 0:
+			return []
+
+		results: list[tuple[int, float]] = []
+		exact: set[int] = set()
+		for token in sorted(tokens):
+			for student_id in self._tokens.get(token, ()):
+				if student_id not in exact:
+					exact.add(student_id)
+					results.append((student_id, 100.0))
+					if len(results) == limit:
+						return results
+
+		joined = " ".join(sorted(tokens))
+		for position in self._substring_matches(joined, limit + len(exact)):
+			student_id = self._ids[position]
+			if student_id not in exact:
+				exact.add(student_id)
+				results.append((student_id, 100.0))
+				if len(results) == limit:
+					return results
+
+		scores = rapidfuzz.process.cdist([joined], self._names, scorer=rapidfuzz.fuzz.partial_ratio, score_cutoff=score_cutoff, workers=self.workers)[0]
+
+		matches = np.flatnonzero(scores >= score_cutoff)
+		# matches already found scored 100, so overfetch by their count
+		fetch = limit + len(exact)
+		if len(matches) > fetch:
+			matches = matches[np.argpartition(scores[matches], -fetch)[-fetch:]]
+		matches = matches[np.argsort(-scores[matches], kind="stable")]
+
+		for position in matches:
+			student_id = self._ids[position]
+			if student_id not in exact:
+				results.append((student_id, round(float(scores[position]), 2)))
+				if len(results) == limit:
+					break
+
+		return results
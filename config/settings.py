@@ -0,0 +1,98 @@
+from typing import Literal
+
+import pydantic
+
+from .snapshot import SnapshotFormat
+
+
+class JournalSettings(pydantic.BaseModel):
+	enabled: bool = False
+	compact_bytes: int = 16 * 1024 * 1024
+	compact_records: int = 100_000
+	compact_interval: float = 300.0
+
+
+class PersistenceSettings(pydantic.BaseModel):
+	background: bool = True
+	max_staleness: float = 0.05
+	fsync: bool = True
+
+
+class CacheSettings(pydantic.BaseModel):
+	max_entries: int = 10_000
+	max_bytes: int = 64 * 1024 * 1024
+	# rendered report rows, one per student, so bounded separately
+	max_fragments: int = 200_000
+	max_fragment_bytes: int = 64 * 1024 * 1024
+
+
+class LoadSettings(pydantic.BaseModel):
+	trusted: bool = False
+	lazy: bool = False
+	offload_bytes: int = 16 * 1024 * 1024
+
+
+class SnapshotSettings(pydantic.BaseModel):
+	format: SnapshotFormat = "json"
+
+
+class StorageSettings(pydantic.BaseModel):
+	backend: Literal["json", "sqlite"] = "json"
+	path: str = "school.db"
+	pool_size: int = 4
+	poll_interval: float = 0.1
+	changes_retention: int = 100_000
+
+
+class WatchSettings(pydantic.BaseModel):
+	enabled: bool = False
+	interval: float = 1.0
+	debounce: float = 0.1
+
+
+class MetricsSettings(pydantic.BaseModel):
+	enabled: bool = True
+
+
+class ProfilingSettings(pydantic.BaseModel):
+	enabled: bool = False
+	directory: str = "profiles"
+	max_profiles: int = 20
+
+
+class FeedSettings(pydantic.BaseModel):
+	history: int = 10_000
+	queue_size: int = 1000
+
+
+class AdmissionClassSettings(pydantic.BaseModel):
+	concurrency: int = 4
+	queue: int = 16
+	timeout: float = 10.0
+	status_code: Literal[429, 503] = 503
+
+
+class AdmissionSettings(pydantic.BaseModel):
+	enabled: bool = False
+	workers: int = 2
+	classes: dict[str, AdmissionClassSettings] = pydantic.Field(
+		default_factory=lambda: {
+			"heavy": AdmissionClassSettings(concurrency=2, queue=8),
+			"export": AdmissionClassSettings(concurrency=2, queue=8),
+			"write": AdmissionClassSettings(concurrency=32, queue=256, timeout=5.0),
+		}
+	)
+
+
+class Settings(pydantic.BaseModel):
+	storage: StorageSettings = pydantic.Field(default_factory=StorageSettings)
+	load: LoadSettings = pydantic.Field(default_factory=LoadSettings)
+	snapshot: SnapshotSettings = pydantic.Field(default_factory=SnapshotSettings)
+	journal: JournalSettings = pydantic.Field(default_factory=JournalSettings)
+	persistence: PersistenceSettings = pydantic.Field(default_factory=PersistenceSettings)
+	cache: CacheSettings = pydantic.Field(default_factory=CacheSettings)
+	watch: WatchSettings = pydantic.Field(default_factory=WatchSettings)
+	metrics: MetricsSettings = pydantic.Field(default_factory=MetricsSettings)
+	profiling: ProfilingSettings = pydantic.Field(default_factory=ProfilingSettings)
+	feed: FeedSettings = pydantic.Field(default_factory=FeedSettings)
+	admission: AdmissionSettings = pydantic.Field(default_factory=AdmissionSettings)
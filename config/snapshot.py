@@ -0,0 +1,99 @@
+"""
+Encodings of the config file: indented JSON (hand-editable, the default), compact JSON and msgpack. All of them hold
+the same document, with stringified integer keys, and are told apart by their first bytes.
+"""
+
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Literal, TypeAlias
+
+import msgpack
+import orjson
+
+SnapshotFormat: TypeAlias = Literal["json", "compact", "msgpack"]
+
+FORMATS: tuple[SnapshotFormat, ...] = ("json", "compact", "msgpack")
+
+JSON_START = frozenset(b"{[ \t\r\n")
+
+
+def checksum(data: bytes) -> bytes:
+	return hashlib.blake2b(data, digest_size=16).hexdigest().encode()
+
+
+def detect_format(data: bytes) -> SnapshotFormat:
+	"""JSON documents start with a brace or whitespace, a msgpack map with a map marker byte."""
+	if not data or data[0] in JSON_START:
+		return "compact" if data[:2] != b"{\n" else "json"
+	return "msgpack"
+
+
+def encode(document: dict, format: SnapshotFormat) -> bytes:
+	if format == "msgpack":
+		return msgpack.packb(document)
+	if format == "compact":
+		return orjson.dumps(document)
+	return orjson.dumps(document, option=orjson.OPT_INDENT_2)
+
+
+def decode(data: bytes) -> dict:
+	if detect_format(data) == "msgpack":
+		return msgpack.unpackb(data)
+	return orjson.loads(data)
+
+
+def decode_file(path: str, offload_bytes: int = 0, chunk_size: int = 1000) -> dict:
+	"""
+	Reads and decodes a config file. One of at least `offload_bytes` (unless 0) is decoded in a child process, which
+	returns it in pieces of `chunk_size` students or courses: decoding them here takes many short calls, where the
+	whole file is one that holds the GIL for as long as it runs, stalling the event loop while a thread reloads.
+	"""
+	if offload_bytes and os.path.getsize(path) >= offload_bytes:
+		try:
+			# spawned rather than forked: forking a process that runs threads (the persistence writer's) may deadlock the child
+			with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+				document, pieces = pool.submit(decode_pieces, path, chunk_size).result()
+		except (OSError, BrokenProcessPool) as e:
+			print(f"Config decode process failed, decoding in process: {e!r}")
+		else:
+			return join_pieces(document, pieces)
+
+	with open(path, "rb") as f:
+		return decode(f.read())
+
+
+def decode_pieces(path: str, chunk_size: int) -> tuple[bytes, dict[str, list[bytes]]]:
+	"""
+	The config file for `join_pieces`: the document as compact JSON without the students and courses of its school, and
+	those as compact JSON objects of `chunk_size` records each. Runs in the child process of `decode_file`.
+	"""
+	try:
+		with open(path, "rb") as f:
+			document = decode(f.read())
+
+		pieces: dict[str, list[bytes]] = {}
+		school = document.get("school") if isinstance(document, dict) else None
+		if isinstance(school, dict):
+			for kind in ("students", "courses"):
+				records = school.get(kind)
+				if isinstance(records, dict):
+					items = list(records.items())
+					pieces[kind] = [orjson.dumps(dict(items[i : i + chunk_size])) for i in range(0, len(items), chunk_size)]
+					school[kind] = {}
+		return orjson.dumps(document), pieces
+	except (ValueError, TypeError) as e:
+		# the decoders' own exceptions may not survive the way back to the parent
+		raise ValueError(str(e)) from None
+
+
+def join_pieces(document: bytes, pieces: dict[str, list[bytes]]) -> dict:
+	"""Puts the document of `decode_pieces` back together."""
+	document = orjson.loads(document)
+	for kind, chunks in pieces.items():
+		records = document["school"][kind]
+		for chunk in chunks:
+			records.update(orjson.loads(chunk))
+	return document
@@ -0,0 +1,358 @@
+import os
+import queue
+import sqlite3
+import threading
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import orjson
+
+from .persistence import WriteJob
+from .school import School
+from .settings import Settings
+from .storage import Change, Parts, Storage, entity_data
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+	student_id INTEGER PRIMARY KEY,
+	name TEXT NOT NULL,
+	age INTEGER NOT NULL,
+	thesis_topic TEXT
+);
+CREATE TABLE IF NOT EXISTS courses (
+	course_code INTEGER PRIMARY KEY,
+	course_name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS enrollments (
+	course_code INTEGER NOT NULL,
+	student_id INTEGER NOT NULL,
+	PRIMARY KEY (course_code, student_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS enrollments_student_id ON enrollments (student_id);
+CREATE TABLE IF NOT EXISTS grades (
+	student_id INTEGER NOT NULL,
+	course_code INTEGER NOT NULL,
+	grades TEXT NOT NULL,
+	PRIMARY KEY (student_id, course_code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS grades_course_code ON grades (course_code);
+CREATE TABLE IF NOT EXISTS changes (
+	seq INTEGER PRIMARY KEY AUTOINCREMENT,
+	kind TEXT NOT NULL,
+	key INTEGER NOT NULL,
+	origin TEXT NOT NULL
+);
+"""
+
+# kind of the change row written with a full snapshot, which makes other workers reload everything
+SNAPSHOT_KIND = "*"
+# origin of the change rows of entities this worker created after another one did, so it reloads them as well
+LOST_ORIGIN = ""
+
+UPSERT_STUDENT = "INSERT INTO students (student_id, name, age, thesis_topic) VALUES (?, ?, ?, ?) ON CONFLICT (student_id) DO UPDATE SET name = excluded.name, age = excluded.age, thesis_topic = excluded.thesis_topic"
+UPSERT_COURSE = "INSERT INTO courses (course_code, course_name) VALUES (?, ?) ON CONFLICT (course_code) DO UPDATE SET course_name = excluded.course_name"
+# skipped if the student was removed meanwhile, by another worker
+UPSERT_GRADES = (
+	"INSERT INTO grades (student_id, course_code, grades) SELECT ?1, ?2, ?3 WHERE EXISTS (SELECT 1 FROM students WHERE student_id = ?1) "
+	"ON CONFLICT (student_id, course_code) DO UPDATE SET grades = excluded.grades"
+)
+INSERT_ENROLLMENT = "INSERT INTO enrollments (course_code, student_id) SELECT ?1, ?2 WHERE EXISTS (SELECT 1 FROM courses WHERE course_code = ?1) ON CONFLICT DO NOTHING"
+
+
+class ConnectionPool:
+	"""Connections to one SQLite database, shared by the threads of one process and recreated after a fork."""
+
+	def __init__(self, path: str, size: int = 4, synchronous: str = "NORMAL"):
+		self.path = path
+		self.size = size
+		self.synchronous = synchronous
+
+		self._lock = threading.Lock()
+		self._pid = os.getpid()
+		self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+		self._created = 0
+
+	def _connect(self) -> sqlite3.Connection:
+		connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+		connection.execute("PRAGMA journal_mode=WAL")
+		connection.execute(f"PRAGMA synchronous={self.synchronous}")
+		return connection
+
+	@contextmanager
+	def connection(self) -> Iterator[sqlite3.Connection]:
+		with self._lock:
+			if self._pid != os.getpid():
+				# connections must not cross a fork, every worker gets its own pool
+				self._pid = os.getpid()
+				self._idle = queue.LifoQueue()
+				self._created = 0
+
+			idle = self._idle
+			create = idle.empty() and self._created < self.size
+			if create:
+				self._created += 1
+
+		connection = self._connect() if create else idle.get()
+		try:
+			yield connection
+		finally:
+			idle.put(connection)
+
+	def close(self):
+		while not self._idle.empty():
+			self._idle.get().close()
+		self._created = 0
+
+
+class SqliteStorage(Storage):
+	"""
+	The school in a SQLite database in WAL mode, so several uvicorn workers can share it. Write jobs return the number
+	of rows written rather than bytes.
+
+	Every write also appends the changed entities to a `changes` table; `poll` reads the rows other workers appended
+	since the last poll (cheaply skipped while `PRAGMA data_version` is unchanged) so their entities can be refreshed.
+	"""
+
+	def __init__(self, settings: Settings, path: str):
+		super().__init__(settings)
+		self.path = path
+		self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+		self.pool = ConnectionPool(path, settings.storage.pool_size, "FULL" if settings.persistence.fsync else "NORMAL")
+
+		self._last_seq = 0
+		self._data_version: int | None = None
+		self._poll_connection: sqlite3.Connection | None = None
+
+	def load(self, config: dict) -> dict:
+		initial = config.pop("school", None)
+
+		with self.pool.connection() as connection:
+			connection.executescript(SCHEMA)
+
+			empty = connection.execute("SELECT NOT EXISTS (SELECT 1 FROM students) AND NOT EXISTS (SELECT 1 FROM courses)").fetchall()[0][0]
+			if empty and initial:
+				# first start on this database, take over the school from config.json
+				school = School(**initial)
+				self._write_snapshot(connection, [student.model_dump(mode="json") for student in school.students.values()], [course.model_dump(mode="json") for course in school.courses.values()])
+
+			connection.execute("BEGIN")
+			try:
+				school = self._read(connection)
+				# rows are only written by this app, from validated models
+				self.trusted = True
+				self._last_seq = connection.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchall()[0][0]
+			finally:
+				connection.execute("COMMIT")
+
+		return school
+
+	def _read(self, connection: sqlite3.Connection, student_ids: list[int] | None = None, course_codes: list[int] | None = None) -> dict:
+		"""Reads the given students and courses, or all of them when the ids are None, into a raw school dict."""
+
+		def where(column: str, keys: list[int] | None) -> tuple[str, tuple]:
+			if keys is None:
+				return "", ()
+			return f"WHERE {column} IN ({', '.join('?' * len(keys))})", tuple(keys)
+
+		students = {}
+		if student_ids is None or student_ids:
+			clause, params = where("student_id", student_ids)
+			for student_id, name, age, thesis_topic in connection.execute(f"SELECT student_id, name, age, thesis_topic FROM students {clause}", params):
+				students[student_id] = {"student_id": student_id, "name": name, "age": age, "grades": {}}
+				if thesis_topic is not None:
+					students[student_id]["thesis_topic"] = thesis_topic
+
+			for student_id, course_code, grades in connection.execute(f"SELECT student_id, course_code, grades FROM grades {clause}", params):
+				if student_id in students:
+					students[student_id]["grades"][str(course_code)] = orjson.loads(grades)
+
+		courses = {}
+		if course_codes is None or course_codes:
+			clause, params = where("course_code", course_codes)
+			for course_code, course_name in connection.execute(f"SELECT course_code, course_name FROM courses {clause}", params):
+				courses[course_code] = {"course_code": course_code, "course_name": course_name, "enrolled_students": []}
+
+			for course_code, student_id in connection.execute(f"SELECT course_code, student_id FROM enrollments {clause}", params):
+				if course_code in courses:
+					courses[course_code]["enrolled_students"].append(student_id)
+
+		return {"students": students, "courses": courses}
+
+	def load_entities(self, changes: list[Change]) -> dict:
+		student_ids = [key for kind, key in changes if kind == "student"]
+		course_codes = [key for kind, key in changes if kind == "course"]
+
+		school = {"students": {}, "courses": {}}
+		with self.pool.connection() as connection:
+			connection.execute("BEGIN")
+			try:
+				# stay under SQLite's limit of bound parameters
+				for i in range(0, max(len(student_ids), len(course_codes)), 500):
+					chunk = self._read(connection, student_ids[i : i + 500], course_codes[i : i + 500])
+					school["students"].update(chunk["students"])
+					school["courses"].update(chunk["courses"])
+			finally:
+				connection.execute("COMMIT")
+
+		return school
+
+	def poll(self) -> list[Change] | None:
+		if self._poll_connection is None:
+			self._poll_connection = self.pool._connect()
+		connection = self._poll_connection
+
+		data_version = connection.execute("PRAGMA data_version").fetchall()[0][0]
+		if data_version == self._data_version:
+			return []
+		self._data_version = data_version
+
+		rows = connection.execute("SELECT seq, kind, key, origin FROM changes WHERE seq > ? ORDER BY seq", (self._last_seq,)).fetchall()
+		if not rows:
+			return []
+
+		first_seq = connection.execute("SELECT MIN(seq) FROM changes").fetchall()[0][0]
+		pruned = first_seq > self._last_seq + 1
+		self._last_seq = rows[-1][0]
+
+		changes: dict[Change, None] = {}
+		for _, kind, key, origin in rows:
+			if origin == self.origin:
+				continue
+			if kind == SNAPSHOT_KIND:
+				return None
+			changes[(kind, key)] = None
+
+		# rows we never saw were pruned, so what changed is unknown
+		return None if pruned else list(changes)
+
+	def capture(self, school: School, config: dict, changes: dict[Change, Parts], snapshot: bool) -> WriteJob:
+		if snapshot:
+			students = [student.model_dump(mode="json") for student in school.students.values()]
+			courses = [course.model_dump(mode="json") for course in school.courses.values()]
+
+			def write_snapshot() -> int:
+				with self.pool.connection() as connection:
+					return self._write_snapshot(connection, students, courses)
+
+			return write_snapshot
+
+		records = [(kind, key, parts, entity_data(school, kind, key)) for (kind, key), parts in changes.items()]
+
+		def write_changes() -> int:
+			with self.pool.connection() as connection:
+				connection.execute("BEGIN IMMEDIATE")
+				try:
+					written = 0
+					origins = []
+					for kind, key, parts, data in records:
+						write = self._write_student if kind == "student" else self._write_course
+						rows = write(connection, key, parts, data)
+						written += rows or 0
+						origins.append((kind, key, self.origin if rows is not None else LOST_ORIGIN))
+					connection.executemany("INSERT INTO changes (kind, key, origin) VALUES (?, ?, ?)", origins)
+					self._prune_changes(connection)
+				except BaseException:
+					connection.execute("ROLLBACK")
+					raise
+				connection.execute("COMMIT")
+			return written
+
+		return write_changes
+
+	def _write_snapshot(self, connection: sqlite3.Connection, students: list[dict], courses: list[dict]) -> int:
+		connection.execute("BEGIN IMMEDIATE")
+		try:
+			for table in ("students", "courses", "enrollments", "grades"):
+				connection.execute(f"DELETE FROM {table}")
+
+			written = 0
+			for student in students:
+				written += self._write_student(connection, student["student_id"], {"created"}, student)
+			for course in courses:
+				written += self._write_course(connection, course["course_code"], {"created"}, course)
+
+			connection.execute("INSERT INTO changes (kind, key, origin) VALUES (?, 0, ?)", (SNAPSHOT_KIND, self.origin))
+			self._prune_changes(connection)
+		except BaseException:
+			connection.execute("ROLLBACK")
+			raise
+		connection.execute("COMMIT")
+		return written
+
+	@staticmethod
+	def _write_student(connection: sqlite3.Connection, student_id: int, parts: Parts, data: dict | None) -> int | None:
+		"""
+		Writes the changed parts of a student, so the rows other workers changed meanwhile stay theirs. Returns the rows
+		written, None if the student was created here but another worker stored one with the same id first.
+		"""
+		if data is None:
+			connection.execute("DELETE FROM students WHERE student_id = ?", (student_id,))
+			connection.execute("DELETE FROM grades WHERE student_id = ?", (student_id,))
+			return 0
+
+		row = (student_id, data["name"], data["age"], data.get("thesis_topic"))
+		grades = {int(course_code): orjson.dumps(course_grades).decode() for course_code, course_grades in data["grades"].items()}
+		if parts is None or "created" in parts:
+			if parts is None:
+				connection.execute(UPSERT_STUDENT, row)
+				stored = {course_code for (course_code,) in connection.execute("SELECT course_code FROM grades WHERE student_id = ?", (student_id,))}
+				connection.executemany("DELETE FROM grades WHERE student_id = ? AND course_code = ?", [(student_id, course_code) for course_code in stored - grades.keys()])
+			elif not connection.execute("INSERT INTO students (student_id, name, age, thesis_topic) VALUES (?, ?, ?, ?) ON CONFLICT DO NOTHING", row).rowcount:
+				return None
+			connection.executemany(UPSERT_GRADES, [(student_id, course_code, course_grades) for course_code, course_grades in grades.items()])
+			return 1 + len(grades)
+
+		written = 0
+		columns = [column for column in ("name", "age", "thesis_topic") if column in parts]
+		if columns:
+			assignments = ", ".join(f"{column} = ?" for column in columns)
+			written += connection.execute(f"UPDATE students SET {assignments} WHERE student_id = ?", (*(data.get(column) for column in columns), student_id)).rowcount
+		for part in parts:
+			if type(part) is tuple:
+				course_code = part[1]
+				if course_code in grades:
+					written += connection.execute(UPSERT_GRADES, (student_id, course_code, grades[course_code])).rowcount
+				else:
+					written += connection.execute("DELETE FROM grades WHERE student_id = ? AND course_code = ?", (student_id, course_code)).rowcount
+		return written
+
+	@staticmethod
+	def _write_course(connection: sqlite3.Connection, course_code: int, parts: Parts, data: dict | None) -> int | None:
+		"""Writes the changed parts of a course, like `_write_student`."""
+		if data is None:
+			connection.execute("DELETE FROM courses WHERE course_code = ?", (course_code,))
+			connection.execute("DELETE FROM enrollments WHERE course_code = ?", (course_code,))
+			return 0
+
+		enrolled = set(data["enrolled_students"])
+		if parts is None or "created" in parts:
+			if parts is None:
+				connection.execute(UPSERT_COURSE, (course_code, data["course_name"]))
+				stored = {student_id for (student_id,) in connection.execute("SELECT student_id FROM enrollments WHERE course_code = ?", (course_code,))}
+				connection.executemany("DELETE FROM enrollments WHERE course_code = ? AND student_id = ?", [(course_code, student_id) for student_id in stored - enrolled])
+			elif not connection.execute("INSERT INTO courses (course_code, course_name) VALUES (?, ?) ON CONFLICT DO NOTHING", (course_code, data["course_name"])).rowcount:
+				return None
+			connection.executemany(INSERT_ENROLLMENT, [(course_code, student_id) for student_id in enrolled])
+			return 1 + len(enrolled)
+
+		written = 0
+		if "course_name" in parts:
+			written += connection.execute("UPDATE courses SET course_name = ? WHERE course_code = ?", (data["course_name"], course_code)).rowcount
+		for part in parts:
+			if type(part) is tuple:
+				student_id = part[1]
+				if student_id in enrolled:
+					written += connection.execute(INSERT_ENROLLMENT, (course_code, student_id)).rowcount
+				else:
+					written += connection.execute("DELETE FROM enrollments WHERE course_code = ? AND student_id = ?", (course_code, student_id)).rowcount
+		return written
+
+	def _prune_changes(self, connection: sqlite3.Connection):
+		connection.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (self.settings.storage.changes_retention,))
+
+	def close(self):
+		if self._poll_connection is not None:
+			self._poll_connection.close()
+			self._poll_connection = None
+		self.pool.close()
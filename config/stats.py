@@ -0,0 +1,121 @@
+from array import array
+from collections.abc import Iterable, Mapping
+
+import numpy as np
+
+from models import Course, Student
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+_NONE: frozenset[int] = frozenset()
+
+
+def grade_stats(grades: np.ndarray) -> dict:
+	"""
+	Count, mean, median, population standard deviation, percentiles (linear interpolation, as `np.percentile`) and a
+	histogram of one course's grades.
+
+	Grades are 16-bit ints, so everything but the mean and deviation comes from one `bincount` instead of a sort.
+	"""
+	if not grades.size:
+		return {
+			"count": 0,
+			"mean": None,
+			"median": None,
+			"stddev": None,
+			"min": None,
+			"max": None,
+			"percentiles": {f"p{q}": None for q in PERCENTILES},
+			"histogram": {},
+		}
+
+	grades = grades.astype(np.int64, copy=False)
+	low = int(grades.min())
+	counts = np.bincount(grades - low)
+	values = np.flatnonzero(counts)
+	counts = counts[values]
+	values += low
+
+	# the value at each sorted position is found on the cumulative counts
+	cumulative = np.cumsum(counts)
+	positions = np.array(PERCENTILES) / 100 * (grades.size - 1)
+	below = values[np.searchsorted(cumulative, np.floor(positions), side="right")]
+	above = values[np.searchsorted(cumulative, np.ceil(positions), side="right")]
+	percentiles = below + (above - below) * (positions - np.floor(positions))
+
+	return {
+		"count": int(grades.size),
+		"mean": round(float(grades.mean()), 2),
+		"median": round(float(percentiles[PERCENTILES.index(50)]), 2),
+		"stddev": round(float(grades.std()), 2),
+		"min": int(values[0]),
+		"max": int(values[-1]),
+		"percentiles": {f"p{q}": round(float(value), 2) for q, value in zip(PERCENTILES, percentiles)},
+		"histogram": dict(zip(values.tolist(), counts.tolist())),
+	}
+
+
+def summarize(course: Course, grades: np.ndarray) -> dict:
+	"""The stats served for a course: its code, enrolled student count and `grade_stats` of its grades."""
+	return {"course_code": course.course_code, "students": len(course.enrolled_students), **grade_stats(grades)}
+
+
+def course_grades(course: Course, students: Mapping[int, Student]) -> np.ndarray:
+	"""The grades of a course's enrolled students in that course, as one int16 array."""
+	parts = []
+	for student_id in course.enrolled_students:
+		student = students.get(student_id)
+		if student is not None and course.course_code in student.grades:
+			parts.append(student.grades[course.course_code])
+	return np.frombuffer(b"".join(parts), dtype=np.int16)
+
+
+def all_course_grades(course_codes: Iterable[int], students: Mapping[int, Student], student_courses: Mapping[int, set[int]]) -> dict[int, np.ndarray]:
+	"""
+	`course_grades` of many courses in one pass over the students: their packed grade arrays are concatenated as they
+	are, then grades of courses a student isn't enrolled to are masked out and the rest grouped by course with NumPy.
+	"""
+	wanted = np.array(sorted(course_codes), dtype=np.int64)
+	values: list[array] = []
+	codes: list[array] = []
+	offsets: list[array] = []
+	# indexes of (student, course) segments to drop, i.e. grades in courses the student isn't enrolled to
+	dropped: list[int] = []
+	segments = 0
+
+	for student_id, student in students.items():
+		student_codes, student_offsets, student_values = student.grades.packed()
+		if not student_codes:
+			continue
+
+		enrolled = student_courses.get(student_id, _NONE)
+		if not enrolled.issuperset(student_codes):
+			dropped.extend(segments + i for i, course_code in enumerate(student_codes) if course_code not in enrolled)
+
+		values.append(student_values)
+		codes.append(student_codes)
+		offsets.append(student_offsets)
+		segments += len(student_codes)
+
+	result = {int(course_code): np.empty(0, dtype=np.int16) for course_code in wanted}
+	if not segments:
+		return result
+
+	segment_codes = np.frombuffer(b"".join(codes), dtype=np.int64)
+	# every student's offsets run from 0 to its grade count, the differences across two students are dropped
+	all_offsets = np.frombuffer(b"".join(offsets), dtype=np.int64)
+	boundaries = np.cumsum([len(student_offsets) for student_offsets in offsets])[:-1] - 1
+	lengths = np.delete(np.diff(all_offsets), boundaries)
+
+	keep = np.isin(segment_codes, wanted)
+	keep[dropped] = False
+
+	grades = np.frombuffer(b"".join(values), dtype=np.int16)[np.repeat(keep, lengths)]
+	grade_codes = np.repeat(segment_codes[keep], lengths[keep])
+
+	order = np.argsort(grade_codes, kind="stable")
+	grades, grade_codes = grades[order], grade_codes[order]
+	present, starts = np.unique(grade_codes, return_index=True)
+	for course_code, grouped in zip(present.tolist(), np.split(grades, starts[1:])):
+		result[course_code] = grouped
+	return result
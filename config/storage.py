@@ -0,0 +1,250 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import TypeAlias
+
+import orjson
+
+from .persistence import WriteJob, append, atomic_write
+from .school import School
+from .settings import Settings
+from .snapshot import checksum, decode_file, encode
+from .watcher import FileSignature, file_signature
+
+# a changed entity, ("student", student_id) or ("course", course_code)
+Change: TypeAlias = tuple[str, int]
+# what changed of an entity, for storages that write less than whole entities: the names of changed fields, "created",
+# ("grades", course_code) of a student and ("enrollment", student_id) of a course; None if it was replaced or removed
+Parts: TypeAlias = set[str | tuple[str, int]] | None
+
+
+def changed_parts(event: str, fields: dict) -> Parts:
+	"""The parts of an entity changed by one school event, see `School.add_event_listener`."""
+	if event == "created":
+		return {"created"}
+	if event == "grades":
+		return {("grades", fields["course_code"])}
+	if event in ("enrolled", "unenrolled"):
+		return {("enrollment", fields["student_id"])}
+	if event == "updated" and "student" not in fields and "course" not in fields:
+		return set(fields)
+	return None
+
+
+def read_config_file(path: str, offload_bytes: int = 0) -> dict:
+	"""Reads the config file in whichever snapshot format it was written, see `decode_file` for `offload_bytes`."""
+	if os.path.exists(path):
+		try:
+			return decode_file(path, offload_bytes)
+		except ValueError as e:
+			print(f"Config decode error: {e.args}")
+
+	return {}
+
+
+def entity_data(school: School, kind: str, key: int) -> dict | None:
+	"""Returns the JSON form of a student or course, None if it was removed."""
+	entities = school.students if kind == "student" else school.courses
+	entity = entities.get(key)
+	return None if entity is None else entity.model_dump(mode="json")
+
+
+class Storage(ABC):
+	"""Where the school is persisted. `capture` runs on the event loop and returns the disk work, which may run on any thread."""
+
+	def __init__(self, settings: Settings):
+		self.settings = settings
+		# whether the last load read only data this app wrote itself, which the trusted load needn't validate again
+		self.trusted = False
+		# entities of a trusted load that are validated all the same, nothing vouching for them
+		self.untrusted: list[Change] = []
+
+	@abstractmethod
+	def load(self, config: dict) -> dict:
+		"""Returns the raw school dict, taking over the "school" key of the config.json contents if the storage keeps it elsewhere."""
+
+	@abstractmethod
+	def capture(self, school: School, config: dict, changes: dict[Change, Parts], snapshot: bool) -> WriteJob:
+		"""Captures the given changed entities, or the whole school if `snapshot`."""
+
+	def changed_externally(self) -> bool:
+		"""Whether the config file was changed by someone else since this storage last loaded or wrote it."""
+		return False
+
+	def poll(self) -> list[Change] | None:
+		"""Returns the entities other processes changed since the last poll, None if the whole school has to be reloaded."""
+		return []
+
+	def load_entities(self, changes: list[Change]) -> dict:
+		"""Returns the current raw form of the given entities in a school dict, removed ones are missing."""
+		return {"students": {}, "courses": {}}
+
+	def close(self):
+		pass
+
+
+class JsonStorage(Storage):
+	"""
+	The school in the "school" key of config.json, written in the configured snapshot format, plus an optional
+	append-only journal.
+
+	Every snapshot is written with a checksum next to it in `<config.json>.sum`; a load is trusted only if the file still
+	matches it, i.e. nobody edited it by hand since.
+
+	In journal mode every capture appends one record per changed entity to `<config.json>.journal`; the journal is
+	replayed over the snapshot on load and compacted into a new snapshot past a size, record count or age threshold.
+	"""
+
+	def __init__(self, settings: Settings, file_path: str):
+		super().__init__(settings)
+		self.file_path = file_path
+
+		self._journal_bytes = 0
+		self._journal_records = 0
+		self._journal_compacted_at = time.monotonic()
+		# of the file as this storage last loaded or wrote it, to tell its own writes from external edits
+		self._signature: FileSignature = None
+
+	@property
+	def journal_path(self) -> str:
+		return f"{self.file_path}.journal"
+
+	@property
+	def checksum_path(self) -> str:
+		return f"{self.file_path}.sum"
+
+	def load(self, config: dict) -> dict:
+		self._signature = file_signature(self.file_path)
+		self.trusted = self._verify_checksum()
+		school = config.pop("school", {})
+		# journal records have no checksum, a torn or edited one must not skip validation
+		replayed: dict[Change, None] = {}
+		self._journal_records, self._journal_bytes = self._replay_journal(school, replayed)
+		self.untrusted = list(replayed)
+		self._journal_compacted_at = time.monotonic()
+		return school
+
+	def capture(self, school: School, config: dict, changes: dict[Change, Parts], snapshot: bool) -> WriteJob:
+		fsync = self.settings.persistence.fsync
+
+		if snapshot or not self.settings.journal.enabled:
+			# a copy-on-write snapshot is all the loop pays for, dumping and encoding it happen with the disk work
+			frozen = school.snapshot()
+			config = config.copy()
+			snapshot_format = self.settings.snapshot.format
+			self._reset_journal()
+
+			def write_snapshot() -> int:
+				data = encode({**config, "school": frozen.model_dump(mode="json")}, snapshot_format)
+				self._write_snapshot(data, fsync)
+				# the snapshot now contains everything the journal did
+				if os.path.exists(self.journal_path):
+					os.remove(self.journal_path)
+				return len(data)
+
+			return write_snapshot
+
+		data = b"".join(orjson.dumps({"op": kind, "id": key, "data": entity_data(school, kind, key)}) + b"\n" for kind, key in changes)
+		self._journal_bytes += len(data)
+		self._journal_records += len(changes)
+
+		compact = self._should_compact()
+		if compact:
+			self._reset_journal()
+
+		def write_journal() -> int:
+			if data:
+				append(self.journal_path, data, fsync)
+			if compact:
+				return len(data) + self._compact(fsync)
+			return len(data)
+
+		return write_journal
+
+	def changed_externally(self) -> bool:
+		return file_signature(self.file_path) != self._signature
+
+	def _write_snapshot(self, data: bytes, fsync: bool):
+		atomic_write(self.file_path, data, fsync)
+		self._signature = file_signature(self.file_path)
+		# a crash in between leaves a stale checksum, which only costs a validating load
+		atomic_write(self.checksum_path, checksum(data), fsync)
+
+	def _verify_checksum(self) -> bool:
+		try:
+			with open(self.checksum_path, "rb") as f:
+				expected = f.read()
+			with open(self.file_path, "rb") as f:
+				return checksum(f.read()) == expected
+		except FileNotFoundError:
+			return False
+
+	def _reset_journal(self):
+		self._journal_bytes = 0
+		self._journal_records = 0
+		self._journal_compacted_at = time.monotonic()
+
+	def _should_compact(self) -> bool:
+		settings = self.settings.journal
+
+		if self._journal_bytes >= settings.compact_bytes or self._journal_records >= settings.compact_records:
+			return True
+
+		return self._journal_records > 0 and time.monotonic() - self._journal_compacted_at >= settings.compact_interval
+
+	def _compact(self, fsync: bool) -> int:
+		"""Folds the journal into a new snapshot from what is on disk, so it never touches the live school."""
+		external = self.changed_externally()
+		config = read_config_file(self.file_path)
+		self._replay_journal(config.setdefault("school", {}))
+
+		data = encode(config, self.settings.snapshot.format)
+		self._write_snapshot(data, fsync)
+		if external:
+			# the edit was folded in but never loaded, leave it to be seen as external
+			self._signature = None
+		if os.path.exists(self.journal_path):
+			os.remove(self.journal_path)
+
+		return len(data)
+
+	def _replay_journal(self, school: dict, replayed: dict[Change, None] | None = None) -> tuple[int, int]:
+		"""
+		Applies journal records on top of a raw snapshot dict, returning the record and byte counts. Records hold whole
+		entities, so replaying one twice is harmless. The entities they leave in the dict are collected in `replayed`.
+		"""
+		if not os.path.exists(self.journal_path):
+			return 0, 0
+
+		students = school.setdefault("students", {})
+		courses = school.setdefault("courses", {})
+
+		records = 0
+		valid = 0
+		with open(self.journal_path, "rb") as f:
+			for line in f:
+				if not line.endswith(b"\n"):
+					# torn write from a crash, everything after it is unusable
+					break
+
+				try:
+					record = orjson.loads(line)
+				except orjson.JSONDecodeError:
+					break
+
+				entities = students if record["op"] == "student" else courses
+				if record["data"] is None:
+					entities.pop(str(record["id"]), None)
+				else:
+					entities[str(record["id"])] = record["data"]
+				if replayed is not None:
+					replayed[(record["op"], int(record["id"]))] = None
+
+				valid += len(line)
+				records += 1
+
+		if valid != os.path.getsize(self.journal_path):
+			with open(self.journal_path, "r+b") as f:
+				f.truncate(valid)
+
+		return records, valid
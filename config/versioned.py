@@ -0,0 +1,180 @@
+import weakref
+from collections.abc import Iterator, Mapping
+from typing import Any, Self
+
+# saved for the keys a view didn't have
+_MISSING = object()
+# what a layer returns for the keys it didn't save
+_UNSAVED = object()
+
+
+class _Layer(dict):
+	"""The values a `VersionedDict` replaced after one view was taken and before the next one was, by key."""
+
+	__slots__ = ("__weakref__", "newer")
+
+	def __init__(self):
+		super().__init__()
+		self.newer: _Layer | None = None
+
+
+class VersionedDict(dict):
+	"""
+	A dict that hands out read-only views of itself in O(1), see `view`. While a view is alive, the first change of a
+	key saves the value it replaces in the newest view's layer: a view reads its own layer, then the newer ones, then
+	the dict. Nothing is saved while no view is alive.
+	"""
+
+	# the newest layer, alive as long as its view or an older one is
+	_layer: "weakref.ref[_Layer] | None" = None
+
+	def _save(self, key: Any):
+		if self._layer is None:
+			return
+		layer = self._layer()
+		if layer is None:
+			self._layer = None
+		elif key not in layer:
+			# saved before the dict changes, views read the dict before the layers
+			layer[key] = dict.get(self, key, _MISSING)
+
+	def __setitem__(self, key: Any, value: Any):
+		self._save(key)
+		dict.__setitem__(self, key, value)
+
+	def __delitem__(self, key: Any):
+		self._save(key)
+		dict.__delitem__(self, key)
+
+	def pop(self, key: Any, *default: Any) -> Any:
+		self._save(key)
+		return dict.pop(self, key, *default)
+
+	def popitem(self) -> tuple[Any, Any]:
+		if not self:
+			raise KeyError("popitem(): dictionary is empty")
+		key = next(reversed(self))
+		return key, self.pop(key)
+
+	def setdefault(self, key: Any, default: Any = None) -> Any:
+		if key not in self:
+			self[key] = default
+		return self[key]
+
+	def update(self, *args: Any, **kwargs: Any):
+		for key, value in dict(*args, **kwargs).items():
+			self[key] = value
+
+	def __ior__(self, other: Any) -> Self:
+		self.update(other)
+		return self
+
+	def clear(self):
+		for key in list(self):
+			self._save(key)
+		dict.clear(self)
+
+	def __reduce__(self):
+		return type(self), (dict(self),)
+
+	def view(self) -> "VersionedView":
+		"""A read-only view of the dict as it is now, unaffected by later changes."""
+		layer = _Layer()
+		newest = self._layer() if self._layer is not None else None
+		if newest is not None:
+			newest.newer = layer
+		self._layer = weakref.ref(layer)
+		return VersionedView(self, layer)
+
+	def viewed(self) -> bool:
+		"""Whether a view of the dict is alive."""
+		return self._layer is not None and self._layer() is not None
+
+	def _model(self, value: Any) -> Any:
+		"""The value a view returns for a stored one, see LazyDict."""
+		return value
+
+
+class VersionedView(Mapping):
+	"""
+	A `VersionedDict` as it was when the view was taken, safe to read from any thread while the dict changes on
+	another. Lookups are O(1) plus the number of views taken since; iterating copies the dict once, on first use.
+	"""
+
+	__slots__ = ("_dict", "_layer", "_models", "_stored")
+
+	def __init__(self, versioned: VersionedDict, layer: _Layer):
+		self._dict = versioned
+		self._layer: _Layer | None = layer
+		self._stored: dict | None = None
+		# models of the raw records read so far, the dict's own are not touched from here
+		self._models: dict = {}
+
+	def _lookup(self, key: Any) -> Any:
+		stored = self._stored
+		if stored is not None:
+			return stored.get(key, _MISSING)
+
+		# the dict first: a change saves the old value in a layer before it touches the dict
+		value = dict.get(self._dict, key, _MISSING)
+		layer = self._layer
+		while layer is not None:
+			saved = layer.get(key, _UNSAVED)
+			if saved is not _UNSAVED:
+				return saved
+			layer = layer.newer
+		return value
+
+	def _value(self, key: Any, value: Any) -> Any:
+		if type(value) is dict:
+			model = self._models.get(key)
+			if model is None:
+				model = self._models[key] = self._dict._model(value)
+			return model
+		return value
+
+	def __getitem__(self, key: Any) -> Any:
+		value = self._lookup(key)
+		if value is _MISSING:
+			raise KeyError(key)
+		return self._value(key, value)
+
+	def get(self, key: Any, default: Any = None) -> Any:
+		value = self._lookup(key)
+		return default if value is _MISSING else self._value(key, value)
+
+	def __contains__(self, key: object) -> bool:
+		return self._lookup(key) is not _MISSING
+
+	def stored(self) -> dict:
+		"""
+		The stored values by key, raw records of a LazyDict included, in a dict of the view's own (a LazyDict then),
+		built on first use. It must not be changed.
+		"""
+		if self._stored is None:
+			# one C call, the dict can't change half way; then the values replaced since are put back
+			stored = self._dict.copy()
+			saved: dict = {}
+			layer = self._layer
+			while layer is not None:
+				for key, value in layer.copy().items():
+					saved.setdefault(key, value)
+				layer = layer.newer
+			for key, value in saved.items():
+				if value is _MISSING:
+					dict.pop(stored, key, None)
+				else:
+					dict.__setitem__(stored, key, value)
+			self._stored = stored
+			# lookups go to the copy from now on, the layers may go
+			self._layer = None
+		return self._stored
+
+	def __iter__(self) -> Iterator[Any]:
+		return iter(self.stored().keys())
+
+	def __len__(self) -> int:
+		return len(self.stored())
+
+	def __repr__(self) -> str:
+		return f"{type(self).__name__}({dict(self.items())!r})"
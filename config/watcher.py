@@ -0,0 +1,137 @@
+import asyncio
+import ctypes
+import os
+import struct
+import sys
+from dataclasses import asdict, dataclass
+from typing import TypeAlias
+
+# (inode, size, mtime) of a file, None if it doesn't exist
+FileSignature: TypeAlias = tuple[int, int, int] | None
+
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+# struct inotify_event: wd, mask, cookie, len, followed by the name padded to len bytes
+_EVENT = struct.Struct("iIII")
+
+
+def file_signature(path: str) -> FileSignature:
+	try:
+		stat = os.stat(path)
+	except FileNotFoundError:
+		return None
+	return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _libc_inotify() -> ctypes.CDLL | None:
+	if not sys.platform.startswith("linux"):
+		return None
+	try:
+		libc = ctypes.CDLL(None, use_errno=True)
+	except OSError:
+		return None
+	if not hasattr(libc, "inotify_init1") or not hasattr(libc, "inotify_add_watch"):
+		return None
+	return libc
+
+
+@dataclass()
+class ReloadStats:
+	reloads: int = 0
+	incremental: int = 0
+	errors: int = 0
+	last_changed: int = 0
+	total_changed: int = 0
+	last_reload_ms: float = 0.0
+	max_reload_ms: float = 0.0
+	total_reload_ms: float = 0.0
+
+	def as_dict(self) -> dict:
+		data = asdict(self)
+		data["average_reload_ms"] = self.total_reload_ms / self.reloads if self.reloads else 0.0
+		return data
+
+	def record(self, elapsed_ms: float, changed: int, incremental: bool):
+		self.reloads += 1
+		self.incremental += incremental
+		self.last_changed = changed
+		self.total_changed += changed
+		self.last_reload_ms = elapsed_ms
+		self.max_reload_ms = max(self.max_reload_ms, elapsed_ms)
+		self.total_reload_ms += elapsed_ms
+
+
+class FileWatcher:
+	"""
+	Wakes up when a file may have changed: inotify on its directory where available (Linux, so editors replacing the
+	file by a rename are seen too), otherwise by polling its signature every `interval` seconds. Wake-ups may be
+	spurious, callers compare the file themselves.
+	"""
+
+	def __init__(self, path: str, interval: float = 1.0):
+		self.path = path
+		self.interval = interval
+
+		self._name = os.fsencode(os.path.basename(path))
+		self._signature = file_signature(path)
+		self._fd: int | None = None
+		self._loop: asyncio.AbstractEventLoop | None = None
+		self._event: asyncio.Event | None = None
+
+		libc = _libc_inotify()
+		if libc is not None:
+			fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+			if fd >= 0:
+				directory = os.fsencode(os.path.dirname(os.path.abspath(path)))
+				if libc.inotify_add_watch(fd, directory, _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE) >= 0:
+					self._fd = fd
+				else:
+					os.close(fd)
+
+	@property
+	def native(self) -> bool:
+		"""Whether inotify is used rather than polling."""
+		return self._fd is not None
+
+	async def wait(self):
+		"""Returns once the file may have changed since the last call."""
+		if self._fd is None:
+			while (signature := file_signature(self.path)) == self._signature:
+				await asyncio.sleep(self.interval)
+			self._signature = signature
+			return
+
+		if self._loop is None:
+			self._loop = asyncio.get_running_loop()
+			self._event = asyncio.Event()
+			self._loop.add_reader(self._fd, self._read_events)
+
+		await self._event.wait()
+		self._event.clear()
+
+	def _read_events(self):
+		while True:
+			try:
+				data = os.read(self._fd, 64 * 1024)
+			except BlockingIOError:
+				return
+
+			offset = 0
+			while offset < len(data):
+				_, _, _, length = _EVENT.unpack_from(data, offset)
+				offset += _EVENT.size
+				if data[offset : offset + length].rstrip(b"\0") == self._name:
+					self._event.set()
+				offset += length
+
+	def close(self):
+		if self._fd is None:
+			return
+		if self._loop is not None and not self._loop.is_closed():
+			self._loop.remove_reader(self._fd)
+		os.close(self._fd)
+		self._fd = None
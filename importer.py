@@ -0,0 +1,6 @@
+"""Imports students, courses or grades with the app stopped, see config.importer: python importer.py students.csv --kind students"""
+
+from config.importer import main
+
+if __name__ == "__main__":
+	main()
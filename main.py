@@ -1,3 +1,5 @@
+import os
+from contextlib import asynccontextmanager
 from typing import Type
 
 import fastapi
@@ -9,30 +11,46 @@ import routes
 from config import Config
 from routes.base_route import AbstractRoute
 
-app = fastapi.FastAPI(
-	title="Project 2",
-	summary="ItP endterm project",
-	license_info={
-		"name": "MIT",
-		"url": "https://mit-license.org/",
-	},
-)
-app.mount("/static", StaticFiles(directory="static"), name="static")
 
-templates = Jinja2Templates(directory="templates")
+def create_app(config: Config) -> fastapi.FastAPI:
+	@asynccontextmanager
+	async def lifespan(app: fastapi.FastAPI):
+		config.start_watching()
+		yield
+		await config.stop_watching()
+		await config.flush()
+		# the pool is started again on first use, e.g. by the next app
+		config.admission.shutdown()
 
-config = Config("config.json")
-config.read()
+	app = fastapi.FastAPI(
+		lifespan=lifespan,
+		title="Project 2",
+		summary="ItP endterm project",
+		license_info={
+			"name": "MIT",
+			"url": "https://mit-license.org/",
+		},
+	)
+	if os.path.isdir("static"):
+		app.mount("/static", StaticFiles(directory="static"), name="static")
+
+	templates = Jinja2Templates(directory="templates")
+
+	for route_name in routes.__all__:
+		route_cls: Type[AbstractRoute] = getattr(routes, route_name)
+		route_cls(app, templates, config)
 
+	@app.route("/")
+	async def _index(request: fastapi.Request):
+		return fastapi.responses.PlainTextResponse("hello, world!", status_code=fastapi.status.HTTP_200_OK)
 
-for route_name in routes.__all__:
-	route_cls: Type[AbstractRoute] = getattr(routes, route_name)
-	route = route_cls(app, templates, config)
+	return app
 
 
-@app.route("/")
-async def _index(request: fastapi.Request):
-	return fastapi.responses.PlainTextResponse("hello, world!", status_code=fastapi.status.HTTP_200_OK)
+config = Config("config.json")
+config.read()
+
+app = create_app(config)
 
 
 if __name__ == "__main__":
@@ -6,10 +6,14 @@ sys.path.append(os.path.abspath(".."))
 
 __all__ = (
 	"Course",
+	"CourseGrades",
+	"Grade",
 	"GraduateStudent",
+	"PackedGrades",
 	"Student",
 )
 
 
 from .course import Course
+from .grades import CourseGrades, Grade, PackedGrades
 from .student import GraduateStudent, Student
@@ -0,0 +1,177 @@
+from array import array
+from collections.abc import Iterable, Iterator, Mapping, MutableMapping
+from typing import Annotated, Any
+
+import pydantic
+
+# a grade as stored in PackedGrades
+Grade = Annotated[int, pydantic.Field(ge=-32768, le=32767)]
+
+
+def grade_array(grades: Iterable[int]) -> array:
+	"""Packs grades into a signed 16-bit array."""
+	if isinstance(grades, array) and grades.typecode == "h":
+		return grades
+	try:
+		return array("h", grades)
+	except (OverflowError, TypeError) as e:
+		raise ValueError(f"Grades must be integers between -32768 and 32767: {e}") from e
+
+
+class CourseGrades(array):
+	"""
+	The grades of one course as read from `PackedGrades`, a copy that raises on mutation: changing it would not change
+	the student's grades. Assign the grades instead, or `copy.copy` it for an array of your own.
+	"""
+
+	__slots__ = ()
+
+	def _read_only(self, *args, **kwargs):
+		raise TypeError("Course grades read from PackedGrades are a read-only copy, assign them to change them")
+
+	append = byteswap = extend = frombytes = fromfile = fromlist = fromunicode = insert = pop = remove = reverse = _read_only
+	__setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+
+class PackedGrades(MutableMapping[int, array]):
+	"""
+	A student's grades by course code, packed into three arrays: the course codes, the offset of each course's grades
+	and all grades as signed 16-bit ints. The grades take 2 bytes each; with the arrays and the student around them,
+	10 courses of 20 grades take ~7.7 bytes per grade against ~15.3 with lists (`python -m benchmarks.memory`).
+
+	Reading a course returns a read-only copy of its grades, a `CourseGrades` array.
+	"""
+
+	__slots__ = ("_codes", "_offsets", "_values")
+
+	def __init__(self, grades: Mapping[int, Iterable[int]] | None = None):
+		self._codes = array("q")
+		self._offsets = array("q", [0])
+		self._values = array("h")
+
+		if grades:
+			self._pack(grades)
+
+	def _pack(self, grades: Mapping[int, Iterable[int]]):
+		codes, offsets, values = self._codes, self._offsets, self._values
+
+		for course_code, course_grades in grades.items():
+			codes.append(int(course_code))
+			try:
+				if type(course_grades) is list:
+					values.fromlist(course_grades)
+				else:
+					values.extend(grade_array(course_grades))
+			except (OverflowError, TypeError) as e:
+				raise ValueError(f"Grades must be integers between -32768 and 32767: {e}") from e
+			offsets.append(len(values))
+
+		if len(set(codes)) != len(codes):
+			raise ValueError("Duplicate course codes in grades")
+
+	def _index(self, course_code: int) -> int:
+		try:
+			return self._codes.index(course_code)
+		except (ValueError, TypeError, OverflowError):
+			raise KeyError(course_code) from None
+
+	def __getitem__(self, course_code: int) -> array:
+		i = self._index(course_code)
+		return CourseGrades("h", self._values[self._offsets[i] : self._offsets[i + 1]])
+
+	def __setitem__(self, course_code: int, grades: Iterable[int]):
+		grades = grade_array(grades)
+
+		try:
+			i = self._index(course_code)
+		except KeyError:
+			self._codes.append(course_code)
+			self._values.extend(grades)
+			self._offsets.append(len(self._values))
+			return
+
+		start, end = self._offsets[i], self._offsets[i + 1]
+		self._values[start:end] = grades
+		self._shift(i + 1, len(grades) - (end - start))
+
+	def __delitem__(self, course_code: int):
+		i = self._index(course_code)
+		start, end = self._offsets[i], self._offsets[i + 1]
+
+		del self._values[start:end]
+		del self._codes[i]
+		del self._offsets[i + 1]
+		self._shift(i + 1, start - end)
+
+	def _shift(self, start: int, delta: int):
+		if delta:
+			for i in range(start, len(self._offsets)):
+				self._offsets[i] += delta
+
+	def __iter__(self) -> Iterator[int]:
+		return iter(self._codes.tolist())
+
+	def __len__(self) -> int:
+		return len(self._codes)
+
+	def __eq__(self, other: object) -> bool:
+		if isinstance(other, PackedGrades):
+			return self._codes == other._codes and self._offsets == other._offsets and self._values == other._values
+		if isinstance(other, Mapping):
+			return self.to_dict() == {course_code: list(grades) for course_code, grades in other.items()}
+		return NotImplemented
+
+	def __repr__(self) -> str:
+		return f"{type(self).__name__}({self.to_dict()!r})"
+
+	def packed(self) -> tuple[array, array, array]:
+		"""The course codes, offsets and grades arrays themselves, for bulk reads; they must not be modified."""
+		return self._codes, self._offsets, self._values
+
+	@property
+	def nbytes(self) -> int:
+		"""Bytes taken by the packed arrays' items."""
+		return sum(len(items) * items.itemsize for items in (self._codes, self._offsets, self._values))
+
+	def copy(self) -> "PackedGrades":
+		grades = PackedGrades()
+		grades._codes, grades._offsets, grades._values = array("q", self._codes), array("q", self._offsets), array("h", self._values)
+		return grades
+
+	__copy__ = copy
+
+	def __deepcopy__(self, memo: dict) -> "PackedGrades":
+		return self.copy()
+
+	def to_dict(self) -> dict[int, list[int]]:
+		values = self._values.tolist()
+		offsets = self._offsets
+		return {course_code: values[offsets[i] : offsets[i + 1]] for i, course_code in enumerate(self._codes)}
+
+
+def to_packed_grades(value: Any) -> PackedGrades:
+	if isinstance(value, PackedGrades):
+		return value
+	if not isinstance(value, Mapping):
+		raise TypeError("Grades must be a mapping of course codes to lists of grades")
+	try:
+		return PackedGrades(value)
+	except (TypeError, OverflowError) as e:
+		raise ValueError(f"Invalid course code: {e}") from e
+
+
+def validate_packed_grades(value: Any) -> PackedGrades:
+	"""`to_packed_grades` for pydantic, which reports only ValueErrors as validation errors."""
+	try:
+		return to_packed_grades(value)
+	except TypeError as e:
+		raise ValueError(*e.args) from e
+
+
+# validated from and serialized to {course_code: [grade, ...]}
+PackedGradesField = Annotated[
+	PackedGrades,
+	pydantic.PlainValidator(validate_packed_grades),
+	pydantic.PlainSerializer(PackedGrades.to_dict, return_type=dict[int, list[int]]),
+	pydantic.WithJsonSchema({"type": "object", "additionalProperties": {"type": "array", "items": {"type": "integer"}}}),
+]
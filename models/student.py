@@ -1,25 +1,98 @@
+from array import array
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, field
+from typing import Any
+
 import pydantic
 
+from .grades import PackedGrades, PackedGradesField, to_packed_grades
+
+
+@dataclass(slots=True)
+class GradeAggregates:
+	"""Running grade sums and counts of a student, per course and overall."""
+
+	sums: dict[int, int] = field(default_factory=dict)
+	counts: dict[int, int] = field(default_factory=dict)
+	total_sum: int = 0
+	total_count: int = 0
+
+	@classmethod
+	def from_grades(cls, grades: Mapping[int, array]) -> "GradeAggregates":
+		sums = {course_id: sum(course_grades) for course_id, course_grades in grades.items()}
+		counts = {course_id: len(course_grades) for course_id, course_grades in grades.items()}
+		return cls(sums, counts, sum(sums.values()), sum(counts.values()))
+
+	def set(self, course_id: int, grades: array):
+		self.total_sum -= self.sums.get(course_id, 0)
+		self.total_count -= self.counts.get(course_id, 0)
+
+		self.sums[course_id] = sum(grades)
+		self.counts[course_id] = len(grades)
+
+		self.total_sum += self.sums[course_id]
+		self.total_count += self.counts[course_id]
+
 
 class Student(pydantic.BaseModel):
+	# a slot rather than the model's __dict__, which must hold only fields: serializing a Student | GraduateStudent
+	# union picks the model by them. Reading a slot also skips pydantic's slow private attribute lookup
+	__slots__ = ("_aggregates",)
+
 	student_id: int
 	name: str
 	age: int
-	grades: dict[int, list[int]] = pydantic.Field(default_factory=dict)
+	grades: PackedGradesField = pydantic.Field(default_factory=PackedGrades)
+
+	def __setattr__(self, name: str, value: Any):
+		if name == "grades":
+			value = to_packed_grades(value)
+		super().__setattr__(name, value)
+		if name == "grades":
+			self.refresh_aggregates()
+
+	@classmethod
+	def from_trusted(cls, data: dict) -> "Student":
+		"""Builds a student or graduate student from data this app serialized itself, skipping validation."""
+		model = GraduateStudent if "thesis_topic" in data else Student
+		return model.model_construct(**{**data, "grades": PackedGrades(data.get("grades"))})
+
+	@property
+	def aggregates(self) -> GradeAggregates:
+		"""Grade aggregates, computed on first use and then kept in step with `grades` by `set_course_grades`."""
+		# the slot is unset until first use
+		aggregates = getattr(self, "_aggregates", None)
+		if aggregates is None:
+			aggregates = self._aggregates = GradeAggregates.from_grades(self.grades)
+		return aggregates
+
+	def refresh_aggregates(self):
+		"""Drops the aggregates so they get recomputed, needed only if `grades` was mutated in place."""
+		self._aggregates = None
+
+	def verify_aggregates(self) -> bool:
+		"""Checks the stored aggregates against a recomputation over `grades`."""
+		return self.aggregates == GradeAggregates.from_grades(self.grades)
+
+	def set_course_grades(self, course_id: int, grades: Iterable[int]):
+		"""Overwrites the grades for a course, updating the aggregates in O(len(grades))."""
+		self.grades[course_id] = grades
+		self.aggregates.set(course_id, self.grades[course_id])
 
 	def calculate_course_average_grades(self, course_id: int) -> float:
+		aggregates = self.aggregates
 		try:
-			grades = self.grades.get(course_id, [])
-			return round(sum(grades) / len(grades), 2)
+			return round(aggregates.sums.get(course_id, 0) / aggregates.counts.get(course_id, 0), 2)
 		except ZeroDivisionError:
 			return 0.0
 
 	def calculate_total_grade(self) -> int:
-		return sum(sum(grades) for grades in self.grades.values())
+		return self.aggregates.total_sum
 
 	def calculate_total_average_grade(self) -> float:
+		aggregates = self.aggregates
 		try:
-			return round(self.calculate_total_grade() / sum(len(grades) for grades in self.grades.values()), 2)
+			return round(aggregates.total_sum / aggregates.total_count, 2)
 		except ZeroDivisionError:
 			return 0.0
 
@@ -7,6 +7,11 @@ sys.path.append(os.path.abspath(".."))
 __all__ = (
 	"ConfigRoute",
 	"CourseRoute",
+	"DebugRoute",
+	"ExportRoute",
+	"FeedRoute",
+	"ImportRoute",
+	"MetricsRoute",
 	"ReportRoute",
 	"StudentRoute",
 )
@@ -14,5 +19,10 @@ __all__ = (
 
 from .config_route import ConfigRoute
 from .course_route import CourseRoute
+from .debug_route import DebugRoute
+from .export_route import ExportRoute
+from .feed_route import FeedRoute
+from .import_route import ImportRoute
+from .metrics_route import MetricsRoute
 from .report_route import ReportRoute
 from .student_route import StudentRoute
@@ -1,14 +1,58 @@
+import functools
+import time
+import weakref
+from collections.abc import AsyncIterator, Callable, Hashable, Sequence
 from dataclasses import dataclass, field
-from typing import Any, Callable, Sequence
+from typing import Any, TypeVar
 
 import fastapi
+import orjson
+import pydantic
 from fastapi.datastructures import Default
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
 from config import Config
 from models.course import Course
 from models.student import Student
+from util.admission import Permit
 from util.errors import NotFoundException
+from util.profiling import PROFILE_MODES, ActiveProfile, ProfileMode
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+ItemType = TypeVar("ItemType", bound=pydantic.BaseModel)
+
+
+# routes of the classes limited by `config.admission`; other methods are admitted as "write" unless they say otherwise
+HEAVY = "heavy"
+# the exports, which cost as long as their body streams: only they hold their slot until it is sent
+EXPORT = "export"
+WRITE = "write"
+READ_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+
+def accepts(header: str, value: str, wildcard: str | None = None) -> bool:
+	"""
+	Whether an Accept or Accept-Encoding header value lists `value`, or else `wildcard`, with a q-value above 0:
+	"gzip;q=0" refuses gzip.
+	"""
+	qualities: dict[str, float] = {}
+	for item in header.split(","):
+		name, *params = item.split(";")
+		quality = 1.0
+		for param in params:
+			key, _, number = param.partition("=")
+			if key.strip().lower() == "q":
+				try:
+					quality = float(number)
+				except ValueError:
+					quality = 0.0
+		qualities[name.strip().lower()] = quality
+
+	if value in qualities:
+		return qualities[value] > 0
+	return wildcard is not None and qualities.get(wildcard, 0.0) > 0
 
 
 @dataclass()
@@ -26,12 +70,14 @@ class APIRoute(BaseRoute):
 	response_model: Any = field(default_factory=lambda: Default(None))
 	include_in_schema: bool = True
 	deprecated: bool = False
+	admission: str | None = None
 
 
 @dataclass()
 class Route(BaseRoute):
 	methods: Sequence[str] = field(default_factory=lambda: ("GET",))
 	include_in_schema: bool = True
+	admission: str | None = None
 
 
 @dataclass()
@@ -54,7 +100,7 @@ class AbstractRoute:
 			elif isinstance(route, APIRoute):
 				self._app.add_api_route(
 					route.path,
-					route.endpoint,
+					self.wrap(route),
 					methods=route.methods,
 					name=route.name,
 					description=route.description,
@@ -64,11 +110,164 @@ class AbstractRoute:
 					include_in_schema=route.include_in_schema,
 				)
 			elif isinstance(route, Route):
-				self._app.add_route(route.path, route.endpoint, methods=route.methods, include_in_schema=route.include_in_schema)
+				self._app.add_route(route.path, self.wrap(route), methods=route.methods, include_in_schema=route.include_in_schema)
 
 	def init(self, *args, **kwargs) -> None:
 		pass
 
+	def wrap(self, route: APIRoute | Route) -> Callable[..., Any]:
+		"""The route's endpoint, profiled, admitted and instrumented (outermost), see the methods doing each."""
+		return self.instrument(route, self.admit(route, self.profile(route, route.endpoint)))
+
+	def instrument(self, route: APIRoute | Route, endpoint: Callable[..., Any]) -> Callable[..., Any]:
+		"""
+		Wraps an endpoint to record its latency, in-flight requests and responses by status in `config.metrics`, unless
+		metrics are disabled. Streaming responses are timed until their body is sent.
+		"""
+		metrics = self.config.metrics
+		labels = (",".join(route.methods), route.path)
+		duration = metrics.histogram("http_request_duration_seconds", "Request latency by route", ("method", "route")).labels(*labels)
+		in_flight = metrics.gauge("http_requests_in_flight", "Requests being handled by route", ("method", "route")).labels(*labels)
+		responses = metrics.counter("http_responses_total", "Responses by route and status", ("method", "route", "status"))
+		responses_by_status = {}
+
+		# on every request, so the gauge and counters are updated in place rather than through method calls
+		def finished(start: float, status_code: int):
+			duration.observe(time.perf_counter() - start)
+			in_flight.value -= 1
+			counter = responses_by_status.get(status_code)
+			if counter is None:
+				counter = responses_by_status[status_code] = responses.labels(*labels, str(status_code))
+			counter.value += 1
+
+		async def observed(body: AsyncIterator, start: float, status_code: int) -> AsyncIterator:
+			try:
+				async for chunk in body:
+					yield chunk
+			finally:
+				finished(start, status_code)
+
+		@functools.wraps(endpoint)
+		async def instrumented(*args, **kwargs):
+			if not metrics.enabled:
+				return await endpoint(*args, **kwargs)
+
+			start = time.perf_counter()
+			in_flight.value += 1
+			status_code = 500
+			streaming = False
+			try:
+				response = await endpoint(*args, **kwargs)
+				status_code = getattr(response, "status_code", 200)
+				if isinstance(response, StreamingResponse):
+					response.body_iterator = observed(response.body_iterator, start, status_code)
+					streaming = True
+				return response
+			except fastapi.HTTPException as e:
+				status_code = e.status_code
+				raise
+			finally:
+				if not streaming:
+					finished(start, status_code)
+
+		return instrumented
+
+	@staticmethod
+	def profile_mode(request: fastapi.Request) -> ProfileMode | None:
+		"""The profiler a request asks for with an X-Profile header or a profile query parameter: `sample`, otherwise cProfile."""
+		value = request.headers.get("x-profile") or request.query_params.get("profile")
+		if not value:
+			return None
+		return value if value in PROFILE_MODES else "cprofile"
+
+	def admit(self, route: APIRoute | Route, endpoint: Callable[..., Any]) -> Callable[..., Any]:
+		"""
+		Wraps an endpoint to wait for a slot of its route class in `config.admission` first: `route.admission`, or "write"
+		for methods other than GET. Rejected requests get a 503 (or 429) with Retry-After at once, rather than queueing
+		up behind the slow ones. Streaming responses read from a snapshot taken by the endpoint, so their slot is released
+		when it returns, except for exports: a slot of their own class is held until their body is sent.
+		"""
+		admission = self.config.admission
+		name = route.admission or (WRITE if set(route.methods) - READ_METHODS else None)
+		if name is None:
+			return endpoint
+		holds_stream = name == EXPORT
+
+		async def released(body: AsyncIterator, permit: Permit) -> AsyncIterator:
+			try:
+				async for chunk in body:
+					yield chunk
+			finally:
+				permit.release()
+
+		@functools.wraps(endpoint)
+		async def admitted(*args, **kwargs):
+			limit = admission.limit(name)
+			if limit is None:
+				return await endpoint(*args, **kwargs)
+
+			permit = await limit.acquire()
+			streaming = False
+			try:
+				response = await endpoint(*args, **kwargs)
+				if holds_stream and isinstance(response, StreamingResponse):
+					response.body_iterator = released(response.body_iterator, permit)
+					# a body never started (the client left first) never runs its finally
+					weakref.finalize(response, permit.release)
+					streaming = True
+				return response
+			finally:
+				if not streaming:
+					permit.release()
+
+		return admitted
+
+	def profile(self, route: APIRoute | Route, endpoint: Callable[..., Any]) -> Callable[..., Any]:
+		"""
+		Wraps an endpoint to run the requests asking for it under a profiler, stored in `config.profiles` and named by
+		the X-Profile-Id response header. Unless profiling is enabled the request isn't even looked at. Streaming
+		responses are profiled until their body is sent.
+		"""
+		profiles = self.config.profiles
+		label = route.path
+
+		async def profiled_body(body: AsyncIterator, active: ActiveProfile, request: fastapi.Request, status_code: int) -> AsyncIterator:
+			try:
+				async for chunk in body:
+					yield chunk
+			finally:
+				profiles.finish(active, request.method, request.url.path, label, status_code)
+
+		@functools.wraps(endpoint)
+		async def profiled(*args, **kwargs):
+			if not profiles.enabled:
+				return await endpoint(*args, **kwargs)
+
+			request = kwargs["request"] if "request" in kwargs else args[0]
+			mode = self.profile_mode(request)
+			active = profiles.start(mode) if mode is not None else None
+			if active is None:
+				return await endpoint(*args, **kwargs)
+
+			status_code = 500
+			streaming = False
+			try:
+				response = await endpoint(*args, **kwargs)
+				status_code = response.status_code
+				response.headers["X-Profile-Id"] = active.id
+				if isinstance(response, StreamingResponse):
+					response.body_iterator = profiled_body(response.body_iterator, active, request, status_code)
+					streaming = True
+				return response
+			except fastapi.HTTPException as e:
+				status_code = e.status_code
+				raise
+			finally:
+				if not streaming:
+					profiles.finish(active, request.method, request.url.path, label, status_code)
+
+		return profiled
+
 	@property
 	def app(self) -> fastapi.FastAPI:
 		return self._app
@@ -106,3 +305,104 @@ class AbstractRoute:
 			raise NotFoundException(f"Student {student_id} not found")
 
 		return student
+
+	@staticmethod
+	def accepts_ndjson(request: fastapi.Request) -> bool:
+		# */* doesn't count, NDJSON is only sent to clients asking for it
+		return accepts(request.headers.get("accept", ""), NDJSON_MEDIA_TYPE)
+
+	@staticmethod
+	def accepts_gzip(request: fastapi.Request) -> bool:
+		return accepts(request.headers.get("accept-encoding", ""), "gzip", wildcard="*")
+
+	@staticmethod
+	def ndjson_response(
+		page: Callable[[int | None, int], Sequence[pydantic.BaseModel]],
+		key: Callable[[Any], int],
+		after_id: int | None = None,
+		limit: int | None = None,
+		chunk_size: int = 1000,
+	) -> StreamingResponse:
+		"""
+		Streams entities as NDJSON, fetching `chunk_size` of them at a time with `page(after_id, limit)` and continuing from the
+		`key` of the last one, so memory stays flat whatever the size of the school.
+		"""
+
+		async def generate() -> AsyncIterator[bytes]:
+			cursor, remaining = after_id, limit
+			while remaining is None or remaining > 0:
+				size = chunk_size if remaining is None else min(chunk_size, remaining)
+				entities = page(cursor, size)
+				if not entities:
+					break
+
+				yield b"".join([orjson.dumps(entity.model_dump(mode="json")) + b"\n" for entity in entities])
+
+				if len(entities) < size:
+					break
+				cursor = key(entities[-1])
+				if remaining is not None:
+					remaining -= len(entities)
+
+		return StreamingResponse(generate(), media_type=NDJSON_MEDIA_TYPE)
+
+	def cached_json_response(self, request: fastapi.Request, key: Hashable, version: int, content: Callable[[], Any]) -> Response:
+		"""
+		Returns `content()` encoded as JSON, cached per `key` until `version` changes, with a strong ETag.
+		A matching If-None-Match is answered with 304 without calling `content`.
+		"""
+		school = self.config.school
+		etag = f'"{school.epoch}-{version}"'
+
+		if_none_match = request.headers.get("if-none-match")
+		if if_none_match is not None and any(tag.strip() in (etag, "*") for tag in if_none_match.split(",")):
+			return Response(status_code=fastapi.status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+		cache = self.config.response_cache
+		cache_version = (school.epoch, version)
+
+		body = cache.get(key, cache_version)
+		if body is None:
+			body = orjson.dumps(content(), option=orjson.OPT_NON_STR_KEYS)
+			cache.put(key, cache_version, body)
+
+		return Response(body, fastapi.status.HTTP_200_OK, headers={"ETag": etag}, media_type="application/json")
+
+	@staticmethod
+	def ranking(ranked: list[tuple[Student, float]], k: int, offset: int) -> dict:
+		"""A page of `School.top_students`/`top_course_students` with 1-based ranks and the offset of the next page."""
+		students = [{**student.model_dump(), "average": average, "rank": offset + i + 1} for i, (student, average) in enumerate(ranked)]
+		return {"students": students, "next_offset": offset + k if len(ranked) == k else None}
+
+	@staticmethod
+	async def read_bulk_items(request: fastapi.Request, model: type[ItemType]) -> tuple[list[tuple[int, ItemType]], list[dict]]:
+		"""Parses a JSON array or NDJSON body into `model` items, returning the valid (index, item) pairs and a per-item error list."""
+		body = await request.body()
+
+		if NDJSON_MEDIA_TYPE in request.headers.get("content-type", ""):
+			lines = [line for line in body.splitlines() if line.strip()]
+		else:
+			try:
+				raw = orjson.loads(body)
+			except orjson.JSONDecodeError as e:
+				return [], [{"index": None, "error": f"Invalid JSON: {e}"}]
+
+			if not isinstance(raw, list):
+				return [], [{"index": None, "error": "Expected a JSON array of items"}]
+			lines = raw
+
+		items, errors = [], []
+		for index, line in enumerate(lines):
+			try:
+				items.append((index, model.model_validate_json(line) if isinstance(line, bytes) else model.model_validate(line)))
+			except pydantic.ValidationError as e:
+				errors.append({"index": index, "error": "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" if error["loc"] else error["msg"] for error in e.errors())})
+
+		return items, errors
+
+	@staticmethod
+	def bulk_response(applied: int, errors: list[dict]) -> JSONResponse:
+		if errors:
+			errors.sort(key=lambda error: -1 if error["index"] is None else error["index"])
+			return JSONResponse({"detail": "Nothing was applied, fix the failed items and retry", "applied": 0, "errors": errors}, fastapi.status.HTTP_400_BAD_REQUEST)
+		return JSONResponse({"applied": applied, "errors": []}, fastapi.status.HTTP_200_OK)
@@ -7,8 +7,34 @@ from .base_route import AbstractRoute, APIRoute
 class ConfigRoute(AbstractRoute):
 	def init(self) -> None:
 		self.base_path = "/api/config"
-		self.routes = (APIRoute(f"{self.base_path}/reload", self.reload, methods=("POST",), name="Config reload", description="Reloads the configuration by reading from config.json file"),)
+		self.routes = (
+			APIRoute(f"{self.base_path}/reload", self.reload, methods=("POST",), name="Config reload", description="Reloads the configuration by reading from config.json file"),
+			APIRoute(
+				f"{self.base_path}/reload",
+				self.reload_stats,
+				methods=("GET",),
+				name="Reload stats",
+				description="Returns reload counters: durations and the number of students and courses changed by the last reload",
+			),
+			APIRoute(
+				f"{self.base_path}/persistence",
+				self.persistence,
+				methods=("GET",),
+				name="Persistence stats",
+				description="Returns background persistence counters: coalesced mutations, flushes and flush latency",
+			),
+			APIRoute(f"{self.base_path}/cache", self.cache, methods=("GET",), name="Response cache stats", description="Returns response cache hits, misses, evictions and size"),
+		)
 
 	async def reload(self, request: Request) -> JSONResponse:
-		self.config.reload()
+		await self.config.reload()
 		return JSONResponse({"message": "Configuration reloaded successfully."}, status.HTTP_200_OK)
+
+	async def reload_stats(self, request: Request) -> JSONResponse:
+		return JSONResponse(self.config.reload_stats.as_dict(), status.HTTP_200_OK)
+
+	async def persistence(self, request: Request) -> JSONResponse:
+		return JSONResponse({"dirty": self.config.writer.dirty, **self.config.writer.stats.as_dict()}, status.HTTP_200_OK)
+
+	async def cache(self, request: Request) -> JSONResponse:
+		return JSONResponse(self.config.response_cache.stats.as_dict(), status.HTTP_200_OK)
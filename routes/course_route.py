@@ -1,7 +1,8 @@
 from typing import Annotated
 
-from fastapi import Body, Path, Request, status
-from fastapi.responses import JSONResponse
+import pydantic
+from fastapi import Body, Path, Query, Request, status
+from fastapi.responses import JSONResponse, Response
 
 from models.course import Course
 from util.errors import AlreadyExistsException, NotFoundException
@@ -9,31 +10,130 @@ from util.errors import AlreadyExistsException, NotFoundException
 from .base_route import AbstractRoute, APIRoute
 
 
+class CourseItem(pydantic.BaseModel):
+	course_id: int
+	course_name: str
+
+
+class EnrollmentItem(pydantic.BaseModel):
+	course_id: int
+	student_id: int
+
+
 class CourseRoute(AbstractRoute):
 	def init(self) -> None:
 		self.base_path = "/api/course"
 		self.routes = (
-			APIRoute(f"{self.base_path}/", self.courses_list, methods=("GET",), name="Courses list", description="Returns a list of all courses"),
+			APIRoute(
+				f"{self.base_path}/bulk",
+				self.courses_bulk_put,
+				methods=("POST",),
+				name="Courses bulk put",
+				description="Creates many courses from a JSON array or NDJSON body of {course_id, course_name} items, all or nothing, persisted once",
+			),
+			APIRoute(
+				f"{self.base_path}/bulk/enroll_student",
+				self.courses_bulk_enroll_student,
+				methods=("POST",),
+				name="Courses bulk enroll students",
+				description="Enrolls many {course_id, student_id} pairs from a JSON array or NDJSON body, all or nothing, persisted once",
+			),
+			APIRoute(
+				f"{self.base_path}/stats",
+				self.courses_stats,
+				methods=("GET",),
+				name="Courses stats",
+				description="Returns the grade stats of every course by course code, see Course stats",
+			),
+			APIRoute(
+				f"{self.base_path}/",
+				self.courses_list,
+				methods=("GET",),
+				name="Courses list",
+				description="Returns courses ordered by code, paginated with limit and after_id, or streamed as NDJSON with Accept: application/x-ndjson",
+			),
 			APIRoute(f"{self.base_path}/{'{course_id}'}", self.courses_get, methods=("GET",), name="Course get", description="Returns a course by ID"),
+			APIRoute(
+				f"{self.base_path}/{'{course_id}'}/stats",
+				self.courses_get_stats,
+				methods=("GET",),
+				name="Course stats",
+				description="Returns count, mean, median, stddev, min, max, percentiles and a histogram of the grades of the course's enrolled students",
+			),
+			APIRoute(
+				f"{self.base_path}/{'{course_id}'}/top",
+				self.courses_top,
+				methods=("GET",),
+				name="Course top students",
+				description="Returns k enrolled students by descending average grade in the course (ties by ID) from rank offset on, each with its average and rank",
+			),
 			APIRoute(f"{self.base_path}/{'{course_id}'}", self.courses_put, methods=("PUT",), name="Course put", description="Creates a new course"),
 			APIRoute(f"{self.base_path}/{'{course_id}'}", self.courses_patch, methods=("PATCH",), name="Course update", description="Updates a course by ID"),
 			APIRoute(f"{self.base_path}/{'{course_id}'}/enroll_student", self.courses_enroll_student, methods=("PUT",), name="Course enroll student", description="Enrolls a student to a course"),
 			APIRoute(f"{self.base_path}/{'{course_id}'}/enroll_student", self.courses_delete_student, methods=("DELETE",), name="Course delete student", description="Deletes a student from a course"),
 		)
 
-	async def courses_list(self, request: Request) -> JSONResponse:
+	async def courses_list(
+		self,
+		request: Request,
+		limit: Annotated[int | None, Query(title="Limit", ge=1)] = None,
+		after_id: Annotated[int | None, Query(title="After ID", description="Returns courses after this ID")] = None,
+	) -> Response:
 		school = self.config.school
 
-		courses = [course.model_dump() for course in school.courses.values()]
+		if self.accepts_ndjson(request):
+			# a snapshot, as for the students list
+			snapshot = school.snapshot()
+			return self.ndjson_response(lambda cursor, size: snapshot.page_courses(after_id=cursor, limit=size), lambda course: course.course_code, after_id=after_id, limit=limit)
+
+		def content() -> dict:
+			page = school.page_courses(after_id=after_id, limit=limit)
+			next_after_id = page[-1].course_code if limit is not None and len(page) == limit else None
+			return {"courses": [course.model_dump() for course in page], "next_after_id": next_after_id}
 
-		return JSONResponse({"courses": courses}, status.HTTP_200_OK)
+		return self.cached_json_response(request, ("courses", after_id, limit), school.collection_version("course"), content)
 
-	async def courses_get(self, request: Request, course_id: int) -> JSONResponse:
+	async def courses_get(self, request: Request, course_id: int) -> Response:
 		course = self.get_course(course_id)
 
-		return JSONResponse(course.model_dump(), status.HTTP_200_OK)
+		return self.cached_json_response(request, ("course", course_id), self.config.school.entity_version("course", course_id), course.model_dump)
+
+	async def courses_stats(self, request: Request) -> Response:
+		school = self.config.school
+		version = max((school.course_stats_version(course_code) for course_code in school.courses), default=0)
+
+		return self.cached_json_response(request, ("courses stats",), max(version, school.collection_version("course")), school.all_course_stats)
+
+	async def courses_get_stats(self, request: Request, course_id: int) -> Response:
+		course = self.get_course(course_id)
+		school = self.config.school
+
+		return self.cached_json_response(request, ("course stats", course_id), school.course_stats_version(course_id), lambda: school.course_stats(course.course_code))
+
+	async def courses_top(
+		self,
+		request: Request,
+		course_id: int,
+		k: Annotated[int, Query(title="K", ge=1, le=1000)] = 10,
+		offset: Annotated[int, Query(title="Offset", ge=0)] = 0,
+	) -> Response:
+		course = self.get_course(course_id)
+		school = self.config.school
+		# enrollments change the course, grades and names the students
+		version = max(school.entity_version("course", course_id), school.collection_version("student"))
+
+		def content() -> dict:
+			return self.ranking(school.top_course_students(course.course_code, k, offset=offset), k, offset)
 
-	async def courses_put(self, request: Request, course_id: Annotated[int, Path(title="Course ID")], course_name: Annotated[str, Body(title="Course Name", embed=True)]) -> JSONResponse:
+		return self.cached_json_response(request, ("course top", course_id, k, offset), version, content)
+
+	async def courses_put(
+		self,
+		request: Request,
+		course_id: Annotated[int, Path(title="Course ID")],
+		course_name: Annotated[str, Body(title="Course Name", embed=True)],
+		durable: Annotated[bool, Query(title="Durable", description="Waits until the change is written to disk")] = False,
+	) -> JSONResponse:
 		school = self.config.school
 
 		if course := school.courses.get(course_id):
@@ -42,41 +142,114 @@ class CourseRoute(AbstractRoute):
 		course = Course(course_code=course_id, course_name=course_name, enrolled_students=set())
 		school.add_course(course)
 
-		self.config.save()
+		await self.config.commit(durable)
 
 		return JSONResponse(course.model_dump(), status.HTTP_200_OK)
 
-	async def courses_patch(self, request: Request, course_id: Annotated[int, Path(title="Course ID")], course_name: Annotated[str, Body(title="Course Name", embed=True)]) -> JSONResponse:
+	async def courses_patch(
+		self,
+		request: Request,
+		course_id: Annotated[int, Path(title="Course ID")],
+		course_name: Annotated[str, Body(title="Course Name", embed=True)],
+		durable: Annotated[bool, Query(title="Durable", description="Waits until the change is written to disk")] = False,
+	) -> JSONResponse:
 		course = self.get_course(course_id)
 
-		course.course_name = course_name
+		course = self.config.school.update_course(course.course_code, course_name)
 
-		self.config.save()
+		await self.config.commit(durable)
 
 		return JSONResponse(course.model_dump(), status.HTTP_200_OK)
 
-	async def courses_enroll_student(self, request: Request, course_id: Annotated[int, Path(title="Course ID")], student_id: Annotated[int, Body(title="Student ID", embed=True)]) -> JSONResponse:
+	async def courses_enroll_student(
+		self,
+		request: Request,
+		course_id: Annotated[int, Path(title="Course ID")],
+		student_id: Annotated[int, Body(title="Student ID", embed=True)],
+		durable: Annotated[bool, Query(title="Durable", description="Waits until the change is written to disk")] = False,
+	) -> JSONResponse:
 		course = self.get_course(course_id)
 		student = self.get_student(student_id)
 
 		if student.student_id in course.enrolled_students:
 			raise AlreadyExistsException(f"Student {student.student_id} is already enrolled to course {course_id}")
 
-		course.enrolled_students.add(student.student_id)
+		course = self.config.school.enroll_student(course.course_code, student.student_id)
 
-		self.config.save()
+		await self.config.commit(durable)
 
 		return JSONResponse(course.model_dump(), status.HTTP_200_OK)
 
-	async def courses_delete_student(self, request: Request, course_id: Annotated[int, Path(title="Course ID")], student_id: Annotated[int, Body(title="Student ID", embed=True)]) -> JSONResponse:
+	async def courses_delete_student(
+		self,
+		request: Request,
+		course_id: Annotated[int, Path(title="Course ID")],
+		student_id: Annotated[int, Body(title="Student ID", embed=True)],
+		durable: Annotated[bool, Query(title="Durable", description="Waits until the change is written to disk")] = False,
+	) -> JSONResponse:
 		course = self.get_course(course_id)
 		student = self.get_student(student_id)
 
 		if student.student_id not in course.enrolled_students:
 			raise NotFoundException(f"Student {student.student_id} is not enrolled to course {course_id}")
 
-		course.enrolled_students.remove(student.student_id)
+		course = self.config.school.unenroll_student(course.course_code, student.student_id)
 
-		self.config.save()
+		await self.config.commit(durable)
 
 		return JSONResponse(course.model_dump(), status.HTTP_200_OK)
+
+	async def courses_bulk_put(
+		self,
+		request: Request,
+		durable: Annotated[bool, Query(title="Durable", description="Waits until the change is written to disk")] = False,
+	) -> JSONResponse:
+		school = self.config.school
+
+		items, errors = await self.read_bulk_items(request, CourseItem)
+
+		seen = set()
+		for index, item in items:
+			if item.course_id in school.courses or item.course_id in seen:
+				errors.append({"index": index, "error": f"Course {item.course_id} already exists"})
+			seen.add(item.course_id)
+
+		if errors:
+			return self.bulk_response(0, errors)
+
+		for _, item in items:
+			school.add_course(Course(course_code=item.course_id, course_name=item.course_name, enrolled_students=set()))
+
+		await self.config.commit(durable)
+
+		return self.bulk_response(len(items), errors)
+
+	async def courses_bulk_enroll_student(
+		self,
+		request: Request,
+		durable: Annotated[bool, Query(title="Durable", description="Waits until the change is written to disk")] = False,
+	) -> JSONResponse:
+		school = self.config.school
+
+		items, errors = await self.read_bulk_items(request, EnrollmentItem)
+
+		seen = set()
+		for index, item in items:
+			course = school.courses.get(item.course_id)
+			if course is None:
+				errors.append({"index": index, "error": f"Course {item.course_id} not found"})
+			elif item.student_id not in school.students:
+				errors.append({"index": index, "error": f"Student {item.student_id} not found"})
+			elif item.student_id in course.enrolled_students or (item.course_id, item.student_id) in seen:
+				errors.append({"index": index, "error": f"Student {item.student_id} is already enrolled to course {item.course_id}"})
+			seen.add((item.course_id, item.student_id))
+
+		if errors:
+			return self.bulk_response(0, errors)
+
+		for _, item in items:
+			school.enroll_student(item.course_id, item.student_id)
+
+		await self.config.commit(durable)
+
+		return self.bulk_response(len(items), errors)
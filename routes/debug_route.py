@@ -0,0 +1,46 @@
+import os
+from typing import Annotated
+
+from fastapi import Path, Request
+from fastapi.responses import FileResponse, JSONResponse
+
+from util.errors import NotFoundException
+
+from .base_route import AbstractRoute, APIRoute
+
+MEDIA_TYPES = {"cprofile": "application/octet-stream", "sample": "text/plain; charset=utf-8"}
+
+
+class DebugRoute(AbstractRoute):
+	"""The profiles of requests sent with X-Profile or ?profile= while `profiling` is enabled; see `util.profiling`."""
+
+	def init(self) -> None:
+		self.base_path = "/api/debug"
+		self.routes = (
+			APIRoute(f"{self.base_path}/profiles", self.profiles_get, methods=("GET",), name="Profiles", description="Lists the stored request profiles, newest first"),
+			APIRoute(
+				f"{self.base_path}/profiles/{'{profile_id}'}",
+				self.profile_get,
+				methods=("GET",),
+				name="Profile",
+				description="Downloads a profile: cProfile stats to read with pstats or snakeviz, or collapsed stacks of the sampling profiler for flamegraph.pl or speedscope",
+			),
+		)
+
+	def check_enabled(self):
+		if not self.config.profiles.enabled:
+			raise NotFoundException("Profiling is disabled")
+
+	async def profiles_get(self, request: Request) -> JSONResponse:
+		self.check_enabled()
+		return JSONResponse({"profiles": [profile.as_dict() for profile in self.config.profiles.list()]})
+
+	async def profile_get(self, request: Request, profile_id: Annotated[str, Path(title="Profile ID")]) -> FileResponse:
+		self.check_enabled()
+
+		found = self.config.profiles.get(profile_id)
+		if found is None:
+			raise NotFoundException(f"Profile {profile_id} not found")
+
+		profile, path = found
+		return FileResponse(path, media_type=MEDIA_TYPES[profile.mode], filename=os.path.basename(path))
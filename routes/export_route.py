@@ -0,0 +1,136 @@
+from collections.abc import AsyncIterator, Iterator
+from typing import Annotated
+
+from fastapi import Query, Request, status
+from fastapi.responses import StreamingResponse
+
+from config import School
+from config.exporter import GRADE_COLUMNS, STUDENT_COLUMNS, ExportFormat, encode, grade_rows, gzipped, student_rows
+from util.errors import RequestException
+
+from .base_route import EXPORT, NDJSON_MEDIA_TYPE, AbstractRoute, APIRoute
+
+SINCE_DESCRIPTION = "The X-Export-Version of an earlier export: only the students changed after it are exported. A version of another epoch (e.g. before a reload) gets a full export"
+
+
+class ExportRoute(AbstractRoute):
+	"""
+	Flat CSV or NDJSON exports for analytics, streamed from a snapshot of the school chunk by chunk, so memory stays
+	flat whatever its size. Gzipped on the fly for clients sending Accept-Encoding: gzip. Chunks are encoded on the
+	thread pool of `config.admission`.
+	"""
+
+	# students read per page of ids
+	chunk_students = 1000
+
+	def init(self) -> None:
+		self.base_path = "/api/export"
+		self.routes = (
+			APIRoute(
+				f"{self.base_path}/students",
+				self.export_students,
+				methods=("GET",),
+				name="Export students",
+				description="Streams a row per student (ID, name, age, thesis topic, total average grade) as CSV or NDJSON; incremental exports add a deleted column",
+				admission=EXPORT,
+			),
+			APIRoute(
+				f"{self.base_path}/grades",
+				self.export_grades,
+				methods=("GET",),
+				name="Export grades",
+				description="Streams a row per grade (student ID and name, course code and name, grade) as CSV or NDJSON",
+				admission=EXPORT,
+			),
+		)
+
+	def student_ids(self, school: School, since: str | None) -> tuple[Iterator[int], bool]:
+		"""The ids to export, ascending: all of them, or the ones changed since an export of the same epoch. Also returns whether the export is incremental."""
+		if since is not None:
+			epoch, _, version = since.rpartition("-")
+			if not version.isdigit():
+				raise RequestException("since must be the X-Export-Version of an earlier export", status.HTTP_400_BAD_REQUEST)
+			if epoch == school.epoch:
+				return iter(school.changed_since("student", int(version))), True
+
+		def every_id() -> Iterator[int]:
+			after_id = None
+			while page := school.page_students(after_id=after_id, limit=self.chunk_students):
+				yield from [student.student_id for student in page]
+				after_id = page[-1].student_id
+
+		return every_id(), False
+
+	def stream(self, request: Request, school: School, name: str, format: ExportFormat, chunks: Iterator[bytes], incremental: bool) -> StreamingResponse:
+		if self.accepts_gzip(request):
+			chunks = gzipped(chunks)
+			headers = {"Content-Encoding": "gzip"}
+		else:
+			headers = {}
+
+		run = self.config.admission.run
+
+		async def generate() -> AsyncIterator[bytes]:
+			# the chunks are read from a snapshot, a large export would otherwise hold the event loop until it is done
+			while (chunk := await run(next, chunks, None)) is not None:
+				yield chunk
+
+		headers |= {
+			"Vary": "Accept-Encoding",
+			"Content-Disposition": f'attachment; filename="{name}.{"csv" if format == "csv" else "ndjson"}"',
+			"X-Export-Version": f"{school.epoch}-{school.version}",
+			"X-Export-Incremental": "true" if incremental else "false",
+		}
+		return StreamingResponse(generate(), media_type="text/csv" if format == "csv" else NDJSON_MEDIA_TYPE, headers=headers)
+
+	def export_format(self, request: Request, format: ExportFormat | None) -> ExportFormat:
+		if format is not None:
+			return format
+		return "ndjson" if self.accepts_ndjson(request) else "csv"
+
+	async def export_students(
+		self,
+		request: Request,
+		format: Annotated[ExportFormat | None, Query(title="Format", description="CSV unless Accept is application/x-ndjson")] = None,
+		since: Annotated[str | None, Query(title="Since", description=SINCE_DESCRIPTION)] = None,
+	) -> StreamingResponse:
+		format = self.export_format(request, format)
+		# the export spans many awaits, it is served from a snapshot so writes in between don't show up half way
+		school = self.config.school.snapshot()
+		ids, incremental = self.student_ids(school, since)
+
+		columns = (*STUDENT_COLUMNS, "deleted") if incremental else STUDENT_COLUMNS
+		return self.stream(request, school, "students", format, encode(columns, student_rows(school, ids, deleted=incremental), format), incremental)
+
+	async def export_grades(
+		self,
+		request: Request,
+		format: Annotated[ExportFormat | None, Query(title="Format", description="CSV unless Accept is application/x-ndjson")] = None,
+		since: Annotated[
+			str | None,
+			Query(
+				title="Since",
+				description=(
+					f"{SINCE_DESCRIPTION}. Replace all grade rows of the exported students: students enrolled to or unenrolled from a course since, or of a course "
+					"changed or removed since, are exported too; a removed student, or one left without grades, gets a single row with empty course and grade columns "
+					"and the deleted column telling which"
+				),
+			),
+		] = None,
+	) -> StreamingResponse:
+		format = self.export_format(request, format)
+		school = self.config.school.snapshot()
+		ids, incremental = self.student_ids(school, since)
+
+		if incremental:
+			version = int(since.rpartition("-")[2])
+			# enrolling, unenrolling and removing a course change the rows of the students concerned, renaming it those of
+			# every student in it
+			changed = {*ids, *school.changed_since("enrollments", version)}
+			for course_code in school.changed_since("course", version):
+				if (course := school.courses.get(course_code)) is not None:
+					changed |= course.enrolled_students
+			ids = iter(sorted(changed))
+
+		columns = (*GRADE_COLUMNS, "deleted") if incremental else GRADE_COLUMNS
+		return self.stream(request, school, "grades", format, encode(columns, grade_rows(school, ids, deleted=incremental), format), incremental)
@@ -0,0 +1,91 @@
+import asyncio
+
+import orjson
+from fastapi import WebSocket, WebSocketDisconnect, status
+
+from config.feed import FeedClient, encode
+
+from .base_route import AbstractRoute, WebSocketRoute
+
+
+def parse_keys(values: list[str]) -> list[int] | None:
+	"""Comma separated ids of repeated query parameters, None if there are none."""
+	if not values:
+		return None
+	return [int(value) for joined in values for value in joined.split(",") if value.strip()]
+
+
+def subscription_keys(keys: object) -> list[int] | None:
+	"""The ids of a subscription message field: a list of ints or null, anything else (e.g. "12", [true]) is a TypeError."""
+	if keys is None:
+		return None
+	if not isinstance(keys, list) or not all(type(key) is int for key in keys):
+		raise TypeError(keys)
+	return keys
+
+
+class FeedRoute(AbstractRoute):
+	"""
+	`/ws/changes` pushes a JSON array of delta events of the school as they happen; see `config.feed`. Subscribe to some
+	students and courses with `?students=1,2&courses=3`, or later by sending `{"students": [...], "courses": [...]}`,
+	and resume with `?since=<epoch>-<version>` of the last event seen.
+	"""
+
+	# events sent per message when a client is behind
+	max_batch = 500
+
+	def init(self) -> None:
+		self.routes = (WebSocketRoute("/ws/changes", self.changes),)
+
+	async def changes(self, websocket: WebSocket):
+		params = websocket.query_params
+		try:
+			students = parse_keys(params.getlist("students"))
+			courses = parse_keys(params.getlist("courses"))
+			since = None
+			if (cursor := params.get("since")) is not None:
+				epoch, _, version = cursor.rpartition("-")
+				since = (epoch, int(version))
+		except ValueError:
+			await websocket.close(status.WS_1008_POLICY_VIOLATION, "students and courses must be ids, since <epoch>-<version>")
+			return
+
+		await websocket.accept()
+		feed = self.config.feed
+		client = feed.connect(students, courses, since)
+		sender = asyncio.create_task(self.send(websocket, client))
+		try:
+			while True:
+				message = await websocket.receive_text()
+				try:
+					subscription = orjson.loads(message)
+					if not isinstance(subscription, dict):
+						raise TypeError(subscription)
+					students, courses = subscription_keys(subscription.get("students")), subscription_keys(subscription.get("courses"))
+				except (TypeError, ValueError):
+					client.push(encode({"type": "error", "detail": 'Send {"students": [ids] | null, "courses": [ids] | null}'}))
+					continue
+				feed.subscribe(client, students, courses)
+				subscribed = {kind: sorted(keys) if keys is not None else None for kind, keys in (("students", client.students), ("courses", client.courses))}
+				client.push(encode({"type": "subscribed", **subscribed}))
+		except WebSocketDisconnect:
+			pass
+		finally:
+			feed.disconnect(client)
+			sender.cancel()
+
+	async def send(self, websocket: WebSocket, client: FeedClient):
+		stats = self.config.feed.stats
+		try:
+			while True:
+				await client.ready.wait()
+				client.ready.clear()
+				if client.overflowed:
+					await websocket.close(status.WS_1013_TRY_AGAIN_LATER, "Too far behind, reconnect with since=<epoch>-<version> of the last event")
+					return
+				while client.pending:
+					await websocket.send_text(f"[{','.join(client.drain(self.max_batch))}]")
+					stats.sent += 1
+		except (WebSocketDisconnect, RuntimeError):
+			# closed by the client meanwhile
+			pass
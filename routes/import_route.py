@@ -0,0 +1,72 @@
+import collections
+import os
+from typing import Annotated
+
+from fastapi import Path, Query, Request, status
+from fastapi.responses import JSONResponse
+from starlette.requests import ClientDisconnect
+
+from config.importer import ExistingPolicy, ImportFormat, ImportKind, ImportProgress, import_records
+from util.errors import RequestException
+
+from .base_route import NDJSON_MEDIA_TYPE, AbstractRoute, APIRoute
+
+
+class ImportRoute(AbstractRoute):
+	"""Streaming imports of students, courses and grades; see `config.importer`."""
+
+	# imports whose progress is kept for GET /api/import, the running ones included
+	max_imports = 20
+
+	def init(self) -> None:
+		self.base_path = "/api/import"
+		self.routes = (
+			APIRoute(
+				f"{self.base_path}/{'{kind}'}",
+				self.import_post,
+				methods=("POST",),
+				name="Import",
+				description=(
+					"Imports students, courses or grades from an NDJSON or CSV (Content-Type: text/csv) body, read and applied in chunks and persisted once at the end. "
+					"Failed rows are reported and skipped; pass the returned rows as skip to resume an interrupted import"
+				),
+			),
+			APIRoute(self.base_path, self.imports_get, methods=("GET",), name="Imports", description="Returns the progress of the running and latest imports"),
+		)
+
+		self.imports: collections.deque[ImportProgress] = collections.deque(maxlen=self.max_imports)
+
+	async def import_post(
+		self,
+		request: Request,
+		kind: Annotated[ImportKind, Path(title="Kind")],
+		format: Annotated[ImportFormat | None, Query(title="Format", description="Taken from the Content-Type by default")] = None,
+		skip: Annotated[int, Query(title="Skip", description="Rows to skip, e.g. the rows an interrupted import reported", ge=0)] = 0,
+		existing: Annotated[ExistingPolicy, Query(title="Existing", description="Skips students and courses that already exist, or reports them as failed")] = "skip",
+		workers: Annotated[int, Query(title="Workers", description="Processes validating rows, 0 to validate them in the app's", ge=0, le=os.cpu_count() or 1)] = 0,
+		durable: Annotated[bool, Query(title="Durable", description="Waits until the import is written to disk")] = False,
+	) -> JSONResponse:
+		if format is None:
+			content_type = request.headers.get("content-type", "")
+			format = "csv" if "text/csv" in content_type else "ndjson" if NDJSON_MEDIA_TYPE in content_type else None
+			if format is None:
+				raise RequestException(f"Send {NDJSON_MEDIA_TYPE} or text/csv, or pass the format", status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+		progress = ImportProgress(kind, format)
+		self.imports.append(progress)
+
+		try:
+			await import_records(self.config, request.stream(), progress, skip=skip, existing=existing, workers=workers)
+		except ValueError as e:
+			raise RequestException(str(e), status.HTTP_400_BAD_REQUEST)
+		except ClientDisconnect:
+			# nobody is left to answer, what was applied is persisted below and the progress tells where to resume
+			pass
+		finally:
+			if progress.applied:
+				await self.config.commit(durable)
+
+		return JSONResponse(progress.as_dict(), status.HTTP_200_OK)
+
+	async def imports_get(self, request: Request) -> JSONResponse:
+		return JSONResponse({"imports": [progress.as_dict() for progress in reversed(self.imports)]}, status.HTTP_200_OK)
@@ -0,0 +1,15 @@
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+
+from .base_route import AbstractRoute, Route
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsRoute(AbstractRoute):
+	def init(self) -> None:
+		self.routes = (Route("/metrics", self.metrics, methods=("GET",), include_in_schema=False),)
+
+	async def metrics(self, request: Request) -> PlainTextResponse:
+		"""Request latencies, config operation timings and cache, persistence and school stats in the Prometheus text format."""
+		return PlainTextResponse(self.config.metrics.render(), headers={"Content-Type": PROMETHEUS_MEDIA_TYPE})
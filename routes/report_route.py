@@ -1,45 +1,117 @@
+import itertools
+from collections.abc import AsyncIterator, Callable, Hashable, Iterable, Iterator
+
+import jinja2
 from fastapi import Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import StreamingResponse
+from markupsafe import Markup, escape
 
+from models.course import Course
 from models.student import Student
 from util.errors import NotFoundException
 
-from .base_route import AbstractRoute, Route
+from .base_route import HEAVY, AbstractRoute, Route
+
+STUDENT_FIELDS = ["student_id", "name", "age", "courses", "total_average_grade"]
+COURSE_FIELDS = ["student_id", "name", "grades", "average"]
 
 
 class ReportRoute(AbstractRoute):
+	"""
+	HTML reports, streamed as they render so the first rows go out before the last ones are built. Rows are rendered
+	once and cached in `config.fragment_cache` until the entities they show change, a batch at a time on the thread
+	pool of `config.admission`.
+	"""
+
+	# rows rendered per batch, and bytes sent per chunk
+	rows_per_yield = 500
+	chunk_bytes = 64 * 1024
+
 	def init(self) -> None:
 		self.base_path = "/report"
 		self.routes = (
-			Route(f"{self.base_path}/students", self.students, methods=("GET",)),
-			Route(f"{self.base_path}/student/{'{student_id}'}/grades", self.student_grades, methods=("GET",)),
-			Route(f"{self.base_path}/course/{'{course_id}'}/grades", self.course_grades, methods=("GET",)),
-		)
-
-	async def students(self, request: Request) -> HTMLResponse:
-		school = self.config.school
-
-		students = []
-		for student in school.students.values():
-			data = student.model_dump()
-			data["student_id"] = f"<a href='{self.base_path}/student/{student.student_id}/grades'>{data['student_id']}</a>"
-			data["courses"] = ", ".join(
-				[f"<a href='{self.base_path}/course/{course.course_code}/grades'>{course.course_name}</a>" for course in school.get_student_courses(student_id=student.student_id)]
-			)
-			data["total_average_grade"] = student.calculate_total_average_grade()
-			students.append(data)
-
-		return self.templates.TemplateResponse(
-			"report.html",
-			{
-				"request": request,
-				"fields": [name for name, field in Student.model_fields.items() if all(i not in field.annotation.mro() for i in (list, dict))]  # pyright: ignore [reportOptionalMemberAccess]
-				+ ["courses", "total_average_grade"],
-				"rows": students,
-			},
+			Route(f"{self.base_path}/students", self.students, methods=("GET",), admission=HEAVY),
+			Route(f"{self.base_path}/student/{'{student_id}'}/grades", self.student_grades, methods=("GET",), admission=HEAVY),
+			Route(f"{self.base_path}/course/{'{course_id}'}/grades", self.course_grades, methods=("GET",), admission=HEAVY),
 		)
 
-	async def student_grades(self, request: Request) -> HTMLResponse:
+		# generate_async needs an async environment
+		self.environment = jinja2.Environment(loader=self.templates.env.loader, autoescape=True, enable_async=True)
+		self.render_seconds = self.config.metrics.histogram("report_render_seconds", "Duration of report renders, from the first row to the last byte", ("report",))
+
+	def student_link(self, student_id: int) -> Markup:
+		return Markup(f"<a href='{self.base_path}/student/{student_id}/grades'>{student_id}</a>")
+
+	def course_link(self, course: Course) -> Markup:
+		return Markup(f"<a href='{self.base_path}/course/{course.course_code}/grades'>{escape(course.course_name)}</a>")
+
+	@staticmethod
+	def render_row(fields: list[str], row: dict) -> Markup:
+		# a template per row costs a Jinja context each, this is the same <tr> several times faster
+		return Markup(f"<tr>{''.join([f'<td>{escape(row[field])}</td>' for field in fields])}</tr>")
+
+	def cached_row(self, key: Hashable, version: Hashable, render: Callable[[], Markup]) -> Markup:
+		cache = self.config.fragment_cache
+		html = cache.get(key, version)
+		if html is not None:
+			return Markup(html.decode())
+
+		row = render()
+		cache.put(key, version, row.encode())
+		return row
+
+	def stream(self, report: str, fields: list[str], rows: Iterable[Markup]) -> StreamingResponse:
+		"""
+		Renders report.html around `rows`, which are produced lazily (from a snapshot, they are produced on a worker
+		thread), and sends it in chunks of about `chunk_bytes`.
+		"""
+		rows_per_yield, chunk_bytes = self.rows_per_yield, self.chunk_bytes
+		render_seconds = self.render_seconds.labels(report)
+		run = self.config.admission.run
+
+		async def paced() -> AsyncIterator[Markup]:
+			iterator = iter(rows)
+			# a large report would otherwise hold the event loop until it is done
+			while batch := await run(list, itertools.islice(iterator, rows_per_yield)):
+				for row in batch:
+					yield row
+
+		async def generate() -> AsyncIterator[str]:
+			with render_seconds.time():
+				template = self.environment.get_template("report.html")
+				buffer, size = [], 0
+				async for part in template.generate_async(fields=fields, rows=paced()):
+					buffer.append(part)
+					size += len(part)
+					if size >= chunk_bytes:
+						yield "".join(buffer)
+						buffer, size = [], 0
+				if buffer:
+					yield "".join(buffer)
+
+		return StreamingResponse(generate(), media_type="text/html")
+
+	async def students(self, request: Request) -> StreamingResponse:
+		# the rows render across many awaits, so from a snapshot, as the NDJSON lists
+		school = self.config.school.snapshot()
+
+		def rows() -> Iterator[Markup]:
+			epoch = school.epoch
+			for student in school.students.values():
+				courses = school.get_student_courses(student_id=student.student_id)
+				codes = tuple(course.course_code for course in courses)
+				version = (epoch, school.entity_version("student", student.student_id), codes, school.entity_versions("course", codes))
+				yield self.cached_row(("students", student.student_id), version, lambda student=student, courses=courses: self.student_row(student, courses))
+
+		return self.stream("students", STUDENT_FIELDS, rows())
+
+	def student_row(self, student: Student, courses: list[Course]) -> Markup:
+		data = {"student_id": self.student_link(student.student_id), "name": student.name, "age": student.age}
+		data["courses"] = Markup(", ").join([self.course_link(course) for course in courses])
+		data["total_average_grade"] = student.calculate_total_average_grade()
+		return self.render_row(STUDENT_FIELDS, data)
+
+	async def student_grades(self, request: Request) -> StreamingResponse:
 		school = self.config.school
 
 		student = self.get_student(int(request.path_params.get("student_id")))
@@ -54,27 +126,35 @@ class ReportRoute(AbstractRoute):
 		grades["total"] = student.calculate_total_grade()
 		grades_average["total"] = student.calculate_total_average_grade()
 
-		return self.templates.TemplateResponse("report.html", {"request": request, "fields": list(grades.keys()), "rows": [grades, grades_average]})
-
-	async def course_grades(self, request: Request) -> HTMLResponse:
-		course = self.get_course(int(request.path_params.get("course_id")))
-
-		grades = []
-
-		for student_id in course.enrolled_students:
-			try:
-				student = self.get_student(student_id)
-			except NotFoundException:
-				continue
-
-			data = {}
-
-			course_grades = student.grades.get(course.course_code, [])
-			data["student_id"] = f"<a href='{self.base_path}/student/{student.student_id}/grades'>{student.student_id}</a>"
-			data["name"] = student.name
-			data["grades"] = ", ".join([str(grade) for grade in course_grades])
-			data["average"] = student.calculate_course_average_grades(course.course_code)
-
-			grades.append(data)
-
-		return self.templates.TemplateResponse("report.html", {"request": request, "fields": ["student_id", "name", "grades", "average"], "rows": grades})
+		fields = list(grades.keys())
+		return self.stream("student grades", fields, [self.render_row(fields, grades), self.render_row(fields, grades_average)])
+
+	async def course_grades(self, request: Request) -> StreamingResponse:
+		school = self.config.school.snapshot()
+
+		course_code = int(request.path_params.get("course_id"))
+		course = school.courses.get(course_code)
+		if course is None:
+			raise NotFoundException(f"Course {course_code} not found")
+
+		def rows() -> Iterator[Markup]:
+			epoch = school.epoch
+			for student_id in course.enrolled_students:
+				student = school.students.get(student_id)
+				if student is None:
+					continue
+
+				version = (epoch, school.entity_version("student", student_id))
+				yield self.cached_row(("course", course_code, student_id), version, lambda student=student: self.course_row(course_code, student))
+
+		return self.stream("course grades", COURSE_FIELDS, rows())
+
+	def course_row(self, course_code: int, student: Student) -> Markup:
+		course_grades = student.grades.get(course_code, [])
+		data = {
+			"student_id": self.student_link(student.student_id),
+			"name": student.name,
+			"grades": ", ".join([str(grade) for grade in course_grades]),
+			"average": student.calculate_course_average_grades(course_code),
+		}
+		return self.render_row(COURSE_FIELDS, data)
@@ -1,26 +1,67 @@
 from typing import Annotated
 
-import rapidfuzz
-from fastapi import Body, Path, Request, status
-from fastapi.responses import JSONResponse
+import pydantic
+from fastapi import Body, Path, Query, Request, status
+from fastapi.responses import JSONResponse, Response
 
+from models.grades import Grade
 from models.student import Student
 from util.errors import AlreadyExistsException, NotFoundException
 
-from .base_route import AbstractRoute, APIRoute
+from .base_route import HEAVY, AbstractRoute, APIRoute
+
+
+class StudentItem(pydantic.BaseModel):
+	student_id: int
+	student_name: str
+	student_age: int
+
+
+class GradesItem(pydantic.BaseModel):
+	student_id: int
+	course_code: int
+	grades: list[Grade]
 
 
 class StudentRoute(AbstractRoute):
 	def init(self) -> None:
 		self.base_path = "/api/student"
 		self.routes = (
-			APIRoute(f"{self.base_path}/", self.students_list, methods=("GET",), name="Students list", description="Returns a list of all students"),
+			APIRoute(
+				f"{self.base_path}/bulk",
+				self.students_bulk_put,
+				methods=("POST",),
+				name="Students bulk put",
+				description="Creates many students from a JSON array or NDJSON body of {student_id, student_name, student_age} items, all or nothing, persisted once",
+			),
+			APIRoute(
+				f"{self.base_path}/bulk/grades",
+				self.students_bulk_grades_patch,
+				methods=("POST",),
+				name="Students bulk grades update",
+				description="Overwrites grades for many {student_id, course_code, grades} items from a JSON array or NDJSON body, all or nothing, persisted once",
+			),
+			APIRoute(
+				f"{self.base_path}/",
+				self.students_list,
+				methods=("GET",),
+				name="Students list",
+				description="Returns students ordered by ID, optionally filtered by age, graduate, course and average grade ranges, paginated with limit and after_id, or streamed as NDJSON with Accept: application/x-ndjson",
+			),
 			APIRoute(
 				f"{self.base_path}/search",
 				self.students_search,
 				methods=("GET",),
 				name="Students search",
-				description="Returns a list of students by name using normalized partial token set ratio Levenshtein distance",
+				description="Returns the best matching students by name using normalized partial token set ratio Levenshtein distance, each with its score",
+				admission=HEAVY,
+			),
+			APIRoute(
+				f"{self.base_path}/top",
+				self.students_top,
+				methods=("GET",),
+				name="Students top",
+				description="Returns k students by descending total average grade (ties by ID) from rank offset on, each with its average and rank",
 			),
 			APIRoute(f"{self.base_path}/{'{student_id}'}", self.students_get, methods=("GET",), name="Student get", description="Returns a student by ID"),
 			APIRoute(f"{self.base_path}/{'{student_id}'}", self.students_put, methods=("PUT",), name="Student put", description="Creates a new student"),
@@ -28,28 +69,76 @@ class StudentRoute(AbstractRoute):
 			APIRoute(f"{self.base_path}/{'{student_id}/grades'}", self.students_grades_patch, methods=("PATCH",), name="Student update", description="Updates a student by ID"),
 		)
 
-	async def students_list(self, request: Request) -> JSONResponse:
+		self.search_seconds = self.config.metrics.histogram("student_search_seconds", "Duration of student name searches").labels()
+
+	async def students_list(
+		self,
+		request: Request,
+		limit: Annotated[int | None, Query(title="Limit", ge=1)] = None,
+		after_id: Annotated[int | None, Query(title="After ID", description="Returns students after this ID")] = None,
+		min_age: Annotated[int | None, Query(title="Minimum age")] = None,
+		max_age: Annotated[int | None, Query(title="Maximum age")] = None,
+		graduate: Annotated[bool | None, Query(title="Graduate", description="Only graduate (true) or undergraduate (false) students")] = None,
+		course_code: Annotated[int | None, Query(title="Course code", description="Only students enrolled to this course")] = None,
+		min_average: Annotated[float | None, Query(title="Minimum average grade")] = None,
+		max_average: Annotated[float | None, Query(title="Maximum average grade")] = None,
+	) -> Response:
+		school = self.config.school
+		filters = {"min_age": min_age, "max_age": max_age, "graduate": graduate, "course_code": course_code, "min_average": min_average, "max_average": max_average}
+		filtered = any(value is not None for value in filters.values())
+
+		if self.accepts_ndjson(request):
+			# the stream spans many awaits, it is served from a snapshot so writes in between don't show up half way
+			snapshot = school.snapshot()
+			ids = snapshot.filter_students(**filters) if filtered else None
+			return self.ndjson_response(lambda cursor, size: snapshot.page_students(after_id=cursor, limit=size, ids=ids), lambda student: student.student_id, after_id=after_id, limit=limit)
+
+		def content() -> dict:
+			ids = school.filter_students(**filters) if filtered else None
+			page = school.page_students(after_id=after_id, limit=limit, ids=ids)
+			next_after_id = page[-1].student_id if limit is not None and len(page) == limit else None
+			return {"students": [student.model_dump() for student in page], "next_after_id": next_after_id}
+
+		version = school.collection_version("student")
+		if course_code is not None:
+			# enrollments are stored on the courses
+			version = max(version, school.collection_version("course"))
+		return self.cached_json_response(request, ("students", after_id, limit, *filters.values()), version, content)
+
+	async def students_search(
+		self,
+		request: Request,
+		name: str,
+		limit: Annotated[int, Query(title="Limit", ge=1, le=1000)] = 5,
+		score_cutoff: Annotated[float, Query(title="Score cutoff", ge=0, le=100)] = 30,
+	) -> JSONResponse:
 		school = self.config.school
 
-		students = [student.model_dump() for student in school.students.values()]
+		with self.search_seconds.time():
+			# on the event loop: most queries are answered from the index's token map in microseconds (p50 10 us at
+			# 100k students), far less than a round trip through the thread pool and its GIL contention with the loop
+			matches = school.search_student_ids(name, limit, score_cutoff)
+		students = [{**school.students[student_id].model_dump(), "score": score} for student_id, score in matches if student_id in school.students]
 
 		return JSONResponse({"students": students}, status.HTTP_200_OK)
 
-	async def students_search(self, request: Request, name: str) -> JSONResponse:
+	async def students_top(
+		self,
+		request: Request,
+		k: Annotated[int, Query(title="K", ge=1, le=1000)] = 10,
+		offset: Annotated[int, Query(title="Offset", ge=0)] = 0,
+	) -> Response:
 		school = self.config.school
 
-		student_names = [
-			fuzz[0] for fuzz in rapidfuzz.process.extract(name, choices=[student.name for student in school.students.values()], scorer=rapidfuzz.fuzz.partial_token_set_ratio, score_cutoff=30)
-		]
-
-		students = [student.model_dump() for student in school.students.values() if student.name in student_names]
+		def content() -> dict:
+			return self.ranking(school.top_students(k, offset=offset), k, offset)
 
-		return JSONResponse({"students": students}, status.HTTP_200_OK)
+		return self.cached_json_response(request, ("students top", k, offset), school.collection_version("student"), content)
 
-	async def students_get(self, request: Request, student_id: Annotated[int, Path(title="Student ID")]) -> JSONResponse:
+	async def students_get(self, request: Request, student_id: Annotated[int, Path(title="Student ID")]) -> Response:
 		student = self.get_student(student_id)
 
-		return JSONResponse(student.model_dump(), status.HTTP_200_OK)
+		return self.cached_json_response(request, ("student", student_id), self.config.school.entity_version("student", student_id), student.model_dump)
 
 	async def students_put(
 		self,
@@ -57,6 +146,7 @@ class StudentRoute(AbstractRoute):
 		student_id: Annotated[int, Path(title="Student ID")],
 		student_name: Annotated[str, Body(title="Student Name", embed=True)],
 		student_age: Annotated[int, Body(title="Student Age", embed=True)],
+		durable: Annotated[bool, Query(title="Durable", description="Waits until the change is written to disk")] = False,
 	) -> JSONResponse:
 		school = self.config.school
 
@@ -66,7 +156,7 @@ class StudentRoute(AbstractRoute):
 		student = Student(student_id=student_id, name=student_name, age=student_age, grades={})
 		school.add_student(student)
 
-		self.config.save()
+		await self.config.commit(durable)
 
 		return JSONResponse(student.model_dump(), status.HTTP_200_OK)
 
@@ -76,16 +166,13 @@ class StudentRoute(AbstractRoute):
 		student_id: Annotated[int, Path(title="Student ID")],
 		student_name: Annotated[str | None, Body(title="Student Name", embed=True)],
 		student_age: Annotated[int | None, Body(title="Student Age", embed=True)],
+		durable: Annotated[bool, Query(title="Durable", description="Waits until the change is written to disk")] = False,
 	) -> JSONResponse:
 		student = self.get_student(student_id)
 
-		if student_name is not None:
-			student.name = student_name
-
-		if student_age is not None:
-			student.age = student_age
+		student = self.config.school.update_student(student.student_id, name=student_name, age=student_age)
 
-		self.config.save()
+		await self.config.commit(durable)
 
 		return JSONResponse(student.model_dump(), status.HTTP_200_OK)
 
@@ -94,7 +181,8 @@ class StudentRoute(AbstractRoute):
 		request: Request,
 		student_id: Annotated[int, Path(title="Student ID")],
 		course_code: Annotated[int, Body(title="Course Code", embed=True)],
-		grades: Annotated[list[int], Body(title="Grades", description="Overwrites all grades for course", embed=True)],
+		grades: Annotated[list[Grade], Body(title="Grades", description="Overwrites all grades for course", embed=True)],
+		durable: Annotated[bool, Query(title="Durable", description="Waits until the change is written to disk")] = False,
 	) -> JSONResponse:
 		student = self.get_student(student_id)
 		course = self.get_course(course_code)
@@ -102,11 +190,61 @@ class StudentRoute(AbstractRoute):
 		if student.student_id not in course.enrolled_students:
 			raise NotFoundException(f"Student is not enrolled in course {course.course_code}")
 
-		if course_code not in student.grades:
-			student.grades[course.course_code] = []
+		student = self.config.school.set_student_grades(student.student_id, course.course_code, grades)
 
-		student.grades[course.course_code] = grades
-
-		self.config.save()
+		await self.config.commit(durable)
 
 		return JSONResponse(student.model_dump(), status.HTTP_200_OK)
+
+	async def students_bulk_put(
+		self,
+		request: Request,
+		durable: Annotated[bool, Query(title="Durable", description="Waits until the change is written to disk")] = False,
+	) -> JSONResponse:
+		school = self.config.school
+
+		items, errors = await self.read_bulk_items(request, StudentItem)
+
+		seen = set()
+		for index, item in items:
+			if item.student_id in school.students or item.student_id in seen:
+				errors.append({"index": index, "error": f"Student {item.student_id} already exists"})
+			seen.add(item.student_id)
+
+		if errors:
+			return self.bulk_response(0, errors)
+
+		for _, item in items:
+			school.add_student(Student(student_id=item.student_id, name=item.student_name, age=item.student_age, grades={}))
+
+		await self.config.commit(durable)
+
+		return self.bulk_response(len(items), errors)
+
+	async def students_bulk_grades_patch(
+		self,
+		request: Request,
+		durable: Annotated[bool, Query(title="Durable", description="Waits until the change is written to disk")] = False,
+	) -> JSONResponse:
+		school = self.config.school
+
+		items, errors = await self.read_bulk_items(request, GradesItem)
+
+		for index, item in items:
+			course = school.courses.get(item.course_code)
+			if item.student_id not in school.students:
+				errors.append({"index": index, "error": f"Student {item.student_id} not found"})
+			elif course is None:
+				errors.append({"index": index, "error": f"Course {item.course_code} not found"})
+			elif item.student_id not in course.enrolled_students:
+				errors.append({"index": index, "error": f"Student is not enrolled in course {item.course_code}"})
+
+		if errors:
+			return self.bulk_response(0, errors)
+
+		for _, item in items:
+			school.set_student_grades(item.student_id, item.course_code, item.grades)
+
+		await self.config.commit(durable)
+
+		return self.bulk_response(len(items), errors)
@@ -0,0 +1,178 @@
+import asyncio
+import collections
+import math
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, TypeVar
+
+from fastapi import status
+
+from .errors import OverloadedException
+
+__all__ = (
+	"Admission",
+	"AdmissionLimit",
+	"AdmissionStats",
+	"Permit",
+)
+
+Result = TypeVar("Result")
+
+
+@dataclass()
+class AdmissionStats:
+	admitted: int = 0
+	queued: int = 0
+	rejected: int = 0
+	timed_out: int = 0
+
+	def as_dict(self) -> dict:
+		return asdict(self)
+
+
+class Permit:
+	"""A slot of an `AdmissionLimit`, held until released; releasing twice is a no-op."""
+
+	__slots__ = ("_limit", "_start")
+
+	def __init__(self, limit: "AdmissionLimit"):
+		self._limit: AdmissionLimit | None = limit
+		self._start = time.perf_counter()
+
+	def release(self):
+		limit, self._limit = self._limit, None
+		if limit is not None:
+			limit._release(time.perf_counter() - self._start)
+
+
+class AdmissionLimit:
+	"""
+	At most `concurrency` requests at once, the next `queue` waiting for a slot (in order) for up to `timeout` seconds.
+	Requests beyond the queue, or waiting longer, are rejected with `status_code` and a Retry-After of the time the
+	queue ahead of them should take to drain.
+	"""
+
+	def __init__(self, name: str, concurrency: int, queue: int, timeout: float, status_code: int = status.HTTP_503_SERVICE_UNAVAILABLE):
+		self.name = name
+		self.active = 0
+		self.stats = AdmissionStats()
+		self._waiters: collections.deque[asyncio.Future] = collections.deque()
+		# moving average of how long a slot is held, for Retry-After
+		self._average = 0.0
+		self.configure(concurrency, queue, timeout, status_code)
+
+	@property
+	def waiting(self) -> int:
+		return len(self._waiters)
+
+	def configure(self, concurrency: int, queue: int, timeout: float, status_code: int = status.HTTP_503_SERVICE_UNAVAILABLE):
+		self.concurrency = concurrency
+		self.queue = queue
+		self.timeout = timeout
+		self.status_code = status_code
+		# a raised limit admits the waiters right away, a lowered one as slots are released
+		while self._waiters and self.active < self.concurrency:
+			self.active += 1
+			self._hand_over()
+
+	def retry_after(self) -> int:
+		return max(1, math.ceil(self._average * (len(self._waiters) + 1) / max(self.concurrency, 1)))
+
+	def _reject(self, reason: str) -> OverloadedException:
+		return OverloadedException(f"Too many {self.name} requests, {reason}", self.retry_after(), self.status_code)
+
+	async def acquire(self) -> Permit:
+		if self.active < self.concurrency and not self._waiters:
+			self.active += 1
+			self.stats.admitted += 1
+			return Permit(self)
+
+		if len(self._waiters) >= self.queue:
+			self.stats.rejected += 1
+			raise self._reject("retry later")
+
+		waiter = asyncio.get_running_loop().create_future()
+		self._waiters.append(waiter)
+		self.stats.queued += 1
+		try:
+			async with asyncio.timeout(self.timeout):
+				await waiter
+		except (TimeoutError, asyncio.CancelledError) as e:
+			if waiter.done() and not waiter.cancelled():
+				# handed a slot just as it gave up, pass it on
+				self._release(None)
+			else:
+				waiter.cancel()
+				self._waiters.remove(waiter)
+			if isinstance(e, asyncio.CancelledError):
+				raise
+			self.stats.timed_out += 1
+			raise self._reject(f"timed out after waiting {self.timeout:g} s") from None
+
+		self.stats.admitted += 1
+		return Permit(self)
+
+	def _release(self, held: float | None):
+		if held is not None:
+			self._average = held if not self._average else self._average * 0.9 + held * 0.1
+		if self.active > self.concurrency or not self._hand_over():
+			self.active -= 1
+
+	def _hand_over(self) -> bool:
+		"""Passes the slot being released to the first waiter, returns False if none is left."""
+		while self._waiters:
+			waiter = self._waiters.popleft()
+			if not waiter.done():
+				waiter.set_result(None)
+				return True
+		return False
+
+
+class Admission:
+	"""
+	Admission limits per class of routes (e.g. "heavy", "write"), and the bounded thread pool CPU-heavy handlers run on
+	to leave the event loop free for the rest. Routes of a class without a limit, or all while not `enabled`, are admitted
+	right away.
+	"""
+
+	def __init__(self):
+		self.enabled = False
+		self.limits: dict[str, AdmissionLimit] = {}
+		self.workers = 0
+		self._executor: ThreadPoolExecutor | None = None
+
+	def configure(self, enabled: bool, workers: int, limits: dict[str, dict[str, Any]]):
+		"""Applies the settings, keeping the limits of classes that stay (with their held slots and waiters)."""
+		self.enabled = enabled
+		for name in self.limits.keys() - limits.keys():
+			del self.limits[name]
+		for name, options in limits.items():
+			if name in self.limits:
+				self.limits[name].configure(**options)
+			else:
+				self.limits[name] = AdmissionLimit(name, **options)
+
+		if workers != self.workers:
+			if self._executor is not None:
+				self._executor.shutdown(wait=False)
+				self._executor = None
+			self.workers = workers
+
+	def limit(self, name: str) -> AdmissionLimit | None:
+		return self.limits.get(name) if self.enabled else None
+
+	async def run(self, function: Callable[..., Result], *args) -> Result:
+		"""Calls `function(*args)` on the thread pool, or right here with 0 `workers` after letting other tasks run."""
+		if self.workers <= 0:
+			await asyncio.sleep(0)
+			return function(*args)
+		if self._executor is None:
+			self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="heavy")
+		return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+	def shutdown(self):
+		if self._executor is not None:
+			self._executor.shutdown(wait=False)
+			self._executor = None
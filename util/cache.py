@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import asdict, dataclass
+
+__all__ = (
+	"CacheStats",
+	"ResponseCache",
+)
+
+
+@dataclass()
+class CacheStats:
+	hits: int = 0
+	misses: int = 0
+	evictions: int = 0
+	entries: int = 0
+	bytes: int = 0
+
+	def as_dict(self) -> dict:
+		return asdict(self)
+
+
+class ResponseCache:
+	"""
+	LRU cache of encoded response bodies, bounded by entry count and total size.
+
+	Every entry remembers the version it was encoded at and only a lookup with the same version hits, so a mutation
+	invalidates an entry just by bumping the version and the stale body is replaced on the next put.
+
+	Thread-safe, report rows are cached from worker threads.
+	"""
+
+	def __init__(self, max_entries: int = 10_000, max_bytes: int = 64 * 1024 * 1024):
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self.stats = CacheStats()
+		self._entries: OrderedDict[Hashable, tuple[Hashable, bytes]] = OrderedDict()
+		self._lock = threading.Lock()
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	def get(self, key: Hashable, version: Hashable) -> bytes | None:
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None or entry[0] != version:
+				self.stats.misses += 1
+				return None
+
+			self._entries.move_to_end(key)
+			self.stats.hits += 1
+			return entry[1]
+
+	def put(self, key: Hashable, version: Hashable, data: bytes):
+		if len(data) > self.max_bytes:
+			return
+
+		with self._lock:
+			if (old := self._entries.pop(key, None)) is not None:
+				self.stats.bytes -= len(old[1])
+
+			self._entries[key] = (version, data)
+			self.stats.bytes += len(data)
+
+			while len(self._entries) > self.max_entries or self.stats.bytes > self.max_bytes:
+				_, (_, evicted) = self._entries.popitem(last=False)
+				self.stats.bytes -= len(evicted)
+				self.stats.evictions += 1
+
+			self.stats.entries = len(self._entries)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self.stats.entries = 0
+			self.stats.bytes = 0
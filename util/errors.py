@@ -5,6 +5,7 @@ __all__ = (
 	"RequestException",
 	"NotFoundException",
 	"AlreadyExistsException",
+	"OverloadedException",
 )
 
 
@@ -21,3 +22,8 @@ class NotFoundException(RequestException):
 class AlreadyExistsException(RequestException):
 	def __init__(self, message: str):
 		super().__init__(message, status_codes.HTTP_400_BAD_REQUEST)
+
+
+class OverloadedException(RequestException):
+	def __init__(self, message: str, retry_after: int, status_code: int = status_codes.HTTP_503_SERVICE_UNAVAILABLE):
+		super().__init__(message, status_code, {"Retry-After": str(retry_after)})
@@ -0,0 +1,162 @@
+import bisect
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from typing import Generic, TypeAlias, TypeVar
+
+__all__ = (
+	"Counter",
+	"Gauge",
+	"Histogram",
+	"Metrics",
+)
+
+# seconds, from a cached response to a full report of a large school
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (name, type, help, [(labels, value)]) of metrics kept elsewhere, read when rendered
+Collected: TypeAlias = tuple[str, str, str, list[tuple[dict[str, str], float]]]
+
+Child = TypeVar("Child", "Counter", "Gauge", "Histogram")
+
+
+class Counter:
+	__slots__ = ("value",)
+
+	def __init__(self):
+		self.value = 0.0
+
+	def inc(self, amount: float = 1.0):
+		self.value += amount
+
+
+class Gauge(Counter):
+	__slots__ = ()
+
+	def dec(self, amount: float = 1.0):
+		self.value -= amount
+
+
+class Histogram:
+	"""Observation counts per bucket (not cumulative until rendered), their sum and count."""
+
+	__slots__ = ("buckets", "count", "counts", "sum")
+
+	def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+		self.buckets = buckets
+		# the last one is +Inf
+		self.counts = [0] * (len(buckets) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value: float):
+		self.counts[bisect.bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+	@contextmanager
+	def time(self) -> Iterator[None]:
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(time.perf_counter() - start)
+
+
+class Family(Generic[Child]):
+	"""A metric with one child per combination of label values."""
+
+	def __init__(self, name: str, type: str, help: str, labels: tuple[str, ...], factory: Callable[[], Child]):
+		self.name = name
+		self.type = type
+		self.help = help
+		self.label_names = labels
+		self.children: dict[tuple[str, ...], Child] = {}
+		self._factory = factory
+
+	def labels(self, *values: str) -> Child:
+		"""The child of these label values, created on first use. Look it up once and keep it on hot paths."""
+		child = self.children.get(values)
+		if child is None:
+			if len(values) != len(self.label_names):
+				raise ValueError(f"{self.name} takes labels {self.label_names}, got {values}")
+			child = self.children[values] = self._factory()
+		return child
+
+
+def _escape(value: str) -> str:
+	return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str]) -> str:
+	pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+	return f"{{{pairs}}}" if pairs else ""
+
+
+def _number(value: float) -> str:
+	return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+	"""
+	Counters, gauges and histograms kept in process and rendered in the Prometheus text format. Recording is a few
+	attribute updates, cheap enough to leave on for every request.
+
+	`enabled` only switches the per-request instrumentation of the routes; timers of rarer operations always record.
+	"""
+
+	def __init__(self, enabled: bool = True):
+		self.enabled = enabled
+		self._families: dict[str, Family] = {}
+		self._collectors: list[Callable[[], Iterable[Collected]]] = []
+
+	def _family(self, name: str, type: str, help: str, labels: tuple[str, ...], factory: Callable) -> Family:
+		family = self._families.get(name)
+		if family is None:
+			family = self._families[name] = Family(name, type, help, labels, factory)
+		elif family.type != type or family.label_names != labels:
+			raise ValueError(f"Metric {name} is already registered as a {family.type} with labels {family.label_names}")
+		return family
+
+	def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Family[Counter]:
+		"""Returns the counter family `name`, registering it on first use."""
+		return self._family(name, "counter", help, labels, Counter)
+
+	def gauge(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Family[Gauge]:
+		return self._family(name, "gauge", help, labels, Gauge)
+
+	def histogram(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Family[Histogram]:
+		return self._family(name, "histogram", help, labels, lambda: Histogram(buckets))
+
+	def collector(self, collect: Callable[[], Iterable[Collected]]):
+		"""Registers a callback reporting metrics kept elsewhere (e.g. cache stats) as (name, type, help, samples) when rendered."""
+		self._collectors.append(collect)
+
+	def render(self) -> str:
+		lines = []
+		for family in self._families.values():
+			lines.append(f"# HELP {family.name} {family.help}")
+			lines.append(f"# TYPE {family.name} {family.type}")
+			for values, child in family.children.items():
+				if family.type != "histogram":
+					lines.append(f"{family.name}{_labels(family.label_names, values)} {_number(child.value)}")
+					continue
+
+				cumulative = 0
+				for bound, count in zip((*child.buckets, "+Inf"), child.counts):
+					cumulative += count
+					le = bound if isinstance(bound, str) else _number(bound)
+					lines.append(f"{family.name}_bucket{_labels((*family.label_names, 'le'), (*values, le))} {cumulative}")
+				labels = _labels(family.label_names, values)
+				lines.append(f"{family.name}_sum{labels} {_number(child.sum)}")
+				lines.append(f"{family.name}_count{labels} {child.count}")
+
+		for collect in self._collectors:
+			for name, type, help, samples in collect():
+				lines.append(f"# HELP {name} {help}")
+				lines.append(f"# TYPE {name} {type}")
+				for labels, value in samples:
+					lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+
+		lines.append("")
+		return "\n".join(lines)
@@ -0,0 +1,176 @@
+import collections
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Literal, TypeAlias
+
+import orjson
+
+__all__ = (
+	"PROFILE_MODES",
+	"ActiveProfile",
+	"Profile",
+	"ProfileMode",
+	"ProfileStore",
+	"SamplingProfiler",
+)
+
+ProfileMode: TypeAlias = Literal["cprofile", "sample"]
+
+PROFILE_MODES: tuple[ProfileMode, ...] = ("cprofile", "sample")
+# the file of each mode: marshalled pstats, or collapsed stacks for flamegraph.pl, speedscope and the like
+EXTENSIONS: dict[ProfileMode, str] = {"cprofile": "pstats", "sample": "folded"}
+
+
+class SamplingProfiler:
+	"""
+	Samples the stack of one thread every `interval` seconds from a background thread and counts the collapsed stacks
+	("outer;...;inner count" lines). The profiled thread runs untouched, so this is cheap enough for slow requests
+	that cProfile would distort, at the cost of missing what's shorter than the interval.
+	"""
+
+	def __init__(self, thread_id: int | None = None, interval: float = 0.001):
+		self.thread_id = threading.get_ident() if thread_id is None else thread_id
+		self.interval = interval
+		self.samples: collections.Counter[str] = collections.Counter()
+		self._stop = threading.Event()
+		self._thread: threading.Thread | None = None
+		self._switch_interval = sys.getswitchinterval()
+
+	def enable(self):
+		# the profiled thread keeps the GIL for the switch interval (5 ms) before letting the sampler in
+		self._switch_interval = sys.getswitchinterval()
+		sys.setswitchinterval(min(self.interval, self._switch_interval))
+		self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+		self._thread.start()
+
+	def disable(self):
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+		sys.setswitchinterval(self._switch_interval)
+
+	def _run(self):
+		while not self._stop.wait(self.interval):
+			frame = sys._current_frames().get(self.thread_id)
+			stack = []
+			while frame is not None:
+				code = frame.f_code
+				stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+				frame = frame.f_back
+			if stack:
+				self.samples[";".join(reversed(stack))] += 1
+
+	def dump(self) -> bytes:
+		return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common()).encode()
+
+
+@dataclass()
+class Profile:
+	id: str
+	mode: ProfileMode
+	method: str
+	path: str
+	route: str
+	status: int
+	duration_ms: float
+	created: float
+	size: int
+
+	def as_dict(self) -> dict:
+		return asdict(self)
+
+
+@dataclass(slots=True)
+class ActiveProfile:
+	id: str
+	mode: ProfileMode
+	profiler: cProfile.Profile | SamplingProfiler
+	started: float
+
+
+class ProfileStore:
+	"""
+	Profiles of the requests that asked for one, while `enabled`, kept as files in `directory`: the profile and a JSON
+	file of its `Profile`. Only the newest `max_profiles` are kept. One request is profiled at a time: Python allows
+	a single cProfile per thread and the event loop runs every request on the same one, so whatever else the loop runs
+	meanwhile shows up in the profile too.
+	"""
+
+	def __init__(self, directory: str = "profiles", max_profiles: int = 20, enabled: bool = False):
+		self.enabled = enabled
+		self.directory = directory
+		self.max_profiles = max_profiles
+		self._active = False
+		self._sequence = 0
+
+	def start(self, mode: ProfileMode) -> ActiveProfile | None:
+		"""Starts profiling the calling thread, None if another request is being profiled."""
+		if self._active:
+			return None
+		self._active = True
+
+		self._sequence += 1
+		profiler = cProfile.Profile() if mode == "cprofile" else SamplingProfiler()
+		active = ActiveProfile(f"{int(time.time() * 1000)}-{self._sequence}", mode, profiler, time.perf_counter())
+		profiler.enable()
+		return active
+
+	def finish(self, active: ActiveProfile, method: str, path: str, route: str, status: int) -> Profile:
+		"""Stops profiling and stores the profile, dropping the oldest ones beyond `max_profiles`."""
+		active.profiler.disable()
+		duration = time.perf_counter() - active.started
+		self._active = False
+
+		if isinstance(active.profiler, cProfile.Profile):
+			# what dump_stats writes, pstats.Stats and snakeviz read it
+			active.profiler.create_stats()
+			data = marshal.dumps(active.profiler.stats)
+		else:
+			data = active.profiler.dump()
+
+		profile = Profile(active.id, active.mode, method, path, route, status, round(duration * 1000, 3), time.time(), len(data))
+		os.makedirs(self.directory, exist_ok=True)
+		with open(self._path(profile.id, EXTENSIONS[profile.mode]), "wb") as f:
+			f.write(data)
+		with open(self._path(profile.id, "json"), "wb") as f:
+			f.write(orjson.dumps(profile.as_dict()))
+
+		for old in self.list()[self.max_profiles :]:
+			self.remove(old)
+		return profile
+
+	def _path(self, profile_id: str, extension: str) -> str:
+		return os.path.join(self.directory, f"{profile_id}.{extension}")
+
+	def list(self) -> list[Profile]:
+		"""The stored profiles, newest first."""
+		if not os.path.isdir(self.directory):
+			return []
+
+		profiles = []
+		for name in os.listdir(self.directory):
+			if not name.endswith(".json"):
+				continue
+			try:
+				with open(os.path.join(self.directory, name), "rb") as f:
+					profiles.append(Profile(**orjson.loads(f.read())))
+			except (OSError, orjson.JSONDecodeError, TypeError):
+				continue
+		profiles.sort(key=lambda profile: profile.created, reverse=True)
+		return profiles
+
+	def get(self, profile_id: str) -> tuple[Profile, str] | None:
+		"""A stored profile and the path of its file, None if there is none by that id."""
+		return next(((profile, self._path(profile.id, EXTENSIONS[profile.mode])) for profile in self.list() if profile.id == profile_id), None)
+
+	def remove(self, profile: Profile):
+		for extension in (EXTENSIONS[profile.mode], "json"):
+			try:
+				os.remove(self._path(profile.id, extension))
+			except FileNotFoundError:
+				pass